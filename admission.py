@@ -0,0 +1,210 @@
+"""
+Admission control per route: saat worker overload, traffic prioritas rendah
+ditolak (503 + Retry-After) lebih dulu agar latency pembuatan pembayaran tetap
+stabil.
+
+Prioritas:
+  critical  pembuatan pembayaran dan notifikasi Espay
+  normal    default untuk route lain (fee quote, reference, stats, ...)
+  low       route debug / testing dan stream SSE baru (halaman bisa polling)
+Route health (/health, /ready) dan docs tidak pernah ditolak.
+
+Tekanan worker diukur dari dua sinyal:
+  - in-flight: request yang sudah masuk tapi belum mulai mengirim response
+    (stream SSE yang sudah berjalan tidak dihitung)
+  - queueing delay: lag event loop (EWMA), diukur task sampler yang tidur
+    ESPAY_ADMISSION_SAMPLE_MS dan mencatat keterlambatannya bangun
+
+Request prioritas p ditolak jika lag EWMA > ratio_lag[p] x SLO
+(ESPAY_ADMISSION_LAG_SLO_MS) atau in-flight >= ratio_inflight[p] x batas
+(ESPAY_ADMISSION_MAX_INFLIGHT); ratio low < normal < critical.
+
+ESPAY_APP_MODE=production menghapus route debug dari app saat startup
+(404, tidak muncul di /docs).
+"""
+import os
+import asyncio
+from enum import Enum
+from typing import Dict, Iterable, Optional
+
+APP_MODE = os.getenv("ESPAY_APP_MODE", "development").lower()
+LAG_SLO_MS = float(os.getenv("ESPAY_ADMISSION_LAG_SLO_MS", "50"))
+MAX_INFLIGHT = int(os.getenv("ESPAY_ADMISSION_MAX_INFLIGHT", "256"))
+SAMPLE_MS = float(os.getenv("ESPAY_ADMISSION_SAMPLE_MS", "50"))
+EWMA_ALPHA = 0.3
+RETRY_AFTER_SECONDS = 1
+
+ALWAYS_ADMITTED = frozenset({"/health", "/ready", "/admission/stats", "/docs", "/redoc", "/openapi.json"})
+
+
+class Priority(str, Enum):
+    CRITICAL = "critical"
+    NORMAL = "normal"
+    LOW = "low"
+
+
+# (rasio terhadap SLO lag, rasio terhadap batas in-flight) sebelum prioritas ditolak
+SHED_THRESHOLDS = {
+    Priority.LOW: (0.5, 0.5),
+    Priority.NORMAL: (1.0, 0.8),
+    Priority.CRITICAL: (4.0, 1.0),
+}
+
+_SHED_BODY = b'{"detail":"Server sedang sibuk, coba lagi"}'
+
+
+class AdmissionController:
+    def __init__(self, lag_slo_ms: float = LAG_SLO_MS, max_inflight: int = MAX_INFLIGHT,
+                 sample_ms: float = SAMPLE_MS):
+        self.lag_slo = lag_slo_ms / 1000
+        self.max_inflight = max_inflight
+        self.sample = sample_ms / 1000
+        self.inflight = 0
+        self.lag_ewma = 0.0
+        self.lag_max = 0.0
+        self._routes: Dict[str, Priority] = {}
+        self._prefixes: Dict[str, Priority] = {}
+        self.admitted = {p.value: 0 for p in Priority}
+        self.shed = {p.value: 0 for p in Priority}
+        self._task: Optional[asyncio.Task] = None
+
+    def classify(self, paths: Iterable[str], priority: Priority):
+        """Path diakhiri "*" dicocokkan sebagai prefix"""
+        for path in paths:
+            if path.endswith("*"):
+                self._prefixes[path[:-1]] = priority
+            else:
+                self._routes[path] = priority
+
+    def priority_of(self, path: str) -> Optional[Priority]:
+        """None = tidak pernah ditolak"""
+        if path in ALWAYS_ADMITTED:
+            return None
+        priority = self._routes.get(path)
+        if priority is not None:
+            return priority
+        for prefix, priority in self._prefixes.items():
+            if path.startswith(prefix):
+                return priority
+        return Priority.NORMAL
+
+    def admit(self, priority: Priority) -> bool:
+        lag_ratio, inflight_ratio = SHED_THRESHOLDS[priority]
+        if self.lag_ewma > lag_ratio * self.lag_slo or self.inflight >= inflight_ratio * self.max_inflight:
+            self.shed[priority.value] += 1
+            return False
+        self.admitted[priority.value] += 1
+        return True
+
+    async def _sample_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.sample)
+            lag = max(0.0, loop.time() - started - self.sample)
+            self.lag_ewma += EWMA_ALPHA * (lag - self.lag_ewma)
+            self.lag_max = max(self.lag_max, lag)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._sample_lag())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "loop_lag_ewma_ms": round(self.lag_ewma * 1000, 2),
+            "loop_lag_max_ms": round(self.lag_max * 1000, 2),
+            "lag_slo_ms": self.lag_slo * 1000,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI murni; dipasang paling luar supaya request yang ditolak hampir gratis"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        controller = self.controller
+        priority = controller.priority_of(scope["path"])
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+        if not controller.admit(priority):
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(RETRY_AFTER_SECONDS).encode()),
+                    (b"content-length", str(len(_SHED_BODY)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": _SHED_BODY})
+            return
+
+        controller.inflight += 1
+        pending = True
+
+        async def tracked_send(message):
+            nonlocal pending
+            if pending and message["type"] == "http.response.start":
+                # response mulai dikirim: tidak lagi dihitung antre/diproses
+                pending = False
+                controller.inflight -= 1
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tracked_send)
+        finally:
+            if pending:
+                controller.inflight -= 1
+
+
+def disable_routes(app, paths: Iterable[str]):
+    """Hapus route dari app (dan skema OpenAPI); dipanggil saat startup setelah semua route terdaftar"""
+    disabled = frozenset(paths)
+    app.router.routes = [route for route in app.router.routes if getattr(route, "path", None) not in disabled]
+    app.openapi_schema = None
+
+
+def install_admission(app, critical: Iterable[str] = (), low: Iterable[str] = (),
+                      debug: Iterable[str] = ()) -> AdmissionController:
+    """
+    Pasang admission control (panggil terakhir agar jadi middleware terluar).
+    Route `debug` berprioritas low, dan dihapus jika ESPAY_APP_MODE=production.
+    """
+    debug = list(debug)
+    controller = AdmissionController()
+    controller.classify(critical, Priority.CRITICAL)
+    controller.classify(low, Priority.LOW)
+    controller.classify(debug, Priority.LOW)
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+    app.on_event("startup")(controller.start)
+    app.on_event("shutdown")(controller.stop)
+
+    if APP_MODE == "production" and debug:
+        async def remove_debug_routes():
+            disable_routes(app, debug)
+            print(f"🔒 Mode production: {len(debug)} route debug dinonaktifkan")
+
+        app.on_event("startup")(remove_debug_routes)
+
+    @app.get("/admission/stats", tags=["Health"])
+    def admission_stats():
+        """In-flight, lag event loop dan jumlah request yang ditolak per prioritas"""
+        return {"status": "success", "data": controller.stats()}
+
+    return controller
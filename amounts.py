@@ -0,0 +1,228 @@
+"""
+Amount engine berbasis integer minor units (sen), pengganti float.
+
+Money adalah subclass int (compact, tanpa atribut tambahan) sehingga aman
+untuk amount IDR besar dan aritmetika persentase yang exact. Parse/format
+memakai operasi string biasa dengan cache LRU (harga checkout sangat
+berulang); jalur bulk memakai regex yang di-compile sekali saat import.
+
+Benchmark dibanding implementasi float lama:
+    python amounts.py bench
+"""
+import re
+import sys
+import time
+import random
+import argparse
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+# "10000", "10000.5", "10000.50" (maks 15 digit rupiah) -- dipakai jalur bulk.
+# [0-9], bukan \d: digit non-ASCII (mis. Arab-Indic) ditolak, sama seperti Money.parse
+_AMOUNT_RE = re.compile(r"([0-9]{1,15})(?:\.([0-9]{1,2}))?")
+# Format wire Espay: wajib 2 digit desimal, "10000.00"
+_STRICT_RE = re.compile(r"[0-9]{1,15}\.[0-9]{2}")
+
+# Harga di checkout sangat berulang, jadi hasil parse/format di-cache
+PARSE_CACHE_SIZE = 4096
+
+
+def _is_digits(s: str) -> bool:
+    return s.isdigit() and s.isascii()
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(value: str, strict: bool) -> "Money":
+    whole, dot, frac = value.partition(".")
+    if not (0 < len(whole) <= 15 and _is_digits(whole)):
+        raise ValueError(f"amount tidak valid: {value!r}")
+    if strict:
+        if len(frac) != 2 or not _is_digits(frac):
+            raise ValueError(f"amount harus dengan 2 digit desimal: {value!r}")
+    elif (dot and not frac) or len(frac) > 2 or (frac and not _is_digits(frac)):
+        raise ValueError(f"amount tidak valid: {value!r}")
+    return Money(whole + frac.ljust(2, "0"))
+
+
+class Money(int):
+    """Amount dalam minor units (1 = Rp 0,01)"""
+
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, value: str) -> "Money":
+        """Parse amount non-negatif dengan 0-2 digit desimal, raise ValueError jika tidak valid"""
+        if not isinstance(value, str):
+            raise ValueError(f"amount tidak valid: {value!r}")
+        return _parse(value.strip(), False)
+
+    @classmethod
+    def parse_strict(cls, value: str) -> "Money":
+        """Parse format wire Espay ('10000.00'), raise ValueError jika tidak tepat 2 desimal"""
+        if not isinstance(value, str):
+            raise ValueError(f"amount harus dengan 2 digit desimal: {value!r}")
+        return _parse(value, True)
+
+    @classmethod
+    def from_rupiah(cls, rupiah: int) -> "Money":
+        return cls(rupiah * 100)
+
+    @property
+    def rupiah(self) -> int:
+        return int(self) // 100
+
+    def __str__(self) -> str:
+        return _format(int(self))
+
+    def __repr__(self) -> str:
+        return f"Money('{self}')"
+
+    def __add__(self, other):
+        return Money(int(self) + int(other))
+
+    def __sub__(self, other):
+        return Money(int(self) - int(other))
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _format(minor: int) -> str:
+    sign = "-" if minor < 0 else ""
+    digits = str(abs(minor)).rjust(3, "0")
+    return f"{sign}{digits[:-2]}.{digits[-2:]}"
+
+
+class Rate:
+    """Persentase exact (mis. '2.5' = 2,5%) sebagai pecahan integer, pembulatan half-up"""
+
+    __slots__ = ("numerator", "denominator", "_twice_denominator", "text")
+
+    def __init__(self, percent: str):
+        try:
+            value = Decimal(str(percent)) / 100
+        except InvalidOperation:
+            raise ValueError(f"rate tidak valid: {percent!r}")
+        if value < 0:
+            raise ValueError(f"rate tidak boleh negatif: {percent!r}")
+        self.numerator, self.denominator = value.as_integer_ratio()
+        self._twice_denominator = 2 * self.denominator
+        self.text = str(percent)
+
+    def apply(self, amount: int) -> Money:
+        """amount * rate, dibulatkan half-up ke sen terdekat"""
+        scaled = 2 * int(amount) * self.numerator
+        if scaled >= 0:
+            return Money((scaled + self.denominator) // self._twice_denominator)
+        return Money(-((self.denominator - scaled) // self._twice_denominator))
+
+    def __repr__(self) -> str:
+        return f"Rate('{self.text}%')"
+
+
+def is_valid_amount(value: str) -> bool:
+    """Validasi format wire (2 digit desimal) dan amount > 0"""
+    try:
+        return Money.parse_strict(value) > 0
+    except ValueError:
+        return False
+
+
+def parse_many(values: Iterable[str], strict: bool = False) -> Tuple[List[Optional[Money]], List[int]]:
+    """
+    Jalur bulk untuk endpoint batch: regex di-map sekaligus ke seluruh list
+    (loop di C), konversi int hanya untuk yang valid. Mengembalikan
+    (amounts, index yang invalid); slot invalid bernilai None. Input yang
+    diterima sama dengan Money.parse / Money.parse_strict (non-strict
+    mengabaikan spasi di awal/akhir).
+    """
+    if strict:
+        values = [v if isinstance(v, str) else "" for v in values]
+        matches = list(map(_STRICT_RE.fullmatch, values))
+        amounts = [Money(v.replace(".", "", 1)) if m is not None else None for v, m in zip(values, matches)]
+    else:
+        values = [v.strip() if isinstance(v, str) else "" for v in values]
+        matches = list(map(_AMOUNT_RE.fullmatch, values))
+        amounts = [
+            Money(int(m[1]) * 100 + (int(m[2].ljust(2, "0")) if m[2] else 0)) if m is not None else None
+            for m in matches
+        ]
+    invalid = [i for i, amount in enumerate(amounts) if amount is None]
+    return amounts, invalid
+
+
+# ========================
+# Benchmark
+# ========================
+def _legacy_validate(amount: str) -> bool:
+    try:
+        float_amount = float(amount)
+        return float_amount > 0 and "." in amount and len(amount.split(".")[1]) == 2
+    except ValueError:
+        return False
+
+
+def _legacy_simple_payment(amount: str) -> Tuple[str, str]:
+    amount_float = float(amount)
+    return f"{amount_float:.2f}", f"{amount_float * 0.025:.2f}"
+
+
+def _timeit(fn, values) -> float:
+    started = time.perf_counter()
+    for v in values:
+        fn(v)
+    return time.perf_counter() - started
+
+
+def bench(count: int):
+    rng = random.Random(29)
+    unique = [f"{rng.randrange(1, 10**13)}.{rng.randrange(100):02d}" for _ in range(count)]
+    catalog = [f"{rng.randrange(1, 5000) * 1000}.00" for _ in range(500)]
+    prices = [rng.choice(catalog) for _ in range(count)]
+    fee_rate = Rate("2.5")
+
+    def new_simple_payment(amount: str):
+        money = Money.parse(amount)
+        return str(money), str(fee_rate.apply(money))
+
+    for label, values in (("unique amounts", unique), ("catalog prices", prices)):
+        _parse.cache_clear()
+        _format.cache_clear()
+        rows = [
+            ("validate (float)", _timeit(_legacy_validate, values)),
+            ("validate (Money)", _timeit(is_valid_amount, values)),
+            ("parse+fee+format (float)", _timeit(_legacy_simple_payment, values)),
+            ("parse+fee+format (Money)", _timeit(new_simple_payment, values)),
+        ]
+        started = time.perf_counter()
+        parse_many(values, strict=True)
+        rows.append(("parse_many strict (bulk)", time.perf_counter() - started))
+
+        print(f"[{label}]")
+        for name, elapsed in rows:
+            print(f"  {name:<28}: {count / elapsed:>12,.0f} ops/s")
+
+    # Akurasi: fee float vs fee exact (Decimal half-up sebagai referensi)
+    wrong_fee = 0
+    wrong_amount = 0
+    for v in unique:
+        legacy_amount, legacy_fee = _legacy_simple_payment(v)
+        exact = (Decimal(v) * Decimal("0.025")).quantize(Decimal("0.01"), rounding="ROUND_HALF_UP")
+        wrong_fee += legacy_fee != str(exact)
+        wrong_amount += legacy_amount != v
+        assert str(fee_rate.apply(Money.parse(v))) == str(exact)
+    print(f"float fee salah pembulatan   : {wrong_fee:,} / {count:,}")
+    print(f"float amount berubah         : {wrong_amount:,} / {count:,}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Amount engine Espay")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench_cmd = sub.add_parser("bench", help="Benchmark Money vs float")
+    bench_cmd.add_argument("--count", type=int, default=200_000)
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        bench(args.count)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,386 @@
+"""
+Audit trail request/response ke Espay.
+
+Handler hanya memasukkan record ke ring buffer di memory (tanpa I/O). Task
+background mem-flush record per batch ke segment NDJSON gzip yang append-only
+(setiap batch = satu gzip member), dengan rotasi berdasarkan ukuran/umur.
+Setiap segment punya sidecar .idx (sparse index per batch: offset, rentang
+waktu, order id) sehingga scan bisa langsung seek ke batch yang relevan.
+
+CLI:
+    python audit.py scan --dir audit --order-id INV-123
+    python audit.py scan --dir audit --since 2025-09-01T00:00:00+07:00 --until 2025-09-02T00:00:00+07:00
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import asyncio
+import argparse
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+AUDIT_ENABLED = os.getenv("ESPAY_AUDIT_ENABLED", "1") == "1"
+AUDIT_DIR = os.getenv("ESPAY_AUDIT_DIR", "audit")
+AUDIT_BUFFER_SIZE = int(os.getenv("ESPAY_AUDIT_BUFFER_SIZE", "100000"))
+AUDIT_BATCH_SIZE = int(os.getenv("ESPAY_AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("ESPAY_AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_SEGMENT_BYTES = int(os.getenv("ESPAY_AUDIT_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+AUDIT_SEGMENT_SECONDS = int(os.getenv("ESPAY_AUDIT_SEGMENT_SECONDS", "3600"))
+
+SEGMENT_SUFFIX = ".ndjson.gz"
+INDEX_SUFFIX = ".idx"
+
+# Key yang tidak boleh tersimpan apa adanya (case-insensitive)
+REDACTED_KEYS = frozenset({
+    "signature", "x-signature", "key", "password", "authorization",
+    "submerchantid", "api_key", "signature_key", "private_key",
+})
+REDACTED = "***"
+
+
+def redact(value: Any) -> Any:
+    """Salin dict/list secara rekursif dengan mengganti nilai key sensitif"""
+    if isinstance(value, dict):
+        return {
+            k: (REDACTED if str(k).lower() in REDACTED_KEYS else redact(v))
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    return value
+
+
+def _parse_body(body: Any) -> Any:
+    if isinstance(body, (bytes, bytearray)):
+        body = body.decode("utf-8", errors="replace")
+    if isinstance(body, str):
+        try:
+            return json.loads(body)
+        except ValueError:
+            return body
+    return body
+
+
+def _lookup_keys(record: Dict[str, Any]) -> List[str]:
+    """Semua id yang bisa dipakai untuk mencari record (order id / reference no)"""
+    keys = []
+    if record.get("order_id"):
+        keys.append(record["order_id"])
+    for body in (record.get("request"), record.get("response")):
+        if not isinstance(body, dict):
+            continue
+        for source in (body, body.get("additionalInfo") or {}):
+            if not isinstance(source, dict):
+                continue
+            for name in ("partnerReferenceNo", "referenceNo", "order_id"):
+                value = source.get(name)
+                if value and value not in keys:
+                    keys.append(value)
+    return keys
+
+
+def build_record(entry: tuple) -> Dict[str, Any]:
+    """Ubah entry mentah dari ring buffer jadi record yang sudah di-redact"""
+    ts, app, kind, order_id, request, status_code, response, amount, fee, error = entry
+    response_body = redact(_parse_body(response))
+    if fee is None and isinstance(response_body, dict) and response_body.get("fee") is not None:
+        fee = str(response_body["fee"])
+    record = {
+        "ts": ts,
+        "app": app,
+        "kind": kind,
+        "order_id": order_id,
+        "amount": amount,
+        "fee": fee,
+        "status_code": status_code,
+        "request": redact(_parse_body(request)),
+        "response": response_body,
+    }
+    if error:
+        record["error"] = error
+    record["keys"] = _lookup_keys(record)
+    return record
+
+
+class SegmentWriter:
+    """Menulis batch ke segment gzip append-only + sparse index (dipanggil dari thread)"""
+
+    def __init__(self, directory: str, prefix: str, max_bytes: int, max_seconds: int):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self._file = None
+        self._index = None
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        base = os.path.join(self.directory, f"{self.prefix}-{stamp}-{os.getpid()}-{time.time_ns() % 10**6:06d}")
+        self._file = open(base + SEGMENT_SUFFIX, "ab")
+        self._index = open(base + INDEX_SUFFIX, "a", encoding="utf-8")
+        self._opened_at = time.monotonic()
+
+    def _should_rotate(self) -> bool:
+        return (
+            self._file.tell() >= self.max_bytes
+            or time.monotonic() - self._opened_at >= self.max_seconds
+        )
+
+    def write_batch(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        with self._lock:
+            self._write_batch(records)
+
+    def _write_batch(self, records: List[Dict[str, Any]]):
+        if self._file is None or self._should_rotate():
+            self._close()
+            self._open()
+
+        payload = "".join(
+            json.dumps(r, separators=(",", ":"), ensure_ascii=False) + "\n" for r in records
+        ).encode("utf-8")
+        member = gzip.compress(payload, compresslevel=6)
+
+        offset = self._file.tell()
+        self._file.write(member)
+        self._file.flush()
+
+        keys = sorted({k for r in records for k in r.get("keys", ())})
+        self._index.write(json.dumps({
+            "offset": offset,
+            "length": len(member),
+            "count": len(records),
+            "ts_min": min(r["ts"] for r in records),
+            "ts_max": max(r["ts"] for r in records),
+            "keys": keys,
+        }, separators=(",", ":")) + "\n")
+        self._index.flush()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = None
+            self._index = None
+
+
+class AuditLog:
+    """Ring buffer in-memory + flusher async untuk audit trail"""
+
+    def __init__(
+        self,
+        app_name: str,
+        directory: str = AUDIT_DIR,
+        enabled: bool = AUDIT_ENABLED,
+        buffer_size: int = AUDIT_BUFFER_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        segment_bytes: int = AUDIT_SEGMENT_BYTES,
+        segment_seconds: int = AUDIT_SEGMENT_SECONDS,
+    ):
+        self.app_name = app_name
+        self.directory = directory
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._writer = SegmentWriter(directory, app_name, segment_bytes, segment_seconds)
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def record(
+        self,
+        kind: str,
+        order_id: Optional[str],
+        request: Any,
+        status_code: Optional[int] = None,
+        response: Any = None,
+        amount: Optional[str] = None,
+        fee: Optional[str] = None,
+        error: Optional[str] = None,
+    ):
+        """
+        Enqueue satu pasangan request/response. Tidak melakukan I/O maupun
+        parsing; redaksi dan parsing body dilakukan di thread flusher.
+        """
+        if not self.enabled:
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((
+            time.time(), self.app_name, kind, order_id, request,
+            status_code, response, amount, fee, error,
+        ))
+        if self._wake is not None and len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    def _drain(self) -> List[tuple]:
+        batch = []
+        while self._buffer and len(batch) < self.batch_size:
+            batch.append(self._buffer.popleft())
+        return batch
+
+    def _write(self, entries: List[tuple]):
+        self._writer.write_batch([build_record(e) for e in entries])
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self._buffer:
+                batch = self._drain()
+                try:
+                    await asyncio.to_thread(self._write, batch)
+                except Exception as e:
+                    print(f"❌ Audit flush error: {str(e)}")
+                    break
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._buffer:
+            self._write(self._drain())
+        self._writer.close()
+
+
+def install_audit(app, app_name: str) -> AuditLog:
+    """Buat AuditLog untuk sebuah FastAPI app dan daftarkan startup/shutdown hook"""
+    audit = AuditLog(app_name)
+    app.on_event("startup")(audit.start)
+    app.on_event("shutdown")(audit.stop)
+    return audit
+
+
+# ========================
+# Scan segment (dipakai CLI & rekonsiliasi)
+# ========================
+def list_segments(directory: str) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith(SEGMENT_SUFFIX)
+    )
+
+
+def _read_index(segment: str) -> Optional[List[Dict[str, Any]]]:
+    index_path = segment[: -len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+    if not os.path.exists(index_path):
+        return None
+    entries = []
+    with open(index_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break  # baris terakhir terpotong (crash saat flush)
+    return entries
+
+
+def _iter_member_lines(data: bytes) -> Iterator[Dict[str, Any]]:
+    for line in gzip.decompress(data).splitlines():
+        if line:
+            yield json.loads(line)
+
+
+def _iter_whole_segment(segment: str) -> Iterator[Dict[str, Any]]:
+    try:
+        with gzip.open(segment, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    except (EOFError, gzip.BadGzipFile):
+        return  # member terakhir tidak lengkap
+
+
+def scan(
+    directory: str,
+    order_id: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Iterasi record audit yang cocok dengan order id dan/atau rentang waktu (epoch)"""
+    for segment in list_segments(directory):
+        index = _read_index(segment)
+        if index is None:
+            records = _iter_whole_segment(segment)
+        else:
+            records = _iter_indexed(segment, index, order_id, since, until)
+        for record in records:
+            if order_id is not None and order_id not in record.get("keys", ()):
+                continue
+            if since is not None and record["ts"] < since:
+                continue
+            if until is not None and record["ts"] > until:
+                continue
+            yield record
+
+
+def _iter_indexed(segment, index, order_id, since, until) -> Iterator[Dict[str, Any]]:
+    with open(segment, "rb") as f:
+        for entry in index:
+            if since is not None and entry["ts_max"] < since:
+                continue
+            if until is not None and entry["ts_min"] > until:
+                continue
+            if order_id is not None and order_id not in entry["keys"]:
+                continue
+            f.seek(entry["offset"])
+            yield from _iter_member_lines(f.read(entry["length"]))
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Audit trail Espay")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    scan_cmd = sub.add_parser("scan", help="Cari record berdasarkan order id / rentang waktu")
+    scan_cmd.add_argument("--dir", default=AUDIT_DIR)
+    scan_cmd.add_argument("--order-id")
+    scan_cmd.add_argument("--since", help="ISO 8601 atau epoch detik")
+    scan_cmd.add_argument("--until", help="ISO 8601 atau epoch detik")
+
+    args = parser.parse_args(argv)
+    if args.command == "scan":
+        for record in scan(args.dir, args.order_id, _parse_time(args.since), _parse_time(args.until)):
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
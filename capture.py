@@ -0,0 +1,192 @@
+"""
+Capture traffic masuk (semua endpoint) ke file JSONL untuk replay.
+
+Aktif jika ESPAY_CAPTURE_FILE diisi. Middleware ASGI murni: body request
+dikumpulkan dari `receive` tanpa mengubah alur request, lalu record
+dimasukkan ke buffer di memory dan ditulis per batch oleh task background.
+Nilai sensitif (signature, password, authorization, ...) di-redact memakai
+aturan yang sama dengan audit trail; body form dan JSON di-redact per field,
+body JSON yang tidak bisa di-parse (mis. terpotong ESPAY_CAPTURE_MAX_BODY)
+diganti seluruhnya, dan query string ikut di-redact (termasuk ?token= stream
+SSE, jadi request stream yang di-replay akan dijawab 403).
+
+Satu baris per request:
+    {"ts": 1727000000.123, "app": "main", "method": "POST", "path": "/create-va",
+     "query": "", "headers": {...}, "content_type": "application/json",
+     "body": "{...}", "status": 200, "duration_ms": 84.2}
+
+Replay: python replay.py run capture.jsonl --target http://127.0.0.1:8000
+"""
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from typing import List, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from audit import REDACTED, REDACTED_KEYS, redact
+
+CAPTURE_FILE = os.getenv("ESPAY_CAPTURE_FILE", "")
+CAPTURE_MAX_BODY = int(os.getenv("ESPAY_CAPTURE_MAX_BODY", str(256 * 1024)))
+CAPTURE_BUFFER_SIZE = 50000
+CAPTURE_FLUSH_INTERVAL = 1.0
+
+# Header yang tidak berguna untuk replay atau berisi kredensial
+DROPPED_HEADERS = frozenset({"host", "content-length", "cookie", "connection", "accept-encoding"})
+# Parameter query sensitif selain REDACTED_KEYS (token subscribe status stream)
+REDACTED_QUERY_KEYS = REDACTED_KEYS | {"token", "stream_token"}
+
+
+def redact_body(body: bytes, content_type: str) -> str:
+    text = body.decode("utf-8", errors="replace")
+    if "json" in content_type:
+        try:
+            return json.dumps(redact(json.loads(text)), separators=(",", ":"))
+        except ValueError:
+            # terpotong / rusak: tidak bisa di-redact per field, jadi tidak disimpan
+            return REDACTED
+    if "x-www-form-urlencoded" in content_type:
+        fields = parse_qsl(text, keep_blank_values=True)
+        return urlencode([(k, REDACTED if k.lower() in REDACTED_KEYS else v) for k, v in fields])
+    return text
+
+
+def redact_query(query: bytes) -> str:
+    text = query.decode("latin-1")
+    if not text:
+        return ""
+    fields = parse_qsl(text, keep_blank_values=True)
+    return urlencode([(k, REDACTED if k.lower() in REDACTED_QUERY_KEYS else v) for k, v in fields])
+
+
+def redact_headers(raw_headers) -> dict:
+    headers = {}
+    for key, value in raw_headers:
+        name = key.decode("latin-1").lower()
+        if name in DROPPED_HEADERS:
+            continue
+        headers[name] = REDACTED if name in REDACTED_KEYS else value.decode("latin-1")
+    return headers
+
+
+class CaptureMiddleware:
+    """Middleware ASGI murni; tidak membungkus response sehingga streaming tetap jalan"""
+
+    def __init__(self, app, app_name: str, recorder: "CaptureRecorder"):
+        self.app = app
+        self.app_name = app_name
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.time()
+        chunks: List[bytes] = []
+        size = 0
+        status = 500
+
+        async def capture_receive():
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request" and size < CAPTURE_MAX_BODY:
+                body = message.get("body", b"")
+                chunks.append(body[: CAPTURE_MAX_BODY - size])
+                size += len(body)
+            return message
+
+        async def capture_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            self.recorder.add((
+                started, self.app_name, scope["method"], scope["path"],
+                scope.get("query_string", b""), scope.get("headers", []),
+                b"".join(chunks), size > CAPTURE_MAX_BODY, status,
+                (time.time() - started) * 1000,
+            ))
+
+
+class CaptureRecorder:
+    """Buffer entry mentah; redact + serialisasi + tulis dilakukan di thread"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dropped = 0
+        self._buffer: deque = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, entry: tuple):
+        if len(self._buffer) >= CAPTURE_BUFFER_SIZE:
+            self.dropped += 1
+            return
+        self._buffer.append(entry)
+
+    @staticmethod
+    def _encode(entry: tuple) -> str:
+        ts, app, method, path, query, raw_headers, body, truncated, status, duration_ms = entry
+        headers = redact_headers(raw_headers)
+        content_type = headers.get("content-type", "")
+        record = {
+            "ts": round(ts, 6),
+            "app": app,
+            "method": method,
+            "path": path,
+            "query": redact_query(query),
+            "headers": headers,
+            "content_type": content_type,
+            "body": redact_body(body, content_type) if body else "",
+            "status": status,
+            "duration_ms": round(duration_ms, 3),
+        }
+        if truncated:
+            record["truncated"] = True
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+    def _write(self, entries: List[tuple]):
+        lines = "".join(self._encode(e) for e in entries)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        entries = [self._buffer.popleft() for _ in range(len(self._buffer))]
+        try:
+            await asyncio.to_thread(self._write, entries)
+        except Exception as e:
+            print(f"❌ Capture write error: {str(e)}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(CAPTURE_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+def install_capture(app, app_name: str) -> Optional[CaptureRecorder]:
+    """Pasang capture jika ESPAY_CAPTURE_FILE diisi; dipanggil terakhir agar jadi middleware terluar"""
+    if not CAPTURE_FILE:
+        return None
+    recorder = CaptureRecorder(CAPTURE_FILE)
+    app.add_middleware(CaptureMiddleware, app_name=app_name, recorder=recorder)
+    app.on_event("startup")(recorder.start)
+    app.on_event("shutdown")(recorder.stop)
+    print(f"📼 Capture traffic aktif -> {CAPTURE_FILE}")
+    return recorder
@@ -0,0 +1,226 @@
+"""
+Sumber waktu dan ID untuk hot path request.
+
+Timestamp:
+  Semua timestamp ke Espay memakai zona Asia/Jakarta (bukan jam lokal server).
+  String terformat di-cache per detik, sehingga request di detik yang sama
+  tidak memanggil datetime.now() + strftime berulang kali.
+
+ID:
+  ID sortable dan bebas tabrakan dari (milidetik, node, counter, acak):
+    - milidetik tidak pernah mundur walaupun jam sistem mundur (NTP):
+      dipakai max(jam sekarang, milidetik terakhir)
+    - node: 32 bit per worker, di-reset setelah fork. Set ESPAY_NODE_ID unik
+      per worker (mis. ordinal pod * 1000 + index worker) agar bebas tabrakan
+      secara pasti; tanpa itu node diambil acak 32 bit (peluang dua dari 1000
+      worker berbagi node ~1e-4, dan itupun baru tabrakan jika milidetik dan
+      counter juga sama)
+    - counter: 16 bit per milidetik; jika habis, milidetik dimajukan satu
+    - acak: 32 bit per ID, supaya order id / job id tetangga tidak bisa
+      ditebak dari ID yang terlihat
+  Format:
+    new_id()      32 hex lowercase (128 bit), mis. untuk rq_uuid / job id
+    numeric_id()  31 digit (YYYYMMDD + ms hari ini + node + counter), untuk X-EXTERNAL-ID
+  Order id yang dikirim ke Espay dibatasi panjangnya (order_id legacy maks
+  20 karakter termasuk prefix), jadi reference_id(n) tidak memakai layout di
+  atas: n karakter base32 Crockford acak (5n bit; 12 karakter = 60 bit, lebih
+  dari uuid4().hex[:12] yang dipakai sebelumnya). Tidak sortable; duplikat
+  yang sangat jarang ditolak Espay sebagai order id yang sudah ada.
+
+Benchmark:
+    python clock.py bench
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import threading
+import zoneinfo
+from base64 import b32encode
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+JKT = zoneinfo.ZoneInfo("Asia/Jakarta")
+# Asia/Jakarta tidak punya DST, offset tetap
+JKT_OFFSET_MS = int(datetime.now(JKT).utcoffset().total_seconds() * 1000)
+DAY_MS = 86_400_000
+
+SQL_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+NODE_BITS = 32
+SEQ_BITS = 16
+RAND_BITS = 32
+NODE_MAX = (1 << NODE_BITS) - 1
+SEQ_MAX = (1 << SEQ_BITS) - 1
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+# alfabet base32 RFC 4648 -> Crockford (urutan string = urutan nilai)
+_TO_CROCKFORD = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ234567", _CROCKFORD)
+
+
+# ========================
+# Timestamp
+# ========================
+_stamp_cache: Tuple[int, Tuple[str, str]] = (-1, ("", ""))
+
+
+def _stamps() -> Tuple[str, str]:
+    global _stamp_cache
+    second = int(time.time())
+    cached = _stamp_cache
+    if cached[0] == second:
+        return cached[1]
+    dt = datetime.fromtimestamp(second, JKT)
+    stamps = (dt.isoformat(), dt.strftime(SQL_FORMAT))
+    # satu assignment tuple, aman dibaca dari thread lain
+    _stamp_cache = (second, stamps)
+    return stamps
+
+
+def now_jkt() -> datetime:
+    return datetime.now(JKT)
+
+
+def iso_timestamp() -> str:
+    """Waktu Jakarta ISO 8601 detik, mis. 2025-09-05T10:00:00+07:00 (X-TIMESTAMP)"""
+    return _stamps()[0]
+
+
+def sql_datetime() -> str:
+    """Waktu Jakarta 'YYYY-MM-DD HH:MM:SS' (rq_datetime / rs_datetime)"""
+    return _stamps()[1]
+
+
+def iso_after(seconds: float) -> str:
+    """Waktu Jakarta ISO 8601 `seconds` dari sekarang (validUpTo, expiry)"""
+    return (datetime.now(JKT).replace(microsecond=0) + timedelta(seconds=seconds)).isoformat()
+
+
+# ========================
+# ID
+# ========================
+def _random_node() -> int:
+    configured = os.getenv("ESPAY_NODE_ID")
+    if configured:
+        return int(configured) & NODE_MAX
+    return int.from_bytes(os.urandom(NODE_BITS // 8), "big")
+
+
+class IdGenerator:
+    """Generator (ms, node, seq) monotonic per worker"""
+
+    def __init__(self, node: Optional[int] = None):
+        self.node = _random_node() if node is None else node & NODE_MAX
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._seq = 0
+
+    def reseed(self):
+        self.node = _random_node()
+        self._lock = threading.Lock()
+
+    def next(self) -> Tuple[int, int]:
+        now_ms = time.time_ns() // 1_000_000
+        with self._lock:
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._seq = 0
+            else:
+                # jam mundur atau milidetik yang sama: lanjutkan dari milidetik terakhir
+                self._seq += 1
+                if self._seq > SEQ_MAX:
+                    self._last_ms += 1
+                    self._seq = 0
+            return self._last_ms, self._seq
+
+    def value(self) -> int:
+        """128 bit: milidetik (48) | node (32) | counter (16) | acak (32)"""
+        ms, seq = self.next()
+        return (
+            (ms << (NODE_BITS + SEQ_BITS + RAND_BITS))
+            | (self.node << (SEQ_BITS + RAND_BITS))
+            | (seq << RAND_BITS)
+            | int.from_bytes(os.urandom(RAND_BITS // 8), "big")
+        )
+
+
+_generator = IdGenerator()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_generator.reseed)
+
+_day_cache: Tuple[int, str] = (-1, "")
+
+
+def new_id() -> str:
+    return f"{_generator.value():032x}"
+
+
+def reference_id(length: int = 12) -> str:
+    """`length` karakter base32 Crockford uppercase acak, untuk order id"""
+    # 5 byte acak = tepat 8 karakter base32
+    raw = os.urandom(-(-length // 8) * 5)
+    return b32encode(raw).decode("ascii")[:length].translate(_TO_CROCKFORD)
+
+
+def numeric_id() -> str:
+    global _day_cache
+    ms, seq = _generator.next()
+    local_ms = ms + JKT_OFFSET_MS
+    day, ms_of_day = divmod(local_ms, DAY_MS)
+    cached = _day_cache
+    if cached[0] != day:
+        cached = (day, datetime.fromtimestamp(day * 86400, JKT).strftime("%Y%m%d"))
+        _day_cache = cached
+    return f"{cached[1]}{ms_of_day:08d}{_generator.node:010d}{seq:05d}"
+
+
+# ========================
+# Benchmark
+# ========================
+def _legacy_external_id() -> str:
+    today = datetime.now(JKT).strftime("%Y%m%d")
+    rand = uuid.uuid4().int % (10**16)
+    return f"{today}{rand:016d}"[:32]
+
+
+def _rate(fn, count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return count / (time.perf_counter() - started)
+
+
+def bench(count: int):
+    cases = [
+        ("str(uuid4())", lambda: str(uuid.uuid4())),
+        ("new_id()", new_id),
+        ("uuid4().hex[:12] (order id)", lambda: uuid.uuid4().hex[:12].upper()),
+        ("reference_id()", reference_id),
+        ("make_external_id (lama)", _legacy_external_id),
+        ("numeric_id()", numeric_id),
+        ("datetime.now().strftime", lambda: datetime.now(JKT).strftime(SQL_FORMAT)),
+        ("sql_datetime()", sql_datetime),
+        ("datetime.now().isoformat", lambda: datetime.now(JKT).replace(microsecond=0).isoformat()),
+        ("iso_timestamp()", iso_timestamp),
+    ]
+    for name, fn in cases:
+        print(f"{name:<30} {_rate(fn, count):>14,.0f} /s")
+
+    ids = [new_id() for _ in range(count)]
+    assert len(set(ids)) == len(ids), "ID duplikat"
+    assert ids == sorted(ids), "ID tidak terurut"
+    print(f"{count:,} new_id() unik dan terurut")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Sumber waktu dan ID")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench_cmd = sub.add_parser("bench", help="Microbenchmark ID dan timestamp per detik")
+    bench_cmd.add_argument("--count", type=int, default=500_000)
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        bench(args.count)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,32 +1,74 @@
 import os
 import json
-import uuid
+import time
 import base64
 import httpx
-from datetime import datetime, timezone
-import zoneinfo
+from functools import partial
 from typing import Literal, Optional
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding
 
-JKT = zoneinfo.ZoneInfo("Asia/Jakarta")
+from audit import install_audit
+from tracing import install_tracing, span
+from http_pool import install_pools, pooled_client, warm
+from webhooks import QRIS_EXPIRED, QRIS_PAID, install_webhooks
+from capture import install_capture
+import clock
+from signatures import ReplayCache, SnapVerifier, snap_request_error
+from readiness import install_readiness
+from tenants import MERCHANT_ID_HEADER, Tenant, TenantRegistry, install_tenants
+from admission import install_admission
+from status_stream import (
+    EXPIRED, FINAL_STATUSES, PAID, PENDING, STREAM_TOKEN_HEADER, install_status_stream, snap_status, stream_token,
+)
+from expiry import expires_at_from_iso, install_expiry
+from espay_responses import QRISGenerateResponse, SnapStatusResponse
 
 ESPAY_ENV = os.getenv("ESPAY_ENV", "production")
-ESPAY_BASE_URL = (
+ESPAY_BASE_URL = os.getenv("ESPAY_BASE_URL") or (
     "https://api.espay.id" if ESPAY_ENV == "production" else "https://sandbox-api.espay.id"
 )
 RELATIVE_URL = "/api/v1.0/qr/qr-mpm-generate"
 ESPAY_URL = ESPAY_BASE_URL + RELATIVE_URL
+QUERY_RELATIVE_URL = "/api/v1.0/qr/qr-mpm-query"
+ESPAY_QUERY_URL = ESPAY_BASE_URL + QUERY_RELATIVE_URL
+# Masa berlaku QR jika request tanpa validity_period (detik)
+QRIS_DEFAULT_VALIDITY = int(os.getenv("ESPAY_QRIS_DEFAULT_VALIDITY", "1800"))
 
 ESPAY_PARTNER_ID = os.getenv("ESPAY_PARTNER_ID", "SGWTIEBYMIN")   # X-PARTNER-ID
 ESPAY_MERCHANT_ID = os.getenv("ESPAY_MERCHANT_ID", "SGWTIEBYMIN") # body.merchantId
 ESPAY_CHANNEL_ID = os.getenv("ESPAY_CHANNEL_ID", "ESPAY")
 ESPAY_PRIVATE_KEY_PEM = os.getenv("ESPAY_PRIVATE_KEY_PEM", "").encode()
+ESPAY_TIMEOUT = httpx.Timeout(30.0, read=60.0)
+
+# Merchant lain dari ESPAY_TENANTS_FILE (header X-Merchant-Id), default dari env di atas
+tenants = TenantRegistry.load(Tenant(
+    ESPAY_MERCHANT_ID,
+    partner_id=ESPAY_PARTNER_ID,
+    private_key_pem=ESPAY_PRIVATE_KEY_PEM,
+    pool_name="espay",
+))
 
 app = FastAPI(title="Espay QRIS (Direct API QR MPM)", version="1.0")
+audit = install_audit(app, "espay")
+install_tracing(app, "espay")
+install_pools(app)
+webhooks = install_webhooks(app)
+status_stream = install_status_stream(app, tenants.default.merchant_id)
+expiry = install_expiry(app, status_stream, webhooks)
+install_capture(app, "espay")
+install_tenants(app, tenants, ["/qris/generate", "/qris/generate/template"])
+# Paling luar: request yang ditolak saat overload tidak menyentuh middleware lain
+admission = install_admission(
+    app,
+    critical=["/qris/generate", "/qris/generate/template", "/v1.0/qr/qr-mpm-notify"],
+    low=["/transactions/*"],
+    debug=["/debug/profile"],
+)
+
+snap_verifier = SnapVerifier()
+replay_cache = ReplayCache()
 
 
 class Amount(BaseModel):
@@ -51,10 +93,11 @@ class EspayQRISResponseTemplate(BaseModel):
     qr_url: str | None = None
     qr_content: str | None = None
     qr_image_base64: str | None = None
+    stream_token: str | None = None  # ?token= untuk /transactions/{id}/events
 
 
 def now_iso_jkt_seconds() -> str:
-    return datetime.now(JKT).replace(microsecond=0).isoformat()
+    return clock.iso_timestamp()
 
 
 def minify_json(d: dict) -> str:
@@ -69,13 +112,22 @@ def sha256_hex_lower(s: str) -> str:
 def load_private_key(pem_bytes: bytes):
     if not pem_bytes:
         raise HTTPException(status_code=500, detail="ESPAY_PRIVATE_KEY_PEM tidak di-set")
+    # cryptography baru di-import saat key pertama kali dibutuhkan (cold start lebih cepat)
+    from cryptography.hazmat.primitives import serialization
     try:
         return serialization.load_pem_private_key(pem_bytes, password=None)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Private key invalid: {e}")
 
 
+def get_private_key(tenant: Optional[Tenant] = None):
+    """Private key merchant hasil parse PEM, disimpan di cache signer (LRU) registry"""
+    return tenants.signer(tenant or tenants.default, lambda t: load_private_key(t.private_key_pem))
+
+
 def sign_rsa_sha256_b64(private_key, message: str) -> str:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
     signature = private_key.sign(
         message.encode("utf-8"),
         padding.PKCS1v15(),
@@ -84,49 +136,106 @@ def sign_rsa_sha256_b64(private_key, message: str) -> str:
     return base64.b64encode(signature).decode()
 
 
-def make_x_signature(http_method: str, relative_url: str, body: dict, x_timestamp: str) -> str:
+def make_x_signature(http_method: str, relative_url: str, body: dict, x_timestamp: str,
+                     tenant: Optional[Tenant] = None) -> str:
     body_min = minify_json(body)
     body_hash = sha256_hex_lower(body_min)
     string_to_sign = f"{http_method}:{relative_url}:{body_hash}:{x_timestamp}"
-    pk = load_private_key(ESPAY_PRIVATE_KEY_PEM)
-    return sign_rsa_sha256_b64(pk, string_to_sign)
+    return sign_rsa_sha256_b64(get_private_key(tenant), string_to_sign)
 
 
 def make_external_id() -> str:
-    today = datetime.now(JKT).strftime("%Y%m%d")
-    rand = uuid.uuid4().int % (10**16)
-    return f"{today}{rand:016d}"[:32]
+    return clock.numeric_id()
+
+
+def publish_created(req: QRISRequest, result: QRISGenerateResponse, tenant: Tenant):
+    """QR berhasil dibuat -> status "pending" untuk halaman checkout dan timer kedaluwarsa"""
+    if result.ok:
+        status_stream.publish(
+            tenant.merchant_id, req.partner_reference_no, PENDING, amount=req.amount.value, valid_until=req.validity_period,
+        )
+        expires_at = expires_at_from_iso(req.validity_period) or time.time() + QRIS_DEFAULT_VALIDITY
+        expiry.schedule("qris", req.partner_reference_no, expires_at, tenant.merchant_id)
+
+
+async def inquire_qris_status(order_id: str, merchant_id: Optional[str]) -> Optional[str]:
+    """Query status QR MPM ke Espay (dipanggil scheduler expiry)"""
+    tenant = tenants.get(merchant_id) or tenants.default
+    x_timestamp = now_iso_jkt_seconds()
+    body = {
+        "originalPartnerReferenceNo": order_id,
+        "serviceCode": "51",
+        "merchantId": tenant.merchant_id,
+    }
+    headers = {
+        "Content-Type": "application/json",
+        "X-TIMESTAMP": x_timestamp,
+        "X-SIGNATURE": make_x_signature("POST", QUERY_RELATIVE_URL, body, x_timestamp, tenant),
+        "X-EXTERNAL-ID": make_external_id(),
+        "X-PARTNER-ID": tenant.partner_id,
+        "CHANNEL-ID": ESPAY_CHANNEL_ID,
+    }
+    async with pooled_client(tenant.pool_name, timeout=ESPAY_TIMEOUT) as client:
+        try:
+            r = await client.post(ESPAY_QUERY_URL, headers=headers, json=body)
+        except httpx.RequestError as e:
+            audit.record("qris_status", order_id, body, error=str(e))
+            return None
+    audit.record("qris_status", order_id, body, r.status_code, r.content)
+    if r.status_code != 200:
+        return None
+    result = SnapStatusResponse.parse(r.content)
+    if not result.ok:
+        return None
+    return snap_status(result.latest_transaction_status)
+
+
+expiry.register("qris", inquire_qris_status, {PAID: QRIS_PAID, EXPIRED: QRIS_EXPIRED})
+
+
+# Warm-up sebelum /ready: parse key sekali dan buka koneksi ke Espay
+readiness = install_readiness(app)
+if ESPAY_PRIVATE_KEY_PEM:
+    readiness.add("private_key", get_private_key)
+if snap_verifier.configured:
+    readiness.add("public_key", snap_verifier.public_key)
+readiness.add("pool:espay", partial(warm, "espay", ESPAY_BASE_URL, ESPAY_TIMEOUT), required=False)
 
 
 @app.post("/qris/generate")
-async def generate_qris(req: QRISRequest):
+async def generate_qris(req: QRISRequest, merchant_id: Optional[str] = Header(None, alias=MERCHANT_ID_HEADER)):
+    tenant = tenants.resolve(merchant_id)
     x_timestamp = now_iso_jkt_seconds()
 
     body = {
         "partnerReferenceNo": req.partner_reference_no,
-        "merchantId": ESPAY_MERCHANT_ID,
+        "merchantId": tenant.merchant_id,
         "amount": {"value": req.amount.value, "currency": req.amount.currency},
         "additionalInfo": {"productCode": req.product_code},
     }
     if req.validity_period:
         body["validityPeriod"] = req.validity_period
 
-    x_signature = make_x_signature("POST", RELATIVE_URL, body, x_timestamp)
+    with span("sign"):
+        x_signature = make_x_signature("POST", RELATIVE_URL, body, x_timestamp, tenant)
 
     headers = {
         "Content-Type": "application/json",
         "X-TIMESTAMP": x_timestamp,
         "X-SIGNATURE": x_signature,
         "X-EXTERNAL-ID": make_external_id(),
-        "X-PARTNER-ID": ESPAY_PARTNER_ID,
+        "X-PARTNER-ID": tenant.partner_id,
         "CHANNEL-ID": ESPAY_CHANNEL_ID,
     }
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=60.0)) as client:
+    async with pooled_client(tenant.pool_name, timeout=ESPAY_TIMEOUT) as client:
         try:
-            r = await client.post(ESPAY_URL, headers=headers, json=body)
+            with span("espay_call", url=ESPAY_URL):
+                r = await client.post(ESPAY_URL, headers=headers, json=body)
         except httpx.RequestError as e:
+            audit.record("qris", req.partner_reference_no, body, amount=req.amount.value, error=str(e))
             raise HTTPException(status_code=502, detail=f"Gagal hubungi Espay: {e}")
+    audit.record("qris", req.partner_reference_no, body, r.status_code, r.content, amount=req.amount.value)
 
     content_type = r.headers.get("content-type", "")
     if r.status_code >= 500:
@@ -134,61 +243,117 @@ async def generate_qris(req: QRISRequest):
     if "application/json" not in content_type:
         raise HTTPException(status_code=502, detail=f"Unexpected content-type: {content_type}")
 
-    try:
-        data = r.json()
-    except Exception:
-        raise HTTPException(status_code=502, detail=f"Unexpected Espay response: {r.text}")
+    with span("parse_response"):
+        try:
+            # qrImage tidak di-decode: body Espay diteruskan apa adanya
+            result = QRISGenerateResponse.parse(r.content)
+        except ValueError:
+            raise HTTPException(status_code=502, detail=f"Unexpected Espay response: {r.text}")
 
-    return JSONResponse(content=data)
+    publish_created(req, result, tenant)
+    headers = {STREAM_TOKEN_HEADER: stream_token(tenant.merchant_id, req.partner_reference_no)} if result.ok else None
+    return Response(content=r.content, media_type="application/json", headers=headers)
 
 
 @app.post("/qris/generate/template", response_model=EspayQRISResponseTemplate)
-async def generate_qris_template(req: QRISRequest):
+async def generate_qris_template(req: QRISRequest, merchant_id: Optional[str] = Header(None, alias=MERCHANT_ID_HEADER)):
+    tenant = tenants.resolve(merchant_id)
     x_timestamp = now_iso_jkt_seconds()
 
     body = {
         "partnerReferenceNo": req.partner_reference_no,
-        "merchantId": ESPAY_MERCHANT_ID,
+        "merchantId": tenant.merchant_id,
         "amount": {"value": req.amount.value, "currency": req.amount.currency},
         "additionalInfo": {"productCode": req.product_code},
     }
     if req.validity_period:
         body["validityPeriod"] = req.validity_period
 
-    x_signature = make_x_signature("POST", RELATIVE_URL, body, x_timestamp)
+    with span("sign"):
+        x_signature = make_x_signature("POST", RELATIVE_URL, body, x_timestamp, tenant)
 
     headers = {
         "Content-Type": "application/json",
         "X-TIMESTAMP": x_timestamp,
         "X-SIGNATURE": x_signature,
         "X-EXTERNAL-ID": make_external_id(),
-        "X-PARTNER-ID": ESPAY_PARTNER_ID,
+        "X-PARTNER-ID": tenant.partner_id,
         "CHANNEL-ID": ESPAY_CHANNEL_ID,
     }
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=60.0)) as client:
+    async with pooled_client(tenant.pool_name, timeout=ESPAY_TIMEOUT) as client:
         try:
-            r = await client.post(ESPAY_URL, headers=headers, json=body)
+            with span("espay_call", url=ESPAY_URL):
+                r = await client.post(ESPAY_URL, headers=headers, json=body)
         except httpx.RequestError as e:
+            audit.record("qris", req.partner_reference_no, body, amount=req.amount.value, error=str(e))
             raise HTTPException(status_code=502, detail=f"Gagal hubungi Espay: {e}")
+    audit.record("qris", req.partner_reference_no, body, r.status_code, r.content, amount=req.amount.value)
 
     if r.status_code >= 500:
         raise HTTPException(status_code=502, detail=f"Espay error {r.status_code}: {r.text}")
 
-    try:
-        data = r.json()
-    except Exception:
-        raise HTTPException(status_code=502, detail=f"Unexpected Espay response: {r.text}")
+    with span("parse_response"):
+        try:
+            result = QRISGenerateResponse.parse(r.content)
+        except ValueError:
+            raise HTTPException(status_code=502, detail=f"Unexpected Espay response: {r.text}")
 
     tmpl = EspayQRISResponseTemplate(
-        response_code=data.get("responseCode"),
-        response_message=data.get("responseMessage"),
-        reference_no=(data.get("additionalInfo") or {}).get("referenceNo"),
-        partner_reference_no=(data.get("additionalInfo") or {}).get("partnerReferenceNo"),
-        merchant_name=(data.get("additionalInfo") or {}).get("merchantName"),
-        amount=(data.get("additionalInfo") or {}).get("amount"),
-        qr_url=data.get("qrUrl"),
-        qr_content=data.get("qrContent"),
-        qr_image_base64=data.get("qrImage"),
+        response_code=result.response_code,
+        response_message=result.response_message,
+        reference_no=result.reference_no,
+        partner_reference_no=result.partner_reference_no,
+        merchant_name=result.merchant_name,
+        amount=result.amount,
+        qr_url=result.qr_url,
+        qr_content=result.qr_content,
+        qr_image_base64=result.qr_image,
+        stream_token=stream_token(tenant.merchant_id, req.partner_reference_no) if result.ok else None,
     )
+    publish_created(req, result, tenant)
     return tmpl
+
+
+@app.post("/v1.0/qr/qr-mpm-notify")
+async def qris_payment_notification(request: Request):
+    """Notifikasi pembayaran QRIS; status "00" diteruskan sebagai event "qris.paid" """
+    raw = await request.body()
+    with span("verify_signature"):
+        rejection = snap_request_error(
+            snap_verifier, replay_cache, request.method, request.url.path, raw, request.headers, "52",
+        )
+    if rejection is not None:
+        return rejection
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body notifikasi bukan JSON valid")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Body notifikasi harus object")
+
+    order_id = data.get("originalPartnerReferenceNo") or data.get("partnerReferenceNo", "")
+    # field object yang bukan object (mis. string) diperlakukan kosong, bukan 500
+    amount = data.get("amount")
+    amount = amount if isinstance(amount, dict) else {}
+    additional_info = data.get("additionalInfo")
+    additional_info = additional_info if isinstance(additional_info, dict) else {}
+    tenant = tenants.get(data.get("merchantId")) or tenants.default
+    audit.record("qris_notification", order_id, data, status_code=200, amount=amount.get("value"))
+    stream_status = snap_status(data.get("latestTransactionStatus"))
+    status_stream.publish(
+        tenant.merchant_id, order_id, stream_status, amount=amount.get("value"),
+        paid_at=additional_info.get("paidTime"),
+    )
+    if stream_status in FINAL_STATUSES:
+        expiry.cancel("qris", order_id, tenant.merchant_id)
+    if data.get("latestTransactionStatus") == "00":
+        webhooks.publish(QRIS_PAID, {
+            "order_id": order_id,
+            "reference_no": data.get("originalReferenceNo"),
+            "amount": amount.get("value"),
+            "currency": amount.get("currency", "IDR"),
+            "paid_at": additional_info.get("paidTime"),
+        })
+
+    return {"responseCode": "2005200", "responseMessage": "Successful"}
@@ -0,0 +1,333 @@
+"""
+Response Espay sebagai model bertipe, dengan field besar yang di-decode lazy.
+
+Response QR membawa gambar base64 besar (qrImage di QRIS, QRCode di
+pushtopay) yang sering tidak dipakai (mis. profile lean cukup qrUrl /
+QRLink, /qris/generate cukup responseCode). Parser di sini mencari field
+besar tersebut langsung di byte mentah, memotong nilainya (diganti null)
+lalu hanya JSON sisanya yang di-parse. Nilai aslinya baru di-decode saat
+atributnya diakses, dari offset di byte mentah yang sudah ada.
+
+Setiap model memetakan field Espay (termasuk yang nested seperti
+additionalInfo.referenceNo) ke atribut sekali saat parse, jadi handler tidak
+perlu `(data.get("additionalInfo") or {}).get(...)` berulang.
+
+Fixture response tersimpan di fixtures/espay/<produk>.<kasus>.json (body
+persis seperti dari Espay, termasuk escape "\\/" ala PHP). Cek parser
+terhadap fixture (hasil lazy == json.loads penuh):
+    python espay_responses.py check
+    python espay_responses.py bench
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Dict, List, Optional, Tuple, Type
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "espay")
+
+_WHITESPACE = b" \t\r\n"
+_QUOTE = 0x22
+_BACKSLASH = 0x5C
+_COLON = 0x3A
+
+
+def _string_end(raw: bytes, start: int) -> int:
+    """Index tanda kutip penutup string JSON yang dimulai di `start` (setelah kutip buka)"""
+    end = raw.find(b'"', start)
+    while end > 0:
+        backslashes = 0
+        i = end - 1
+        while raw[i] == _BACKSLASH:
+            backslashes += 1
+            i -= 1
+        if backslashes % 2 == 0:
+            return end
+        end = raw.find(b'"', end + 1)
+    raise ValueError("String JSON tidak ditutup")
+
+
+def _find_string_value(raw: bytes, key: str) -> Optional[Tuple[int, int]]:
+    """(start, end) isi string untuk `"key": "..."`, atau None jika tidak ada / bukan string"""
+    marker = b'"' + key.encode() + b'"'
+    i = raw.find(marker)
+    if i < 0:
+        return None
+    j = i + len(marker)
+    n = len(raw)
+    while j < n and raw[j] in _WHITESPACE:
+        j += 1
+    if j >= n or raw[j] != _COLON:
+        return None
+    j += 1
+    while j < n and raw[j] in _WHITESPACE:
+        j += 1
+    if j >= n or raw[j] != _QUOTE:
+        return None
+    return j + 1, _string_end(raw, j + 1)
+
+
+def parse_deferred(raw: bytes, keys: Tuple[str, ...]) -> Tuple[dict, Dict[str, Tuple[int, int]]]:
+    """
+    Parse JSON object `raw` tanpa men-decode nilai string top-level `keys`.
+    Return (data dengan key tsb bernilai None, {key: (start, end)} di `raw`).
+    """
+    spans = {}
+    for key in keys:
+        span = _find_string_value(raw, key)
+        if span is not None:
+            spans[key] = span
+    if not spans:
+        data = json.loads(raw)
+    else:
+        pieces = []
+        pos = 0
+        for start, end in sorted(spans.values()):
+            # termasuk tanda kutip buka/tutup
+            pieces.append(raw[pos:start - 1])
+            pieces.append(b"null")
+            pos = end + 1
+        pieces.append(raw[pos:])
+        data = json.loads(b"".join(pieces))
+        if not isinstance(data, dict) or any(key not in data or data[key] is not None for key in spans):
+            # key ternyata bukan di top-level: parse penuh saja
+            data, spans = json.loads(raw), {}
+    if not isinstance(data, dict):
+        raise ValueError("Response Espay bukan JSON object")
+    return data, spans
+
+
+def _dig(data: dict, path: Tuple[str, ...]):
+    value = data
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+class Deferred:
+    """Atribut field besar; di-decode dari byte mentah saat pertama kali dibaca"""
+
+    def __init__(self, key: str):
+        self.key = key
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return instance.deferred(self.key)
+
+
+class EspayResponse:
+    # atribut -> path key di JSON Espay
+    FIELDS: Dict[str, Tuple[str, ...]] = {}
+    DEFERRED: Tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.DEFERRED = tuple(
+            value.key for klass in reversed(cls.__mro__) for value in vars(klass).values()
+            if isinstance(value, Deferred)
+        )
+
+    def __init__(self, data: dict, raw: bytes = b"", spans: Optional[Dict[str, Tuple[int, int]]] = None):
+        self.data = data
+        self._raw = raw
+        self._spans = spans or {}
+        self._decoded: Dict[str, Optional[str]] = {}
+        for attr, path in self.FIELDS.items():
+            setattr(self, attr, _dig(data, path))
+
+    @classmethod
+    def parse(cls, raw: bytes):
+        """Parse body response; ValueError jika bukan JSON object valid"""
+        data, spans = parse_deferred(raw, cls.DEFERRED)
+        return cls(data, raw, spans)
+
+    def deferred(self, key: str) -> Optional[str]:
+        if key in self._decoded:
+            return self._decoded[key]
+        span = self._spans.get(key)
+        if span is None:
+            value = self.data.get(key)
+        else:
+            chunk = self._raw[span[0]:span[1]]
+            value = json.loads(b'"' + chunk + b'"') if b"\\" in chunk else chunk.decode("utf-8")
+        self._decoded[key] = value
+        return value
+
+    def to_dict(self) -> dict:
+        """Response lengkap (field besar ikut di-decode), mis. untuk espay_raw / debug"""
+        if not self._spans:
+            return self.data
+        full = dict(self.data)
+        for key in self._spans:
+            full[key] = self.deferred(key)
+        return full
+
+
+class SnapResponse(EspayResponse):
+    FIELDS = {"response_code": ("responseCode",), "response_message": ("responseMessage",)}
+
+    @property
+    def ok(self) -> bool:
+        return str(self.response_code or "").startswith("200")
+
+
+class LegacyResponse(EspayResponse):
+    FIELDS = {"error_code": ("error_code",), "error_message": ("error_message",)}
+
+    @property
+    def ok(self) -> bool:
+        return self.error_code == "0000"
+
+
+class H2HPaymentResponse(SnapResponse):
+    FIELDS = {
+        **SnapResponse.FIELDS,
+        "approval_code": ("approvalCode",),
+        "partner_reference_no": ("partnerReferenceNo",),
+        "web_redirect_url": ("webRedirectUrl",),
+    }
+
+
+class SnapStatusResponse(SnapResponse):
+    """Inquiry status SNAP (H2H debit status, QR MPM query)"""
+    FIELDS = {
+        **SnapResponse.FIELDS,
+        "original_partner_reference_no": ("originalPartnerReferenceNo",),
+        "original_reference_no": ("originalReferenceNo",),
+        "latest_transaction_status": ("latestTransactionStatus",),
+        "transaction_status_desc": ("transactionStatusDesc",),
+    }
+
+
+class QRISGenerateResponse(SnapResponse):
+    FIELDS = {
+        **SnapResponse.FIELDS,
+        "qr_url": ("qrUrl",),
+        "qr_content": ("qrContent",),
+        "reference_no": ("additionalInfo", "referenceNo"),
+        "partner_reference_no": ("additionalInfo", "partnerReferenceNo"),
+        "merchant_name": ("additionalInfo", "merchantName"),
+        "amount": ("additionalInfo", "amount"),
+    }
+    qr_image = Deferred("qrImage")
+
+
+class VAInvoiceResponse(LegacyResponse):
+    FIELDS = {
+        **LegacyResponse.FIELDS,
+        "va_number": ("va_number",),
+        "amount": ("amount",),
+        "total_amount": ("total_amount",),
+        "fee": ("fee",),
+        "expired": ("expired",),
+    }
+
+
+class VAStatusResponse(LegacyResponse):
+    FIELDS = {
+        **LegacyResponse.FIELDS,
+        "order_id": ("order_id",),
+        "tx_status": ("tx_status",),
+    }
+
+
+class PushToPayResponse(LegacyResponse):
+    FIELDS = {
+        **LegacyResponse.FIELDS,
+        "trx_id": ("trx_id",),
+        "qr_link": ("QRLink",),
+    }
+    qr_code = Deferred("QRCode")
+
+
+# prefix nama file fixture -> model
+MODELS: Dict[str, Type[EspayResponse]] = {
+    "h2h_payment": H2HPaymentResponse,
+    "h2h_status": SnapStatusResponse,
+    "qris_generate": QRISGenerateResponse,
+    "qris_status": SnapStatusResponse,
+    "va_invoice": VAInvoiceResponse,
+    "va_status": VAStatusResponse,
+    "pushtopay": PushToPayResponse,
+}
+
+
+# ========================
+# CLI
+# ========================
+def _fixtures(directory: str) -> List[Tuple[str, Type[EspayResponse], bytes]]:
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        model = MODELS.get(name.split(".")[0])
+        if model is None:
+            raise ValueError(f"Fixture {name}: prefix tidak dikenal (pilihan: {', '.join(MODELS)})")
+        with open(os.path.join(directory, name), "rb") as f:
+            fixtures.append((name, model, f.read()))
+    return fixtures
+
+
+def check(directory: str) -> int:
+    """Setiap fixture: field model dan to_dict() harus sama dengan hasil json.loads penuh"""
+    failures = 0
+    for name, model, raw in _fixtures(directory):
+        full = json.loads(raw)
+        parsed = model.parse(raw)
+        problems = []
+        for attr, path in model.FIELDS.items():
+            if getattr(parsed, attr) != _dig(full, path):
+                problems.append(attr)
+        for key in model.DEFERRED:
+            if parsed.deferred(key) != full.get(key):
+                problems.append(key)
+        if parsed.to_dict() != full:
+            problems.append("to_dict")
+        deferred = ", ".join(f"{key}@{end - start}B" for key, (start, end) in parsed._spans.items())
+        if problems:
+            failures += 1
+            print(f"❌ {name} ({model.__name__}): beda di {', '.join(problems)}")
+        else:
+            print(f"✅ {name} ({model.__name__}){' deferred ' + deferred if deferred else ''}")
+    return 1 if failures else 0
+
+
+def bench(directory: str, rounds: int) -> int:
+    for name, model, raw in _fixtures(directory):
+        if not model.DEFERRED:
+            continue
+        started = time.perf_counter()
+        for _ in range(rounds):
+            json.loads(raw)
+        full_us = (time.perf_counter() - started) / rounds * 1e6
+        started = time.perf_counter()
+        for _ in range(rounds):
+            model.parse(raw)
+        lazy_us = (time.perf_counter() - started) / rounds * 1e6
+        print(f"{name} ({len(raw):,} B): json.loads {full_us:.1f} us, {model.__name__}.parse {lazy_us:.1f} us")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Model response Espay")
+    sub = parser.add_subparsers(dest="command", required=True)
+    c = sub.add_parser("check", help="Validasi parser terhadap fixture response")
+    c.add_argument("--fixtures", default=FIXTURES_DIR)
+    b = sub.add_parser("bench", help="Bandingkan parse lazy vs json.loads penuh")
+    b.add_argument("--fixtures", default=FIXTURES_DIR)
+    b.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args(argv)
+    if args.command == "check":
+        return check(args.fixtures)
+    return bench(args.fixtures, args.rounds)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
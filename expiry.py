@@ -0,0 +1,359 @@
+"""
+Scheduler kedaluwarsa transaksi pending (VA, H2H, QRIS).
+
+Setiap transaksi yang berhasil dibuat didaftarkan dengan waktu kedaluwarsanya
+(va_expired_minutes, validUpTo, validity_period). Saat waktunya lewat tanpa
+notifikasi, scheduler menjalankan inquiry status terakhir ke Espay (notifikasi
+bisa saja hilang), lalu menandai transaksi:
+  - status final dari inquiry (paid/failed/...) dipakai apa adanya
+  - Espay menjawab masih pending / expired -> transaksi "expired"
+  - inquiry gagal (network, non-200, response bukan sukses) -> dijadwalkan
+    ulang dengan backoff (ESPAY_EXPIRY_RETRY_BACKOFF, berlipat dua per
+    percobaan); baru dianggap "expired" setelah ESPAY_EXPIRY_MAX_ATTEMPTS
+    percobaan gagal, supaya Espay yang lambat tidak membuat transaksi yang
+    sudah dibayar dilaporkan expired
+dan mengirim hasilnya ke status stream (SSE) dan webhook ("va.expired", dst).
+Notifikasi yang masuk lebih dulu membatalkan timer-nya; jika status final
+sudah tercatat di status stream, hasil expiry tidak dipublikasikan lagi.
+
+Timer disimpan di hierarchical timing wheel (4 level x 256 slot, 1 tick =
+ESPAY_EXPIRY_TICK detik): insert dan cancel O(1), per tick hanya satu slot
+yang disentuh, dan timer jauh di depan turun level (cascade) sekali per
+putaran level di atasnya. Key timer adalah (kind, merchant, order id), karena
+order id dipilih merchant dan bisa sama antar merchant. Per timer hanya ada
+satu entry index (key -> slot) dan satu entry slot (key -> deadline),
+sehingga jutaan transaksi pending muat di memori proses.
+
+Timer hanya ada di memori worker yang membuat transaksi; setelah restart,
+transaksi lama diselesaikan oleh rekonsiliasi (reconcile.py). Dengan
+beberapa worker, cancel dan pengecekan status final hanya berlaku jika
+notifikasi mendarat di worker yang sama (sticky routing per order id, sama
+seperti status_stream). Tanpa itu, event paid dari jalur expiry bisa menyusul
+event paid dari notifikasi: konsumen webhook harus dedupe per
+(type, data.order_id) - event expiry membawa data.source = "expiry".
+
+Benchmark:
+    python expiry.py bench --timers 1000000
+"""
+import os
+import sys
+import math
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from status_stream import EXPIRED, FINAL_STATUSES
+
+EXPIRY_TICK = float(os.getenv("ESPAY_EXPIRY_TICK", "1"))
+EXPIRY_WORKERS = int(os.getenv("ESPAY_EXPIRY_WORKERS", "4"))
+EXPIRY_MAX_ATTEMPTS = int(os.getenv("ESPAY_EXPIRY_MAX_ATTEMPTS", "5"))
+EXPIRY_RETRY_BACKOFF = float(os.getenv("ESPAY_EXPIRY_RETRY_BACKOFF", "30"))
+EXPIRY_RETRY_BACKOFF_MAX = 900.0
+
+WHEEL_BITS = 8
+WHEEL_SIZE = 1 << WHEEL_BITS
+WHEEL_MASK = WHEEL_SIZE - 1
+WHEEL_LEVELS = 4
+# delta terjauh yang bisa ditempatkan tanpa clamp (256^4 tick)
+WHEEL_SPAN = 1 << (WHEEL_BITS * WHEEL_LEVELS)
+
+# inquire(order_id, merchant_id) -> status stream ("paid", "pending", ...) atau None jika gagal
+Inquiry = Callable[[str, Optional[str]], Awaitable[Optional[str]]]
+
+
+class TimerWheel:
+    """Hierarchical timing wheel; waktu dalam tick integer, `advance` mengembalikan timer yang habis"""
+
+    def __init__(self, now_tick: int = 0):
+        self.now = now_tick
+        self._slots: List[List[Optional[dict]]] = [[None] * WHEEL_SIZE for _ in range(WHEEL_LEVELS)]
+        # key -> level * WHEEL_SIZE + slot, untuk cancel O(1)
+        self._index: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def add(self, key: Hashable, deadline: int, payload=None):
+        """Daftarkan (atau jadwalkan ulang) `key`; deadline yang sudah lewat habis di tick berikutnya"""
+        if key in self._index:
+            self.cancel(key)
+        self._place(key, deadline, payload)
+
+    def _place(self, key: Hashable, deadline: int, payload):
+        delta = deadline - self.now
+        if delta <= 0:
+            target, level = self.now + 1, 0
+        else:
+            if delta >= WHEEL_SPAN:
+                delta = WHEEL_SPAN - 1
+            target = self.now + delta
+            level = (delta.bit_length() - 1) // WHEEL_BITS
+        slot = (target >> (WHEEL_BITS * level)) & WHEEL_MASK
+        bucket = self._slots[level][slot]
+        if bucket is None:
+            bucket = self._slots[level][slot] = {}
+        bucket[key] = (deadline, payload)
+        self._index[key] = level * WHEEL_SIZE + slot
+
+    def cancel(self, key: Hashable) -> bool:
+        position = self._index.pop(key, None)
+        if position is None:
+            return False
+        level, slot = divmod(position, WHEEL_SIZE)
+        del self._slots[level][slot][key]
+        return True
+
+    def _cascade(self, level: int, slot: int):
+        bucket = self._slots[level][slot]
+        if bucket:
+            self._slots[level][slot] = None
+            for key, (deadline, payload) in bucket.items():
+                self._place(key, deadline, payload)
+
+    def advance(self, to_tick: int) -> List[Tuple[Hashable, object]]:
+        """Majukan wheel sampai `to_tick`; return [(key, payload)] yang kedaluwarsa"""
+        expired = []
+        level0 = self._slots[0]
+        index = self._index
+        while self.now < to_tick:
+            self.now += 1
+            tick = self.now
+            slot = tick & WHEEL_MASK
+            if slot == 0:
+                # awal putaran level 0: turunkan slot level berikutnya (dan seterusnya)
+                for level in range(1, WHEEL_LEVELS):
+                    upper = (tick >> (WHEEL_BITS * level)) & WHEEL_MASK
+                    self._cascade(level, upper)
+                    if upper:
+                        break
+            bucket = level0[slot]
+            if bucket:
+                level0[slot] = None
+                for key, (_, payload) in bucket.items():
+                    del index[key]
+                    expired.append((key, payload))
+        return expired
+
+
+def expires_at_from_iso(value: Optional[str]) -> Optional[float]:
+    """Epoch detik dari timestamp ISO 8601 ber-timezone (validUpTo / validity_period)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        return None
+    return parsed.timestamp()
+
+
+class ExpiryScheduler:
+    def __init__(self, broker, webhooks, tick: float = EXPIRY_TICK, workers: int = EXPIRY_WORKERS,
+                 max_attempts: int = EXPIRY_MAX_ATTEMPTS, retry_backoff: float = EXPIRY_RETRY_BACKOFF):
+        self.broker = broker
+        self.webhooks = webhooks
+        self.tick = tick
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.wheel = TimerWheel(self._tick_of(time.time()))
+        self._handlers: Dict[str, Tuple[Inquiry, Dict[str, str]]] = {}
+        # key -> jumlah inquiry gagal; hanya untuk timer yang sedang di-retry
+        self._attempts: Dict[str, int] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self.counters = {
+            "scheduled": 0, "canceled": 0, "expired": 0, "inquiries": 0,
+            "inquiry_errors": 0, "retries": 0, "expired_after_errors": 0,
+            "final_on_inquiry": 0, "already_final": 0,
+        }
+
+    def _tick_of(self, epoch: float) -> int:
+        return math.ceil(epoch / self.tick)
+
+    def register(self, kind: str, inquire: Inquiry, events: Dict[str, str]):
+        """`events` memetakan status akhir (paid/expired/...) ke tipe event webhook"""
+        self._handlers[kind] = (inquire, events)
+
+    def schedule(self, kind: str, order_id: str, expires_at: Optional[float], merchant_id: Optional[str] = None):
+        if not order_id or expires_at is None or kind not in self._handlers:
+            return
+        self.wheel.add((kind, merchant_id or "", order_id), self._tick_of(expires_at))
+        self.counters["scheduled"] += 1
+
+    def cancel(self, kind: str, order_id: str, merchant_id: Optional[str] = None):
+        """Dipanggil saat notifikasi final masuk sebelum kedaluwarsa"""
+        key = (kind, merchant_id or "", order_id)
+        self._attempts.pop(key, None)
+        if self.wheel.cancel(key):
+            self.counters["canceled"] += 1
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            # tidur sampai batas tick berikutnya
+            await asyncio.sleep(self._tick_of(now) * self.tick - now or self.tick)
+            for entry in self.wheel.advance(self._tick_of(time.time())):
+                self._queue.put_nowait(entry)
+
+    async def _worker(self):
+        while True:
+            (kind, merchant_id, order_id), _ = await self._queue.get()
+            try:
+                await self.finalize(kind, order_id, merchant_id or None)
+            except Exception as e:
+                print(f"❌ Finalisasi expiry {kind} {merchant_id}:{order_id} gagal: {str(e)}")
+
+    async def finalize(self, kind: str, order_id: str, merchant_id: Optional[str]) -> Optional[str]:
+        """
+        Inquiry status terakhir lalu tandai transaksi; return status akhir,
+        atau None jika inquiry gagal dan timer dijadwalkan ulang / status
+        final sudah tercatat sebelumnya.
+        """
+        inquire, events = self._handlers[kind]
+        key = (kind, merchant_id or "", order_id)
+        self.counters["inquiries"] += 1
+        status = None
+        try:
+            status = await inquire(order_id, merchant_id)
+        except Exception as e:
+            print(f"⚠️ Inquiry {kind} {order_id} gagal: {str(e)}")
+        if status is None:
+            self.counters["inquiry_errors"] += 1
+            attempts = self._attempts.get(key, 0) + 1
+            if attempts < self.max_attempts:
+                self._attempts[key] = attempts
+                backoff = min(self.retry_backoff * 2 ** (attempts - 1), EXPIRY_RETRY_BACKOFF_MAX)
+                self.wheel.add(key, self._tick_of(time.time() + backoff))
+                self.counters["retries"] += 1
+                return None
+            self.counters["expired_after_errors"] += 1
+            print(f"⚠️ Inquiry {kind} {order_id} gagal {attempts}x, ditandai expired")
+        self._attempts.pop(key, None)
+
+        if self.broker.is_final(merchant_id, order_id):
+            # notifikasi sudah menetapkan status final (mis. paid) lebih dulu
+            self.counters["already_final"] += 1
+            return None
+        if status in FINAL_STATUSES and status != EXPIRED:
+            self.counters["final_on_inquiry"] += 1
+            final = status
+        else:
+            final = EXPIRED
+        self.counters["expired"] += 1
+        self.broker.publish(merchant_id, order_id, final, source="expiry")
+        event_type = events.get(final)
+        if event_type:
+            self.webhooks.publish(event_type, {
+                "order_id": order_id,
+                "merchant_id": merchant_id,
+                "status": final,
+                "source": "expiry",
+            })
+        return final
+
+    async def start(self):
+        if not self._tasks:
+            self._tasks.append(asyncio.create_task(self._run()))
+            self._tasks.extend(asyncio.create_task(self._worker()) for _ in range(self.workers))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "pending": len(self.wheel),
+            "retrying": len(self._attempts),
+            "finalizing": self._queue.qsize(),
+        }
+
+
+def install_expiry(app, broker, webhooks) -> ExpiryScheduler:
+    """Buat scheduler, daftarkan lifecycle dan GET /expiry/stats"""
+    scheduler = ExpiryScheduler(broker, webhooks)
+    app.on_event("startup")(scheduler.start)
+    app.on_event("shutdown")(scheduler.stop)
+
+    @app.get("/expiry/stats", tags=["Status"])
+    def expiry_stats():
+        """Jumlah timer pending, yang sudah kedaluwarsa dan hasil inquiry akhir"""
+        return {"status": "success", "data": scheduler.stats()}
+
+    return scheduler
+
+
+# ========================
+# Benchmark
+# ========================
+def _rss_mb() -> float:
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench(timers: int, horizon: int, cancel_ratio: float):
+    rng = random.Random(42)
+    deadlines = [rng.randrange(1, horizon) for _ in range(timers)]
+    keys = [("va", "SGWMERCHANT", f"INV-{i:012d}") for i in range(timers)]
+    wheel = TimerWheel(0)
+    rss_before = _rss_mb()
+
+    started = time.perf_counter()
+    for key, deadline in zip(keys, deadlines):
+        wheel.add(key, deadline)
+    insert_s = time.perf_counter() - started
+    rss_after = _rss_mb()
+
+    cancelled = keys[: int(timers * cancel_ratio)]
+    started = time.perf_counter()
+    for key in cancelled:
+        wheel.cancel(key)
+    cancel_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    expired = 0
+    late = 0
+    for tick in range(1, horizon + 1):
+        for key, _ in wheel.advance(tick):
+            expired += 1
+        if tick == horizon // 2:
+            late = len(wheel)
+    expire_s = time.perf_counter() - started
+
+    expected = timers - len(cancelled)
+    print(f"Timer wheel {timers:,} timer, horizon {horizon:,} tick")
+    print(f"   insert  {timers / insert_s:>12,.0f}/s  ({insert_s * 1e9 / timers:.0f} ns/timer)")
+    if cancelled:
+        print(f"   cancel  {len(cancelled) / cancel_s:>12,.0f}/s  ({cancel_s * 1e9 / len(cancelled):.0f} ns/timer)")
+    print(f"   expire  {expired / expire_s:>12,.0f}/s  ({expire_s:.2f}s untuk semua tick, termasuk cascade)")
+    print(f"   memori  ~{rss_after - rss_before:.0f} MB RSS untuk {timers:,} timer (max RSS {rss_after:.0f} MB)")
+    print(f"   pending di tengah horizon: {late:,}")
+    if expired != expected or len(wheel):
+        print(f"❌ expired {expired:,} != {expected:,} (sisa {len(wheel):,})")
+        return 1
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Timer wheel expiry")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("bench", help="Throughput insert/cancel/expire")
+    b.add_argument("--timers", type=int, default=1_000_000)
+    b.add_argument("--horizon", type=int, default=86_400, help="Rentang deadline dalam tick (default 24 jam)")
+    b.add_argument("--cancel-ratio", type=float, default=0.3,
+                   help="Porsi timer yang dibatalkan (notifikasi datang sebelum expiry)")
+    args = parser.parse_args(argv)
+    return bench(args.timers, args.horizon, args.cancel_ratio)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,259 @@
+"""
+Fee rule engine.
+
+Jadwal fee per bank code / pay option / product code / tier amount dibaca dari
+file JSON (ESPAY_FEE_CONFIG) lalu di-compile saat startup menjadi lookup
+dict -> array threshold tier yang sudah terurut, sehingga satu quote hanya
+butuh satu dict lookup + bisect. Tanpa config, berlaku fee default 2.5%.
+
+Format config (lihat fee_rules.example.json):
+    {
+      "rules": [
+        {"bank_code": "014", "pay_option": "BCAATM", "product_code": "*",
+         "tiers": [{"min": "0.00", "percent": "2.5", "flat": "1000.00"},
+                   {"min": "1000000.00", "percent": "1.5", "max_fee": "25000.00"}]},
+        {"bank_code": "*", "pay_option": "*", "product_code": "*",
+         "tiers": [{"min": "0.00", "percent": "2.5"}]}
+      ]
+    }
+
+Benchmark:
+    python fees.py bench
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from amounts import Money, Rate
+
+WILDCARD = "*"
+DEFAULT_PERCENT = "2.5"
+FEE_CONFIG_PATH = os.getenv("ESPAY_FEE_CONFIG", "")
+# Batas cache hasil fallback; key berasal dari input request
+RESOLVED_CACHE_SIZE = 4096
+
+# Urutan fallback dari rule paling spesifik ke paling umum
+_FALLBACKS = (
+    (True, True, True),
+    (True, True, False),
+    (True, False, True),
+    (True, False, False),
+    (False, True, True),
+    (False, True, False),
+    (False, False, True),
+    (False, False, False),
+)
+
+RuleKey = Tuple[str, str, str]
+
+
+class FeeConfigError(ValueError):
+    pass
+
+
+class Tier:
+    __slots__ = ("min_amount", "rate", "flat", "min_fee", "max_fee")
+
+    def __init__(self, min_amount: int, rate: Rate, flat: int = 0,
+                 min_fee: Optional[int] = None, max_fee: Optional[int] = None):
+        self.min_amount = min_amount
+        self.rate = rate
+        self.flat = flat
+        self.min_fee = min_fee
+        self.max_fee = max_fee
+
+    def fee(self, amount: int) -> Money:
+        fee = int(self.rate.apply(amount)) + self.flat
+        if self.min_fee is not None and fee < self.min_fee:
+            fee = self.min_fee
+        if self.max_fee is not None and fee > self.max_fee:
+            fee = self.max_fee
+        return Money(fee)
+
+
+class Schedule:
+    """Tier satu rule, threshold terurut untuk bisect"""
+
+    __slots__ = ("thresholds", "tiers")
+
+    def __init__(self, tiers: List[Tier]):
+        tiers = sorted(tiers, key=lambda t: t.min_amount)
+        self.thresholds = [t.min_amount for t in tiers]
+        self.tiers = tiers
+
+    def fee(self, amount: int) -> Optional[Money]:
+        position = bisect_right(self.thresholds, amount) - 1
+        if position < 0:
+            return None
+        return self.tiers[position].fee(amount)
+
+
+def _money(value, field: str) -> int:
+    try:
+        return Money.parse(str(value))
+    except ValueError:
+        raise FeeConfigError(f"{field} tidak valid: {value!r}")
+
+
+def _compile_tier(raw: dict) -> Tier:
+    try:
+        rate = Rate(raw.get("percent", "0"))
+    except ValueError as e:
+        raise FeeConfigError(str(e))
+    return Tier(
+        min_amount=_money(raw.get("min", "0.00"), "min"),
+        rate=rate,
+        flat=_money(raw.get("flat", "0.00"), "flat"),
+        min_fee=_money(raw["min_fee"], "min_fee") if raw.get("min_fee") is not None else None,
+        max_fee=_money(raw["max_fee"], "max_fee") if raw.get("max_fee") is not None else None,
+    )
+
+
+class FeeEngine:
+    """Lookup fee hasil compile rule config"""
+
+    def __init__(self, schedules: Dict[RuleKey, Schedule]):
+        self._schedules = schedules
+        # cache kombinasi key -> schedule hasil fallback
+        self._resolved: Dict[RuleKey, Optional[Schedule]] = {}
+
+    @classmethod
+    def from_config(cls, config: dict) -> "FeeEngine":
+        schedules: Dict[RuleKey, Schedule] = {}
+        for i, rule in enumerate(config.get("rules", [])):
+            key = (
+                str(rule.get("bank_code", WILDCARD)),
+                str(rule.get("pay_option", WILDCARD)),
+                str(rule.get("product_code", WILDCARD)),
+            )
+            tiers = rule.get("tiers")
+            if not tiers:
+                raise FeeConfigError(f"rule #{i} {key} tidak punya tiers")
+            if key in schedules:
+                raise FeeConfigError(f"rule #{i} duplikat untuk {key}")
+            schedules[key] = Schedule([_compile_tier(t) for t in tiers])
+        return cls(schedules)
+
+    @classmethod
+    def default(cls) -> "FeeEngine":
+        return cls({(WILDCARD, WILDCARD, WILDCARD): Schedule([Tier(0, Rate(DEFAULT_PERCENT))])})
+
+    @classmethod
+    def load(cls, path: str = FEE_CONFIG_PATH) -> "FeeEngine":
+        if not path:
+            return cls.default()
+        with open(path, encoding="utf-8") as f:
+            return cls.from_config(json.load(f))
+
+    def schedule_for(self, bank_code: str, pay_option: str, product_code: str) -> Optional[Schedule]:
+        key = (bank_code, pay_option, product_code)
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+        schedule = None
+        for use_bank, use_option, use_product in _FALLBACKS:
+            candidate = (
+                bank_code if use_bank else WILDCARD,
+                pay_option if use_option else WILDCARD,
+                product_code if use_product else WILDCARD,
+            )
+            schedule = self._schedules.get(candidate)
+            if schedule is not None:
+                break
+        if len(self._resolved) < RESOLVED_CACHE_SIZE:
+            self._resolved[key] = schedule
+        return schedule
+
+    def quote(self, bank_code: str, pay_option: str, product_code: str, amount: int) -> Optional[Money]:
+        """Fee untuk satu transaksi, None jika tidak ada rule yang cocok"""
+        schedule = self.schedule_for(bank_code, pay_option, product_code)
+        if schedule is None:
+            return None
+        return schedule.fee(amount)
+
+    def quote_many(self, items: Sequence[Tuple[str, str, str, int]]) -> List[Optional[Money]]:
+        """
+        Quote bulk: item dikelompokkan per rule key sehingga resolusi fallback
+        dan atribut schedule hanya diambil sekali per kelompok.
+        """
+        groups: Dict[RuleKey, List[int]] = {}
+        for i, (bank_code, pay_option, product_code, _) in enumerate(items):
+            groups.setdefault((bank_code, pay_option, product_code), []).append(i)
+
+        fees: List[Optional[Money]] = [None] * len(items)
+        for key, positions in groups.items():
+            schedule = self.schedule_for(*key)
+            if schedule is None:
+                continue
+            thresholds, tiers = schedule.thresholds, schedule.tiers
+            for i in positions:
+                amount = items[i][3]
+                position = bisect_right(thresholds, amount) - 1
+                if position >= 0:
+                    fees[i] = tiers[position].fee(amount)
+        return fees
+
+
+# ========================
+# Benchmark
+# ========================
+def _bench_config() -> dict:
+    rules = []
+    for bank_code, pay_option in (("008", "MANDIRIATM"), ("014", "BCAATM"), ("009", "BNIATM"), ("002", "BRIATM")):
+        rules.append({
+            "bank_code": bank_code, "pay_option": pay_option, "product_code": "*",
+            "tiers": [
+                {"min": "0.00", "percent": "2.5", "flat": "1000.00"},
+                {"min": "1000000.00", "percent": "1.5"},
+                {"min": "10000000.00", "percent": "0.7", "max_fee": "150000.00"},
+            ],
+        })
+    rules.append({"bank_code": "*", "pay_option": "*", "product_code": "*", "tiers": [{"min": "0.00", "percent": "2.5"}]})
+    return {"rules": rules}
+
+
+def bench(count: int):
+    engine = FeeEngine.from_config(_bench_config())
+    rng = random.Random(30)
+    banks = [("008", "MANDIRIATM"), ("014", "BCAATM"), ("009", "BNIATM"), ("002", "BRIATM"), ("011", "DANAMONATM")]
+    items = []
+    for _ in range(count):
+        bank_code, pay_option = rng.choice(banks)
+        items.append((bank_code, pay_option, "OVOLINK", rng.randrange(10_000_00, 50_000_000_00)))
+
+    started = time.perf_counter()
+    for bank_code, pay_option, product_code, amount in items:
+        engine.quote(bank_code, pay_option, product_code, amount)
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    engine.quote_many(items)
+    bulk = time.perf_counter() - started
+
+    print(f"quote (single) : {single / count * 1e6:.2f} us/quote ({count / single:,.0f} quotes/s)")
+    print(f"quote_many     : {bulk / count * 1e6:.2f} us/quote ({count / bulk:,.0f} quotes/s)")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Fee rule engine Espay")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench_cmd = sub.add_parser("bench", help="Benchmark quote single dan bulk")
+    bench_cmd.add_argument("--count", type=int, default=500_000)
+    check_cmd = sub.add_parser("check", help="Validasi file config fee")
+    check_cmd.add_argument("path")
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        bench(args.count)
+    elif args.command == "check":
+        engine = FeeEngine.load(args.path)
+        print(f"OK: {len(engine._schedules)} rule")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
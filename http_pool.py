@@ -0,0 +1,120 @@
+"""
+Shared httpx.AsyncClient per upstream (connection pool + keep-alive).
+
+Sebelumnya setiap request membuka AsyncClient baru (TCP + TLS handshake
+ulang). Sekarang handler memakai:
+
+    async with pooled_client("espay", timeout=30.0) as client:
+        response = await client.post(...)
+
+Client dibuat sekali per nama dan ditutup saat shutdown app. Jumlah client
+terbuka dibatasi LRU (ESPAY_POOL_MAX_CLIENTS, relevan untuk pool per merchant):
+client yang tersingkir ditutup setelah request terakhir yang memakainya selesai.
+"""
+import os
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Set, Union
+
+import httpx
+
+POOL_MAX_CONNECTIONS = int(os.getenv("ESPAY_POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("ESPAY_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("ESPAY_POOL_KEEPALIVE_EXPIRY", "30"))
+WARM_POOLS = os.getenv("ESPAY_WARM_POOLS", "1") == "1"
+POOL_MAX_CLIENTS = int(os.getenv("ESPAY_POOL_MAX_CLIENTS", "256"))
+
+# urutan = urutan pemakaian terakhir (paling lama di depan)
+_clients: "OrderedDict[str, httpx.AsyncClient]" = OrderedDict()
+# jumlah request yang sedang memakai client lewat pooled_client
+_in_use: Dict[httpx.AsyncClient, int] = {}
+# client tersingkir dari LRU yang masih dipakai; ditutup saat pemakai terakhir selesai
+_retired: Set[httpx.AsyncClient] = set()
+
+
+def _retire(client: httpx.AsyncClient):
+    if client in _in_use:
+        _retired.add(client)
+        return
+    try:
+        asyncio.get_running_loop().create_task(client.aclose())
+    except RuntimeError:
+        # tanpa event loop client belum pernah dipakai, tidak ada koneksi terbuka
+        pass
+
+
+def get_client(name: str, timeout: Union[float, httpx.Timeout, None] = 30.0) -> httpx.AsyncClient:
+    """Client bersama untuk `name`; timeout hanya berlaku saat client pertama kali dibuat"""
+    client = _clients.get(name)
+    if client is not None and not client.is_closed:
+        _clients.move_to_end(name)
+        return client
+    client = httpx.AsyncClient(
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=POOL_MAX_KEEPALIVE,
+            keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+        ),
+    )
+    _clients[name] = client
+    _clients.move_to_end(name)
+    while len(_clients) > POOL_MAX_CLIENTS:
+        _, evicted = _clients.popitem(last=False)
+        _retire(evicted)
+    return client
+
+
+@asynccontextmanager
+async def pooled_client(name: str, timeout: Union[float, httpx.Timeout, None] = 30.0):
+    """Pengganti `async with httpx.AsyncClient(...)` yang tidak menutup koneksi"""
+    client = get_client(name, timeout)
+    _in_use[client] = _in_use.get(client, 0) + 1
+    try:
+        yield client
+    finally:
+        remaining = _in_use.pop(client) - 1
+        if remaining:
+            _in_use[client] = remaining
+        elif client in _retired:
+            _retired.discard(client)
+            await client.aclose()
+
+
+def open_pools() -> List[str]:
+    return list(_clients)
+
+
+async def close_client(name: str):
+    client = _clients.pop(name, None)
+    if client is not None:
+        await client.aclose()
+
+
+async def close_all():
+    for name in list(_clients):
+        await close_client(name)
+    while _retired:
+        await _retired.pop().aclose()
+
+
+def install_pools(app):
+    app.on_event("shutdown")(close_all)
+
+
+async def warm(name: str, url: str, client_timeout: Union[float, httpx.Timeout, None] = 30.0,
+               timeout: float = 3.0) -> bool:
+    """
+    Buat client `name` (dengan timeout yang sama seperti handler) dan buka koneksi
+    TCP + TLS ke upstream lebih awal agar request pertama tidak menanggung handshake.
+    """
+    client = get_client(name, client_timeout)
+    if not WARM_POOLS:
+        return True
+    try:
+        await client.head(url, timeout=timeout)
+    except httpx.HTTPError as e:
+        print(f"⚠️ Warm pool {name} ke {url} gagal: {str(e)}")
+        return False
+    return True
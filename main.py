@@ -1,12 +1,41 @@
-import uuid
+import os
+import time
+import asyncio
 import hashlib
 import httpx
 import base64
 import json
-from datetime import datetime, timedelta
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from collections import OrderedDict
+from functools import partial
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from urllib.parse import parse_qsl
+
+from profiles import RESPONSE_PROFILE_HEADER, ResponseProfile, resolve_profile, lean_response
+from audit import install_audit, scan as audit_scan
+from tracing import install_tracing, span
+from amounts import Money, is_valid_amount, parse_many
+from fees import FeeEngine
+from outbox import ASYNC_MODE_HEADER, CALLBACK_URL_HEADER, install_outbox, is_async_mode
+from http_pool import install_pools, pooled_client, warm
+from readiness import install_readiness
+from webhooks import H2H_COMPLETED, H2H_EXPIRED, VA_EXPIRED, VA_PAID, install_webhooks
+from capture import install_capture
+from tenants import MERCHANT_ID_HEADER, Tenant, TenantRegistry, install_tenants
+from admission import install_admission
+from status_stream import (
+    EXPIRED, FAILED, FINAL_STATUSES, PAID, PENDING, install_status_stream, snap_status, stream_key,
+    stream_token,
+)
+from expiry import expires_at_from_iso, install_expiry
+from espay_responses import H2HPaymentResponse, SnapStatusResponse, VAInvoiceResponse, VAStatusResponse
+import clock
+from signatures import (
+    VERIFY_SIGNATURES, ReplayCache, SnapVerifier, hash_signature, rq_datetime_fresh, snap_request_error,
+    verify_payment_report,
+)
 
 # Konfigurasi Espay
 ESPAY_PARTNER_ID = "SGWIKHSANPARFUM"  # Merchant Code dari Espay
@@ -15,15 +44,33 @@ ESPAY_API_KEY = "e1c30411e2c93716b23c83cc7de517e3"  # API Key untuk Generate Esp
 ESPAY_SIGNATURE_KEY = "wp48y4qm9ur61495"  # Signature key
 ESPAY_PASSWORD = "UFLDQRZQ"  # Password
 
-# URL untuk berbagai service
-ESPAY_SANDBOX_URL = "https://sandbox-api.espay.id/apimerchant/v1.0/debit/payment-host-to-host"
+# Merchant lain dari ESPAY_TENANTS_FILE, dipilih lewat header X-Merchant-Id;
+# tanpa header dipakai merchant di atas
+tenants = TenantRegistry.load(Tenant(
+    ESPAY_PARTNER_ID,
+    name=ESPAY_MERCHANT_NAME,
+    api_key=ESPAY_API_KEY,
+    signature_key=ESPAY_SIGNATURE_KEY,
+    password=ESPAY_PASSWORD,
+    pool_name="espay",
+))
+
+# URL untuk berbagai service (ESPAY_BASE_URL untuk diarahkan ke mock_espay saat replay)
+ESPAY_SANDBOX_BASE_URL = os.getenv("ESPAY_BASE_URL", "https://sandbox-api.espay.id")
+ESPAY_SANDBOX_URL = f"{ESPAY_SANDBOX_BASE_URL}/apimerchant/v1.0/debit/payment-host-to-host"
 ESPAY_PRODUCTION_URL = "https://api.espay.id/apimerchant/v1.0/debit/payment-host-to-host"
-ESPAY_VA_SANDBOX_URL = "https://sandbox-api.espay.id/rest/merchantpg/sendinvoice"
+ESPAY_VA_SANDBOX_URL = f"{ESPAY_SANDBOX_BASE_URL}/rest/merchantpg/sendinvoice"
 ESPAY_VA_PRODUCTION_URL = "https://api.espay.id/rest/merchantpg/sendinvoice"
+# Inquiry status akhir saat transaksi kedaluwarsa tanpa notifikasi
+ESPAY_VA_STATUS_URL = f"{ESPAY_SANDBOX_BASE_URL}/rest/merchant/status"
+ESPAY_H2H_STATUS_URL = f"{ESPAY_SANDBOX_BASE_URL}/apimerchant/v1.0/debit/status"
+
+# Jadwal fee (ESPAY_FEE_CONFIG), di-compile sekali saat startup; default 2.5%
+fee_engine = FeeEngine.load()
 
 # Alternative URLs berdasarkan dokumentasi
-ESPAY_DIRECT_API_URL = "https://sandbox-api.espay.id/rest/merchantpg/directdebit"
-ESPAY_SNAP_URL = "https://sandbox-api.espay.id/v2/transaction"
+ESPAY_DIRECT_API_URL = f"{ESPAY_SANDBOX_BASE_URL}/rest/merchantpg/directdebit"
+ESPAY_SNAP_URL = f"{ESPAY_SANDBOX_BASE_URL}/v2/transaction"
 
 app = FastAPI(
     title="Espay Payment Integration",
@@ -31,6 +78,36 @@ app = FastAPI(
     version="2.0.0"
 )
 
+audit = install_audit(app, "main")
+install_tracing(app, "main")
+outbox = install_outbox(app)
+webhooks = install_webhooks(app)
+status_stream = install_status_stream(app, tenants.default.merchant_id)
+expiry = install_expiry(app, status_stream, webhooks)
+install_pools(app)
+install_capture(app, "main")
+install_tenants(app, tenants, ["/payment-host-to-host", "/simple-payment", "/create-va", "/simple-va-alternative"])
+# Paling luar: request yang ditolak saat overload tidak menyentuh middleware lain
+admission = install_admission(
+    app,
+    critical=["/payment-host-to-host", "/simple-payment", "/create-va", "/espay/notification", "/v1.0/debit/notify"],
+    low=["/transactions/*"],
+    debug=["/debug-signature", "/simple-va-alternative", "/test-connection", "/debug/profile"],
+)
+
+# Verifikasi notifikasi masuk: public key Espay di-load sekali, replay cache per worker
+snap_verifier = SnapVerifier()
+replay_cache = ReplayCache()
+# amount invoice VA per merchant + order id (LRU per proses), lihat va_invoice_amount
+VA_INVOICE_CACHE_SIZE = int(os.getenv("ESPAY_VA_INVOICE_CACHE_SIZE", "200000"))
+va_invoices: "OrderedDict[str, str]" = OrderedDict()
+
+# Warm-up sebelum /ready: public key Espay dan koneksi pool ke Espay
+readiness = install_readiness(app)
+if snap_verifier.configured:
+    readiness.add("public_key", snap_verifier.public_key)
+readiness.add("pool:espay", partial(warm, "espay", ESPAY_SANDBOX_BASE_URL, 30.0), required=False)
+
 # Pydantic Models
 class AmountModel(BaseModel):
     value: str  # Format: "10000.00"
@@ -67,6 +144,18 @@ class PaymentHostToHostRequest(BaseModel):
     payOptionDetails: PayOptionDetailsModel
     additionalInfo: AdditionalInfoModel
 
+# Body wire Espay Host to Host; urutan field = urutan key JSON yang ditandatangani
+class EspayHostToHostBody(BaseModel):
+    partnerReferenceNo: str
+    merchantId: str
+    subMerchantId: str
+    amount: AmountModel
+    urlParam: UrlParamModel
+    validUpTo: str
+    pointOfInitiation: str
+    payOptionDetails: PayOptionDetailsModel
+    additionalInfo: AdditionalInfoModel
+
 class CreateVARequest(BaseModel):
     amount: str
     customer_name: str
@@ -85,26 +174,75 @@ class SimplePaymentRequest(BaseModel):
     thank_you_url: str = "https://yoursite.com/thank-you"
     payment_type: str = "redirect"
 
+class FeeQuoteRequest(BaseModel):
+    amount: str
+    bank_code: str = "014"
+    pay_option: Optional[str] = None  # default: mapping dari bank_code
+    product_code: str = "OVOLINK"
+
+class FeeQuoteBatchRequest(BaseModel):
+    items: List[FeeQuoteRequest] = Field(..., min_length=1, max_length=1000)
+
+# Response models untuk profile "lean"
+class PaymentHostToHostData(BaseModel):
+    partner_reference_no: str
+    redirect_url: Optional[str] = None
+    approval_code: Optional[str] = None
+    amount: str
+    valid_up_to: str
+    stream_token: Optional[str] = None  # ?token= untuk /transactions/{id}/events
+
+class VirtualAccountData(BaseModel):
+    order_id: str
+    va_number: Optional[str] = None
+    amount: Optional[str] = None
+    total_amount: Optional[str] = None
+    fee: Optional[str] = None
+    expired: Optional[str] = None
+    bank_code: str
+    customer_name: str
+    customer_phone: str
+    stream_token: Optional[str] = None  # ?token= untuk /transactions/{id}/events
+
 # Utility Functions
+async def accept_async_job(kind: str, request: BaseModel, order_id: str, callback_url: Optional[str],
+                           tenant: Tenant) -> JSONResponse:
+    """Simpan request ke antrian durable dan jawab 202 dengan tracking id"""
+    job_id = await outbox.enqueue(
+        kind, {"request": request.model_dump(), "merchant_id": tenant.merchant_id}, callback_url
+    )
+    return JSONResponse(status_code=202, content={
+        "status": "accepted",
+        "message": "Request diterima dan akan diproses secara asynchronous",
+        "data": {
+            "tracking_id": job_id,
+            "order_id": order_id,
+            "status_url": f"/jobs/{job_id}",
+            "stream_token": stream_token(tenant.merchant_id, order_id)
+        }
+    })
+
 def generate_timestamp() -> str:
-    """Generate timestamp dalam format ISO 8601"""
-    return datetime.now().strftime("%Y-%m-%dT%H:%M:%S+07:00")
+    """Generate timestamp ISO 8601 zona Asia/Jakarta"""
+    return clock.iso_timestamp()
 
 def generate_external_id() -> str:
-    """Generate unique external ID"""
-    return str(uuid.uuid4())
+    """Generate unique external ID (sortable, per-worker counter)"""
+    return clock.new_id()
 
 def validate_amount_format(amount: str) -> bool:
     """Validasi format amount (harus dengan 2 digit desimal)"""
+    return is_valid_amount(amount)
+
+def parse_amount(amount: str) -> Money:
+    """Parse amount input (0-2 digit desimal) ke minor units, HTTP 400 jika tidak valid"""
     try:
-        float_amount = float(amount)
-        return float_amount > 0 and "." in amount and len(amount.split(".")[1]) == 2
+        money = Money.parse(amount)
     except ValueError:
-        return False
-
-def format_amount(amount: float) -> str:
-    """Format amount menjadi string dengan 2 digit desimal"""
-    return f"{amount:.2f}"
+        raise HTTPException(status_code=400, detail="Format amount tidak valid")
+    if money <= 0:
+        raise HTTPException(status_code=400, detail="Amount harus lebih besar dari 0")
+    return money
 
 def create_simple_signature(
     method: str,
@@ -160,95 +298,80 @@ def get_product_code_by_type(payment_type: str) -> str:
 
 # API Endpoints
 @app.post("/payment-host-to-host", response_model=dict, tags=["Payment Host to Host"])
-async def create_payment_host_to_host(request: PaymentHostToHostRequest):
+async def create_payment_host_to_host(
+    request: PaymentHostToHostRequest,
+    response_profile: Optional[str] = Header(None, alias=RESPONSE_PROFILE_HEADER),
+    async_mode: Optional[str] = Header(None, alias=ASYNC_MODE_HEADER),
+    callback_url: Optional[str] = Header(None, alias=CALLBACK_URL_HEADER),
+    merchant_id: Optional[str] = Header(None, alias=MERCHANT_ID_HEADER)
+):
     """
-    Membuat Payment Host to Host untuk redirect ke halaman checkout Espay
+    Membuat Payment Host to Host untuk redirect ke halaman checkout Espay.
+    Dengan header X-Async-Mode: 1 request masuk antrian durable dan dijawab 202.
     """
+    profile = resolve_profile(response_profile)
+    tenant = tenants.resolve(merchant_id)
     
     # Generate partner reference number jika tidak ada
     if not request.partnerReferenceNo:
-        partner_reference_no = f"ORDER-{uuid.uuid4().hex[:12].upper()}"
+        partner_reference_no = f"ORDER-{clock.reference_id()}"
     else:
         partner_reference_no = request.partnerReferenceNo
     
-    # Validasi amount
+    # Validasi amount (sebelum antrian async: job yang pasti gagal tidak diterima)
     if not validate_amount_format(request.amount.value):
         raise HTTPException(
             status_code=400, 
             detail="Format amount harus dengan 2 digit desimal (contoh: 10000.00)"
         )
     
+    if is_async_mode(async_mode):
+        # Reference no ditetapkan sekarang supaya retry dari antrian tetap idempotent
+        request.partnerReferenceNo = partner_reference_no
+        return await accept_async_job("h2h", request, partner_reference_no, callback_url, tenant)
+    
     # Generate timestamp dan external ID
     timestamp = generate_timestamp()
     external_id = generate_external_id()
     
     # Set validUpTo jika tidak ada (default 24 jam dari sekarang)
     if not request.validUpTo:
-        valid_up_to = (datetime.now() + timedelta(hours=24)).strftime("%Y-%m-%dT%H:%M:%S+07:00")
+        valid_up_to = clock.iso_after(24 * 3600)
     else:
         valid_up_to = request.validUpTo
     
-    # Siapkan request body
-    request_body = {
-        "partnerReferenceNo": partner_reference_no,
-        "merchantId": ESPAY_PARTNER_ID,
-        "subMerchantId": ESPAY_API_KEY,
-        "amount": {
-            "value": request.amount.value,
-            "currency": request.amount.currency
-        },
-        "urlParam": {
-            "url": request.urlParam.url,
-            "type": request.urlParam.type,
-            "isDeeplink": request.urlParam.isDeeplink
-        },
-        "validUpTo": valid_up_to,
-        "pointOfInitiation": request.pointOfInitiation,
-        "payOptionDetails": {
-            "payMethod": request.payOptionDetails.payMethod,
-            "payOption": request.payOptionDetails.payOption,
-            "transAmount": {
-                "value": request.payOptionDetails.transAmount.value,
-                "currency": request.payOptionDetails.transAmount.currency
-            },
-            "feeAmount": {
-                "value": request.payOptionDetails.feeAmount.value,
-                "currency": request.payOptionDetails.feeAmount.currency
-            }
-        },
-        "additionalInfo": {
-            "payType": request.additionalInfo.payType,
-            "userId": request.additionalInfo.userId,
-            "userName": request.additionalInfo.userName,
-            "userEmail": request.additionalInfo.userEmail,
-            "userPhone": request.additionalInfo.userPhone,
-            "buyerId": request.additionalInfo.buyerId,
-            "productCode": request.additionalInfo.productCode,
-            "balanceType": request.additionalInfo.balanceType,
-            "bankCardToken": request.additionalInfo.bankCardToken
-        }
-    }
-    
-    # Remove None values from additionalInfo
-    request_body["additionalInfo"] = {
-        k: v for k, v in request_body["additionalInfo"].items() if v is not None
-    }
+    with span("build_body"):
+        # Sub-model request sudah tervalidasi, cukup dirangkai tanpa validasi ulang
+        wire_body = EspayHostToHostBody.model_construct(
+            partnerReferenceNo=partner_reference_no,
+            merchantId=tenant.merchant_id,
+            subMerchantId=tenant.api_key,
+            amount=request.amount,
+            urlParam=request.urlParam,
+            validUpTo=valid_up_to,
+            pointOfInitiation=request.pointOfInitiation,
+            payOptionDetails=request.payOptionDetails,
+            additionalInfo=request.additionalInfo,
+        )
     
-    request_body_json = json.dumps(request_body, separators=(',', ':'))
+    with span("encode"):
+        # Serializer pydantic-core (sudah di-compile per class); None di additionalInfo dibuang
+        request_body_json = wire_body.model_dump_json(exclude_none=True)
     
-    # Create signature dengan format yang disederhanakan untuk testing
-    try:
-        signature = create_simple_signature(
-            method="POST",
-            url=ESPAY_SANDBOX_URL,
-            timestamp=timestamp,
-            body=request_body_json,
-            secret=ESPAY_SIGNATURE_KEY
-        )
-    except Exception as sig_error:
-        print(f"⚠️ Signature error: {str(sig_error)}")
-        # Fallback signature untuk testing
-        signature = base64.b64encode(f"TEST_{timestamp}_{ESPAY_SIGNATURE_KEY}".encode()).decode()
+    with span("sign"):
+        # Create signature dengan format yang disederhanakan untuk testing
+        try:
+            signature = create_simple_signature(
+                method="POST",
+                url=ESPAY_SANDBOX_URL,
+                timestamp=timestamp,
+                body=request_body_json,
+                secret=tenant.signature_key
+            )
+        except Exception as sig_error:
+            print(f"⚠️ Signature error: {str(sig_error)}")
+            # Fallback signature untuk testing
+            signature = base64.b64encode(f"TEST_{timestamp}_{tenant.signature_key}".encode()).decode()
     
     # Headers
     headers = {
@@ -256,14 +379,14 @@ async def create_payment_host_to_host(request: PaymentHostToHostRequest):
         "X-TIMESTAMP": timestamp,
         "X-SIGNATURE": signature,
         "X-EXTERNAL-ID": external_id,
-        "X-PARTNER-ID": ESPAY_PARTNER_ID,
+        "X-PARTNER-ID": tenant.partner_id,
         "CHANNEL-ID": "ESPAY",
         "Accept": "application/json"
     }
     
     print(f"🔹 Mengirim Payment Host to Host request:")
-    print(f"   Merchant Code: {ESPAY_PARTNER_ID}")
-    print(f"   Merchant Name: {ESPAY_MERCHANT_NAME}")
+    print(f"   Merchant Code: {tenant.merchant_id}")
+    print(f"   Merchant Name: {tenant.name}")
     print(f"   Partner Reference No: {partner_reference_no}")
     print(f"   Amount: {request.amount.value}")
     print(f"   Bank Code: {request.payOptionDetails.payMethod}")
@@ -272,49 +395,74 @@ async def create_payment_host_to_host(request: PaymentHostToHostRequest):
     print(f"   Signature: {signature[:50]}...")
     
     # Kirim request ke Espay
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    response = None
+    async with pooled_client(tenant.pool_name, timeout=30.0) as client:
         try:
-            response = await client.post(
-                ESPAY_SANDBOX_URL,
-                json=request_body,
-                headers=headers
+            with span("espay_call", url=ESPAY_SANDBOX_URL):
+                # Body yang dikirim = string yang ditandatangani (tanpa encode ulang)
+                response = await client.post(
+                    ESPAY_SANDBOX_URL,
+                    content=request_body_json,
+                    headers=headers
+                )
+            audit.record(
+                "h2h", partner_reference_no, request_body_json, response.status_code, response.content,
+                amount=request.amount.value, fee=request.payOptionDetails.feeAmount.value
             )
             
             print(f"📡 Response Status: {response.status_code}")
             print(f"📡 Response Text: {response.text}")
             
             # Parse response
-            try:
-                response_data = response.json()
-            except Exception as json_error:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Gagal parsing JSON response: {str(json_error)}"
-                )
+            with span("parse_response"):
+                try:
+                    espay_result = H2HPaymentResponse.parse(response.content)
+                except ValueError as json_error:
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"Gagal parsing JSON response: {str(json_error)}"
+                    )
             
             # Cek response code
-            response_code = response_data.get("responseCode", "")
-            if not response_code.startswith("200"):
-                error_message = response_data.get("responseMessage", "Unknown error")
+            if not espay_result.ok:
+                error_message = espay_result.response_message or "Unknown error"
                 raise HTTPException(
                     status_code=400,
-                    detail=f"Error dari Espay: {error_message} (Code: {response_code})"
+                    detail=f"Error dari Espay: {error_message} (Code: {espay_result.response_code or ''})"
                 )
             
-            return {
+            data = PaymentHostToHostData(
+                partner_reference_no=partner_reference_no,
+                redirect_url=espay_result.web_redirect_url,
+                approval_code=espay_result.approval_code,
+                amount=request.amount.value,
+                valid_up_to=valid_up_to,
+                stream_token=stream_token(tenant.merchant_id, partner_reference_no)
+            )
+            status_stream.publish(tenant.merchant_id, partner_reference_no, PENDING, amount=request.amount.value, valid_up_to=valid_up_to)
+            expiry.schedule("h2h", partner_reference_no, expires_at_from_iso(valid_up_to), tenant.merchant_id)
+            if profile is ResponseProfile.LEAN:
+                return lean_response(data)
+
+            result = {
                 "status": "success",
                 "message": "Payment Host to Host berhasil dibuat",
-                "data": {
-                    "partner_reference_no": partner_reference_no,
-                    "redirect_url": response_data.get("webRedirectUrl"),
-                    "approval_code": response_data.get("approvalCode"),
-                    "amount": request.amount.value,
-                    "valid_up_to": valid_up_to
-                },
-                "espay_response": response_data
+                "data": data.model_dump(),
+                "espay_response": espay_result.data
             }
+            if profile is ResponseProfile.DEBUG:
+                result["request_data"] = {
+                    "url": ESPAY_SANDBOX_URL,
+                    "payload": json.loads(request_body_json),
+                    "headers": headers
+                }
+            return result
             
         except httpx.TimeoutException:
+            audit.record(
+                "h2h", partner_reference_no, request_body_json,
+                amount=request.amount.value, error="timeout"
+            )
             raise HTTPException(
                 status_code=408,
                 detail="Request timeout ke ESPAY"
@@ -327,6 +475,12 @@ async def create_payment_host_to_host(request: PaymentHostToHostRequest):
         except HTTPException:
             raise
         except Exception as e:
+            if response is None:
+                # gagal sebelum ada response (connection refused, DNS, ...): pasangan belum tercatat
+                audit.record(
+                    "h2h", partner_reference_no, request_body_json,
+                    amount=request.amount.value, error=str(e)
+                )
             print(f"❌ Unexpected error: {str(e)}")
             raise HTTPException(
                 status_code=500,
@@ -334,48 +488,70 @@ async def create_payment_host_to_host(request: PaymentHostToHostRequest):
             )
 
 @app.post("/simple-payment", tags=["Payment Host to Host"])
-async def create_simple_payment(request: SimplePaymentRequest):
+async def create_simple_payment(
+    request: SimplePaymentRequest,
+    response_profile: Optional[str] = Header(None, alias=RESPONSE_PROFILE_HEADER),
+    async_mode: Optional[str] = Header(None, alias=ASYNC_MODE_HEADER),
+    callback_url: Optional[str] = Header(None, alias=CALLBACK_URL_HEADER),
+    merchant_id: Optional[str] = Header(None, alias=MERCHANT_ID_HEADER)
+):
     """
     Endpoint sederhana untuk membuat pembayaran Host to Host
     """
     
-    # Validasi amount
-    try:
-        amount_float = float(request.amount)
-        if amount_float <= 0:
-            raise HTTPException(status_code=400, detail="Amount harus lebih besar dari 0")
-        formatted_amount = format_amount(amount_float)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Format amount tidak valid")
+    with span("build_request"):
+        # Validasi amount
+        amount = parse_amount(request.amount)
+        formatted_amount = str(amount)
+        pay_option = get_pay_option_by_bank_code(request.bank_code)
+        product_code = get_product_code_by_type("ovo")  # Default OVO
     
-    # Calculate fee (contoh 2.5%)
-    fee_amount = format_amount(amount_float * 0.025)
+        # Calculate fee dari jadwal fee
+        fee = fee_engine.quote(request.bank_code, pay_option, product_code, amount)
+        if fee is None:
+            raise HTTPException(status_code=400, detail="Tidak ada aturan fee untuk bank/produk ini")
+        fee_amount = str(fee)
     
-    # Build request
-    payment_request = PaymentHostToHostRequest(
-        amount=AmountModel(value=formatted_amount),
-        urlParam=UrlParamModel(url=request.thank_you_url),
-        payOptionDetails=PayOptionDetailsModel(
-            payMethod=request.bank_code,
-            payOption=get_pay_option_by_bank_code(request.bank_code),
-            transAmount=AmountModel(value=formatted_amount),
-            feeAmount=AmountModel(value=fee_amount)
-        ),
-        additionalInfo=AdditionalInfoModel(
-            payType="REDIRECT" if request.payment_type.lower() == "redirect" else "PAYLINK",
-            userName=request.customer_name,
-            userEmail=request.customer_email,
-            userPhone=request.customer_phone,
-            productCode=get_product_code_by_type("ovo")  # Default OVO
+        # Build request: semua nilai sudah tervalidasi/terhitung di atas, jadi
+        # model_construct (tanpa validasi ulang, default field tetap terisi)
+        amount_model = AmountModel.model_construct(value=formatted_amount)
+        payment_request = PaymentHostToHostRequest.model_construct(
+            amount=amount_model,
+            urlParam=UrlParamModel.model_construct(url=request.thank_you_url),
+            payOptionDetails=PayOptionDetailsModel.model_construct(
+                payMethod=request.bank_code,
+                payOption=pay_option,
+                transAmount=amount_model,
+                feeAmount=AmountModel.model_construct(value=fee_amount)
+            ),
+            additionalInfo=AdditionalInfoModel.model_construct(
+                payType="REDIRECT" if request.payment_type.lower() == "redirect" else "PAYLINK",
+                userName=request.customer_name,
+                userEmail=request.customer_email,
+                userPhone=request.customer_phone,
+                productCode=product_code
+            )
         )
-    )
     
-    return await create_payment_host_to_host(payment_request)
+    return await create_payment_host_to_host(
+        payment_request,
+        response_profile=response_profile,
+        async_mode=async_mode,
+        callback_url=callback_url,
+        merchant_id=merchant_id
+    )
 
 @app.post("/create-va", response_model=dict, tags=["Virtual Account"])
-async def create_virtual_account(request: CreateVARequest):
+async def create_virtual_account(
+    request: CreateVARequest,
+    response_profile: Optional[str] = Header(None, alias=RESPONSE_PROFILE_HEADER),
+    async_mode: Optional[str] = Header(None, alias=ASYNC_MODE_HEADER),
+    callback_url: Optional[str] = Header(None, alias=CALLBACK_URL_HEADER),
+    merchant_id: Optional[str] = Header(None, alias=MERCHANT_ID_HEADER)
+):
     """
-    Membuat Virtual Account Espay (metode lama untuk compatibility)
+    Membuat Virtual Account Espay (metode lama untuk compatibility).
+    Dengan header X-Async-Mode: 1 request masuk antrian durable dan dijawab 202.
     
     Bank Codes yang tersedia:
     - 008: Mandiri
@@ -385,38 +561,40 @@ async def create_virtual_account(request: CreateVARequest):
     - 002: BRI
     - 011: Danamon
     """
+    profile = resolve_profile(response_profile)
+    tenant = tenants.resolve(merchant_id)
     
     # Generate order_id jika tidak disediakan
     if not request.order_id:
-        order_id = f"INV-{uuid.uuid4().hex[:12].upper()}"
+        order_id = f"INV-{clock.reference_id()}"
     else:
         order_id = request.order_id
     
     # Validasi dan format amount
-    try:
-        amount_float = float(request.amount)
-        if amount_float <= 0:
-            raise HTTPException(status_code=400, detail="Amount harus lebih besar dari 0")
-        formatted_amount = format_amount(amount_float)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Format amount tidak valid")
+    formatted_amount = str(parse_amount(request.amount))
     
     # Validasi nomor telepon
     phone = request.customer_phone.strip()
     if not phone.startswith(('0', '+62')):
         raise HTTPException(status_code=400, detail="Nomor telepon harus diawali dengan 0 atau +62")
     
+    if is_async_mode(async_mode):
+        # Order id ditetapkan sekarang supaya retry dari antrian tetap idempotent
+        request.order_id = order_id
+        return await accept_async_job("va", request, order_id, callback_url, tenant)
+    
     # Generate timestamp
-    rq_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    rq_uuid = str(uuid.uuid4())
+    rq_datetime = clock.sql_datetime()
+    rq_uuid = clock.new_id()
     
     # Buat signature untuk VA
-    signature = create_va_signature(
-        comm_code=ESPAY_PARTNER_ID,
-        order_id=order_id,
-        amount=formatted_amount,
-        secret_key=ESPAY_API_KEY
-    )
+    with span("sign"):
+        signature = create_va_signature(
+            comm_code=tenant.merchant_id,
+            order_id=order_id,
+            amount=formatted_amount,
+            secret_key=tenant.api_key
+        )
 
     # Siapkan payload untuk VA
     payload = {
@@ -425,7 +603,7 @@ async def create_virtual_account(request: CreateVARequest):
         "order_id": order_id,
         "amount": formatted_amount,
         "ccy": "IDR",
-        "comm_code": ESPAY_PARTNER_ID,
+        "comm_code": tenant.merchant_id,
         "remark1": phone,
         "remark2": request.customer_name,
         "remark3": request.customer_email or "",
@@ -441,19 +619,25 @@ async def create_virtual_account(request: CreateVARequest):
     }
 
     print(f"🔹 Mengirim VA request ke ESPAY:")
-    print(f"   Merchant Code: {ESPAY_PARTNER_ID}")
+    print(f"   Merchant Code: {tenant.merchant_id}")
     print(f"   Order ID: {order_id}")
     print(f"   Amount: {formatted_amount}")
     print(f"   Bank Code: {request.bank_code}")
     print(f"   Signature: {signature[:50]}...")
 
     # Kirim request ke Espay VA endpoint
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    response = None
+    async with pooled_client(tenant.pool_name, timeout=30.0) as client:
         try:
-            response = await client.post(
-                ESPAY_VA_SANDBOX_URL,
-                data=payload,
-                headers=headers
+            with span("espay_call", url=ESPAY_VA_SANDBOX_URL):
+                response = await client.post(
+                    ESPAY_VA_SANDBOX_URL,
+                    data=payload,
+                    headers=headers
+                )
+            audit.record(
+                "va", order_id, payload, response.status_code, response.content,
+                amount=formatted_amount
             )
 
             print(f"📡 VA Response Status: {response.status_code}")
@@ -465,59 +649,222 @@ async def create_virtual_account(request: CreateVARequest):
                     detail=f"HTTP error dari ESPAY VA: {response.text}"
                 )
 
-            try:
-                response_data = response.json()
-            except Exception as json_error:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Gagal parsing JSON response VA: {str(json_error)}"
-                )
+            with span("parse_response"):
+                try:
+                    espay_result = VAInvoiceResponse.parse(response.content)
+                except ValueError as json_error:
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"Gagal parsing JSON response VA: {str(json_error)}"
+                    )
 
             # Cek error code dari Espay VA
-            error_code = response_data.get("error_code", "")
-            if error_code != "0000":
-                error_message = response_data.get("error_message", "Unknown error")
+            if not espay_result.ok:
+                error_message = espay_result.error_message or "Unknown error"
                 raise HTTPException(
                     status_code=400,
-                    detail=f"Error dari Espay VA: {error_message} (Code: {error_code})"
+                    detail=f"Error dari Espay VA: {error_message} (Code: {espay_result.error_code or ''})"
                 )
 
-            return {
+            data = VirtualAccountData(
+                order_id=order_id,
+                va_number=espay_result.va_number,
+                amount=espay_result.amount,
+                total_amount=espay_result.total_amount,
+                fee=espay_result.fee,
+                expired=espay_result.expired,
+                bank_code=request.bank_code,
+                customer_name=request.customer_name,
+                customer_phone=phone,
+                stream_token=stream_token(tenant.merchant_id, order_id)
+            )
+            remember_va_invoice(tenant.merchant_id, order_id, formatted_amount)
+            status_stream.publish(tenant.merchant_id, order_id, PENDING, amount=formatted_amount, expired=data.expired)
+            expiry.schedule("va", order_id, time.time() + request.va_expired_minutes * 60, tenant.merchant_id)
+            if profile is ResponseProfile.LEAN:
+                return lean_response(data)
+
+            result = {
                 "status": "success",
                 "message": "Virtual Account berhasil dibuat",
-                "data": {
-                    "order_id": order_id,
-                    "va_number": response_data.get("va_number"),
-                    "amount": response_data.get("amount"),
-                    "total_amount": response_data.get("total_amount"),
-                    "fee": response_data.get("fee"),
-                    "expired": response_data.get("expired"),
-                    "bank_code": request.bank_code,
-                    "customer_name": request.customer_name,
-                    "customer_phone": phone
-                },
-                "espay_response": response_data
+                "data": data.model_dump(),
+                "espay_response": espay_result.data
             }
+            if profile is ResponseProfile.DEBUG:
+                result["request_data"] = {
+                    "url": ESPAY_VA_SANDBOX_URL,
+                    "payload": payload,
+                    "headers": headers
+                }
+            return result
 
+        except httpx.TimeoutException:
+            audit.record("va", order_id, payload, amount=formatted_amount, error="timeout")
+            raise HTTPException(
+                status_code=408,
+                detail="Request timeout ke ESPAY VA"
+            )
         except HTTPException:
             raise
         except Exception as e:
+            if response is None:
+                # gagal sebelum ada response (connection refused, DNS, ...): pasangan belum tercatat
+                audit.record("va", order_id, payload, amount=formatted_amount, error=str(e))
             print(f"❌ VA Unexpected error: {str(e)}")
             raise HTTPException(
                 status_code=500,
                 detail=f"Terjadi kesalahan internal VA: {str(e)}"
             )
 
+# Handler antrian async: selalu profile standard agar hasil job berupa dict
+async def _process_h2h_job(payload: dict) -> dict:
+    return await create_payment_host_to_host(
+        PaymentHostToHostRequest(**payload["request"]),
+        response_profile=ResponseProfile.STANDARD.value,
+        async_mode=None,
+        callback_url=None,
+        merchant_id=payload.get("merchant_id")
+    )
+
+async def _process_va_job(payload: dict) -> dict:
+    return await create_virtual_account(
+        CreateVARequest(**payload["request"]),
+        response_profile=ResponseProfile.STANDARD.value,
+        async_mode=None,
+        callback_url=None,
+        merchant_id=payload.get("merchant_id")
+    )
+
+outbox.register("h2h", _process_h2h_job)
+outbox.register("va", _process_va_job)
+
+# tx_status check status VA legacy -> status stream
+VA_TX_STATUSES = {"S": PAID, "F": FAILED, "EX": EXPIRED}
+
+async def inquire_va_status(order_id: str, merchant_id: Optional[str]) -> Optional[str]:
+    """Check status VA ke Espay (dipanggil scheduler expiry)"""
+    tenant = tenants.get(merchant_id) or tenants.default
+    rq_datetime = clock.sql_datetime()
+    payload = {
+        "rq_uuid": clock.new_id(),
+        "rq_datetime": rq_datetime,
+        "comm_code": tenant.merchant_id,
+        "order_id": order_id,
+        "is_paymentnotif": "N",
+        "signature": hash_signature(tenant.signature_key, rq_datetime, order_id, "CHECKSTATUS", uppercase=True),
+    }
+    async with pooled_client(tenant.pool_name, timeout=30.0) as client:
+        try:
+            response = await client.post(ESPAY_VA_STATUS_URL, data=payload)
+        except httpx.HTTPError as e:
+            audit.record("va_status", order_id, payload, error=str(e))
+            return None
+    audit.record("va_status", order_id, payload, response.status_code, response.content)
+    if response.status_code != 200:
+        return None
+    result = VAStatusResponse.parse(response.content)
+    if not result.ok:
+        return None
+    return VA_TX_STATUSES.get(result.tx_status, PENDING)
+
+async def inquire_h2h_status(order_id: str, merchant_id: Optional[str]) -> Optional[str]:
+    """Inquiry status SNAP Payment Host to Host (dipanggil scheduler expiry)"""
+    tenant = tenants.get(merchant_id) or tenants.default
+    timestamp = generate_timestamp()
+    body = json.dumps({
+        "originalPartnerReferenceNo": order_id,
+        "serviceCode": "55",
+        "merchantId": tenant.merchant_id,
+        "subMerchantId": tenant.api_key,
+    }, separators=(",", ":"))
+    headers = {
+        "Content-Type": "application/json",
+        "X-TIMESTAMP": timestamp,
+        "X-SIGNATURE": create_simple_signature("POST", ESPAY_H2H_STATUS_URL, timestamp, body, tenant.signature_key),
+        "X-EXTERNAL-ID": generate_external_id(),
+        "X-PARTNER-ID": tenant.partner_id,
+        "CHANNEL-ID": "ESPAY",
+        "Accept": "application/json"
+    }
+    async with pooled_client(tenant.pool_name, timeout=30.0) as client:
+        try:
+            response = await client.post(ESPAY_H2H_STATUS_URL, content=body, headers=headers)
+        except httpx.HTTPError as e:
+            audit.record("h2h_status", order_id, body, error=str(e))
+            return None
+    audit.record("h2h_status", order_id, body, response.status_code, response.content)
+    if response.status_code != 200:
+        return None
+    result = SnapStatusResponse.parse(response.content)
+    if not result.ok:
+        return None
+    return snap_status(result.latest_transaction_status)
+
+expiry.register("va", inquire_va_status, {PAID: VA_PAID, EXPIRED: VA_EXPIRED})
+expiry.register("h2h", inquire_h2h_status, {PAID: H2H_COMPLETED, EXPIRED: H2H_EXPIRED})
+
+@app.post("/fees/quote", tags=["Fees"])
+def quote_fee(request: FeeQuoteRequest):
+    """
+    Hitung fee transaksi tanpa membuat pembayaran
+    """
+    amount = parse_amount(request.amount)
+    pay_option = request.pay_option or get_pay_option_by_bank_code(request.bank_code)
+    fee = fee_engine.quote(request.bank_code, pay_option, request.product_code, amount)
+    if fee is None:
+        raise HTTPException(status_code=400, detail="Tidak ada aturan fee untuk bank/produk ini")
+    return {
+        "status": "success",
+        "data": {
+            "amount": str(amount),
+            "fee_amount": str(fee),
+            "total_amount": str(amount + fee),
+            "bank_code": request.bank_code,
+            "pay_option": pay_option,
+            "product_code": request.product_code
+        }
+    }
+
+@app.post("/fees/quote/batch", tags=["Fees"])
+def quote_fee_batch(request: FeeQuoteBatchRequest):
+    """
+    Hitung fee banyak transaksi sekaligus (validasi amount & lookup fee secara bulk)
+    """
+    amounts, _ = parse_many(item.amount for item in request.items)
+    items = [
+        (item.bank_code, item.pay_option or get_pay_option_by_bank_code(item.bank_code), item.product_code)
+        for item in request.items
+    ]
+    fees = fee_engine.quote_many([
+        (*key, amount if amount is not None else 0) for key, amount in zip(items, amounts)
+    ])
+
+    results = []
+    for (bank_code, pay_option, product_code), amount, fee in zip(items, amounts, fees):
+        result = {"bank_code": bank_code, "pay_option": pay_option, "product_code": product_code}
+        if amount is None:
+            result["error"] = "Format amount tidak valid"
+        elif amount <= 0:
+            result["error"] = "Amount harus lebih besar dari 0"
+        elif fee is None:
+            result["error"] = "Tidak ada aturan fee untuk bank/produk ini"
+        else:
+            result.update(amount=str(amount), fee_amount=str(fee), total_amount=str(amount + fee))
+        results.append(result)
+
+    return {"status": "success", "data": results}
+
 @app.post("/test-connection", tags=["Testing"])
-async def test_espay_connection():
+async def test_espay_connection(merchant_id: Optional[str] = Header(None, alias=MERCHANT_ID_HEADER)):
     """
     Test koneksi ke Espay untuk debugging
     """
+    tenant = tenants.resolve(merchant_id)
     test_data = {
-        "merchant_code": ESPAY_PARTNER_ID,
-        "merchant_name": ESPAY_MERCHANT_NAME,
-        "api_key": ESPAY_API_KEY[:10] + "...",
-        "signature_key": ESPAY_SIGNATURE_KEY[:10] + "...",
+        "merchant_code": tenant.merchant_id,
+        "merchant_name": tenant.name,
+        "api_key": tenant.api_key[:10] + "...",
+        "signature_key": tenant.signature_key[:10] + "...",
         "timestamp": generate_timestamp(),
         "urls": {
             "host_to_host": ESPAY_SANDBOX_URL,
@@ -537,11 +884,13 @@ async def debug_signature(
     method: str = "POST",
     url: str = ESPAY_SANDBOX_URL,
     body: str = '{"test":"data"}',
-    timestamp: str = None
+    timestamp: str = None,
+    merchant_id: Optional[str] = Header(None, alias=MERCHANT_ID_HEADER)
 ):
     """
     Debug signature generation untuk troubleshooting
     """
+    signature_key = tenants.resolve(merchant_id).signature_key
     if not timestamp:
         timestamp = generate_timestamp()
     
@@ -550,21 +899,21 @@ async def debug_signature(
         signatures = {}
         
         # Format 1: Simple
-        string1 = f"{method}|{url}|{timestamp}|{body}|{ESPAY_SIGNATURE_KEY}"
+        string1 = f"{method}|{url}|{timestamp}|{body}|{signature_key}"
         signatures["format_1_simple"] = {
             "string_to_sign": string1,
             "signature": hashlib.sha256(string1.encode()).hexdigest()
         }
         
         # Format 2: Colon separated  
-        string2 = f"{method}:{url}:{body}:{timestamp}:{ESPAY_SIGNATURE_KEY}"
+        string2 = f"{method}:{url}:{body}:{timestamp}:{signature_key}"
         signatures["format_2_colon"] = {
             "string_to_sign": string2,
             "signature": hashlib.sha256(string2.encode()).hexdigest()
         }
         
         # Format 3: Base64 encoded
-        string3 = f"{method}:{url}:{body}:{timestamp}:{ESPAY_SIGNATURE_KEY}"
+        string3 = f"{method}:{url}:{body}:{timestamp}:{signature_key}"
         sig3 = hashlib.sha256(string3.encode()).hexdigest()
         signatures["format_3_base64"] = {
             "string_to_sign": string3,
@@ -580,7 +929,7 @@ async def debug_signature(
                     "url": url,
                     "body": body,
                     "timestamp": timestamp,
-                    "secret_key": ESPAY_SIGNATURE_KEY[:10] + "..."
+                    "secret_key": signature_key[:10] + "..."
                 },
                 "signatures": signatures
             }
@@ -598,26 +947,31 @@ async def create_simple_va_alternative(
     customer_name: str,
     customer_phone: str,
     customer_email: str = "",
-    bank_code: str = "014"
+    bank_code: str = "014",
+    response_profile: Optional[str] = Header(None, alias=RESPONSE_PROFILE_HEADER),
+    merchant_id: Optional[str] = Header(None, alias=MERCHANT_ID_HEADER)
 ):
     """
-    Endpoint alternatif untuk VA dengan format yang disederhanakan
+    Endpoint alternatif untuk VA dengan format yang disederhanakan.
+    Echo payload request dan headers response hanya dikirim pada profile debug.
     """
+    profile = resolve_profile(response_profile)
+    tenant = tenants.resolve(merchant_id)
     try:
         # Generate order ID
-        order_id = f"VA-{uuid.uuid4().hex[:8].upper()}"
+        order_id = f"VA-{clock.reference_id(8)}"
         
         # Format amount
-        amount_float = float(amount)
-        formatted_amount = f"{amount_float:.2f}"
+        formatted_amount = str(Money.parse(amount))
         
         # Timestamp untuk VA
-        rq_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        rq_uuid = str(uuid.uuid4())
+        rq_datetime = clock.sql_datetime()
+        rq_uuid = clock.new_id()
         
         # Signature untuk VA (format sederhana)
-        signature_string = f"{ESPAY_PARTNER_ID}{order_id}{formatted_amount}{ESPAY_API_KEY}"
-        signature = hashlib.sha256(signature_string.encode()).hexdigest()
+        with span("sign"):
+            signature_string = f"{tenant.merchant_id}{order_id}{formatted_amount}{tenant.api_key}"
+            signature = hashlib.sha256(signature_string.encode()).hexdigest()
         
         # Payload yang disederhanakan
         payload = {
@@ -626,7 +980,7 @@ async def create_simple_va_alternative(
             "order_id": order_id,
             "amount": formatted_amount,
             "ccy": "IDR",
-            "comm_code": ESPAY_PARTNER_ID,
+            "comm_code": tenant.merchant_id,
             "remark1": customer_phone,
             "remark2": customer_name,
             "remark3": customer_email,
@@ -649,11 +1003,16 @@ async def create_simple_va_alternative(
         print(f"   Signature String: {signature_string}")
         print(f"   Signature: {signature}")
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                ESPAY_VA_SANDBOX_URL,
-                data=payload,
-                headers=headers
+        async with pooled_client(tenant.pool_name, timeout=30.0) as client:
+            with span("espay_call", url=ESPAY_VA_SANDBOX_URL):
+                response = await client.post(
+                    ESPAY_VA_SANDBOX_URL,
+                    data=payload,
+                    headers=headers
+                )
+            audit.record(
+                "va", order_id, payload, response.status_code, response.content,
+                amount=formatted_amount
             )
             
             print(f"📡 Response Status: {response.status_code}")
@@ -665,20 +1024,29 @@ async def create_simple_va_alternative(
             except Exception:
                 response_data = {"raw_response": response.text}
             
-            return {
+            if profile is ResponseProfile.LEAN:
+                return {
+                    "status": "test_response",
+                    "order_id": order_id,
+                    "status_code": response.status_code
+                }
+
+            result = {
                 "status": "test_response",
                 "message": "Response dari Espay VA Alternative",
-                "request_data": {
-                    "url": ESPAY_VA_SANDBOX_URL,
-                    "payload": payload,
-                    "headers": headers
-                },
                 "response_data": {
                     "status_code": response.status_code,
-                    "headers": dict(response.headers),
                     "body": response_data
                 }
             }
+            if profile is ResponseProfile.DEBUG:
+                result["request_data"] = {
+                    "url": ESPAY_VA_SANDBOX_URL,
+                    "payload": payload,
+                    "headers": headers
+                }
+                result["response_data"]["headers"] = dict(response.headers)
+            return result
             
     except Exception as e:
         return {
@@ -686,6 +1054,158 @@ async def create_simple_va_alternative(
             "message": f"Error in alternative VA: {str(e)}"
         }
 
+def va_notification_reply(data: dict, error_code: str, error_message: str) -> dict:
+    """Format balasan payment notification VA legacy"""
+    order_id = data.get("order_id", "")
+    now = clock.sql_datetime()
+    return {
+        "rq_uuid": data.get("rq_uuid", ""),
+        "rs_datetime": now,
+        "error_code": error_code,
+        "error_message": error_message,
+        "reconcile_id": (data.get("payment_ref") or order_id) if error_code == "0000" else "",
+        "order_id": order_id,
+        "reconcile_datetime": now,
+    }
+
+def remember_va_invoice(merchant_id: str, order_id: str, amount: str):
+    """Catat amount invoice VA untuk dicocokkan dengan notifikasi pembayarannya"""
+    key = stream_key(merchant_id, order_id)
+    va_invoices[key] = amount
+    va_invoices.move_to_end(key)
+    if len(va_invoices) > VA_INVOICE_CACHE_SIZE:
+        va_invoices.popitem(last=False)
+
+def _audited_va_amount(merchant_id: str, order_id: str) -> Optional[str]:
+    """Amount invoice VA sukses terakhir di audit trail (invoice dari worker lain / sebelum restart)"""
+    amount = None
+    for record in audit_scan(audit.directory, order_id=order_id):
+        request, response = record.get("request"), record.get("response")
+        if (
+            record.get("kind") == "va" and record.get("order_id") == order_id
+            and isinstance(request, dict) and request.get("comm_code") == merchant_id
+            and isinstance(response, dict) and response.get("error_code") == "0000"
+        ):
+            amount = record.get("amount")
+    return amount
+
+async def va_invoice_amount(merchant_id: str, order_id: str) -> Optional[str]:
+    amount = va_invoices.get(stream_key(merchant_id, order_id))
+    if amount is None and audit.enabled:
+        amount = await asyncio.to_thread(_audited_va_amount, merchant_id, order_id)
+    return amount
+
+def amounts_equal(expected: str, received) -> bool:
+    try:
+        return Money.parse(expected) == Money.parse(received)
+    except ValueError:
+        return False
+
+def parse_notification_body(raw: bytes, content_type: str) -> dict:
+    """Notifikasi Espay bisa form-urlencoded (VA legacy) atau JSON (SNAP)"""
+    if "json" in content_type:
+        try:
+            data = json.loads(raw or b"{}")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body notifikasi bukan JSON valid")
+        if not isinstance(data, dict):
+            raise HTTPException(status_code=400, detail="Body notifikasi harus object")
+        return data
+    return dict(parse_qsl(raw.decode("utf-8", errors="replace"), keep_blank_values=True))
+
+@app.post("/espay/notification", tags=["Notification"])
+async def va_payment_notification(request: Request):
+    """
+    Payment notification VA dari Espay. Event "va.paid" diteruskan ke subscriber
+    lewat antrian webhook; response ke Espay tidak menunggu pengiriman.
+    Ditolak jika rq_datetime kedaluwarsa, invoice tidak dikenal atau amount
+    berbeda dari invoice; order id yang sudah final hanya di-ack ulang.
+    """
+    data = parse_notification_body(await request.body(), request.headers.get("content-type", ""))
+    order_id = data.get("order_id", "")
+    if not order_id:
+        raise HTTPException(status_code=400, detail="order_id wajib diisi")
+
+    # comm_code menentukan merchant (dan signature key) pemilik notifikasi
+    tenant = tenants.get(data.get("comm_code")) or tenants.default
+    if VERIFY_SIGNATURES:
+        with span("verify_signature"):
+            valid = verify_payment_report(
+                data.get("rq_datetime", ""), order_id, tenant.signature_key, data.get("signature"),
+            )
+        if not valid:
+            return JSONResponse(status_code=401, content=va_notification_reply(data, "0401", "Invalid signature"))
+        # signature hanya mencakup rq_datetime + order_id: notifikasi lama tidak boleh diputar ulang
+        if not rq_datetime_fresh(data.get("rq_datetime", "")):
+            return JSONResponse(status_code=401, content=va_notification_reply(data, "0401", "Expired rq_datetime"))
+
+    # amount tidak ikut ditandatangani: harus sama dengan invoice yang dibuat
+    invoice_amount = await va_invoice_amount(tenant.merchant_id, order_id)
+    if invoice_amount is None:
+        return JSONResponse(status_code=404, content=va_notification_reply(data, "0404", "Invoice not found"))
+    if not amounts_equal(invoice_amount, data.get("amount")):
+        return JSONResponse(status_code=400, content=va_notification_reply(data, "0400", "Invalid amount"))
+    if status_stream.is_final(tenant.merchant_id, order_id) or replay_cache.seen(f"va:{tenant.merchant_id}:{order_id}"):
+        # kirim ulang Espay (mis. ack sebelumnya hilang): ack sukses yang sama,
+        # tanpa publish webhook / status kedua. Dedupe per order id yang ikut
+        # ditandatangani, bukan rq_uuid yang bisa diganti bebas
+        return va_notification_reply(data, "0000", "Success")
+
+    audit.record("va_notification", order_id, data, status_code=200, amount=data.get("amount"))
+    webhooks.publish(VA_PAID, {
+        "merchant_id": tenant.merchant_id,
+        "order_id": order_id,
+        "amount": invoice_amount,
+        "ccy": data.get("ccy", "IDR"),
+        "payment_ref": data.get("payment_ref"),
+        "bank_code": data.get("debit_from_bank") or data.get("bank_code"),
+        "paid_at": data.get("payment_datetime"),
+    })
+    status_stream.publish(tenant.merchant_id, order_id, PAID, amount=invoice_amount, paid_at=data.get("payment_datetime"))
+    expiry.cancel("va", order_id, tenant.merchant_id)
+
+    return va_notification_reply(data, "0000", "Success")
+
+@app.post("/v1.0/debit/notify", tags=["Notification"])
+async def h2h_payment_notification(request: Request):
+    """Notifikasi SNAP Payment Host to Host; status "00" diteruskan sebagai "h2h.completed" """
+    raw = await request.body()
+    with span("verify_signature"):
+        rejection = snap_request_error(
+            snap_verifier, replay_cache, request.method, request.url.path, raw, request.headers, "56",
+        )
+    if rejection is not None:
+        return rejection
+    data = parse_notification_body(raw, "application/json")
+    order_id = data.get("originalPartnerReferenceNo") or data.get("partnerReferenceNo", "")
+    status = data.get("latestTransactionStatus")
+    # field object yang bukan object (mis. string) diperlakukan kosong, bukan 500
+    amount = data.get("amount")
+    amount = amount if isinstance(amount, dict) else {}
+    additional_info = data.get("additionalInfo")
+    additional_info = additional_info if isinstance(additional_info, dict) else {}
+    tenant = tenants.get(data.get("merchantId")) or tenants.default
+
+    audit.record("h2h_notification", order_id, data, status_code=200)
+    stream_status = snap_status(status)
+    status_stream.publish(
+        tenant.merchant_id, order_id, stream_status, amount=amount.get("value"),
+        paid_at=additional_info.get("paymentDate"),
+    )
+    if stream_status in FINAL_STATUSES:
+        expiry.cancel("h2h", order_id, tenant.merchant_id)
+    if status == "00":
+        webhooks.publish(H2H_COMPLETED, {
+            "order_id": order_id,
+            "reference_no": data.get("originalReferenceNo"),
+            "amount": amount.get("value"),
+            "currency": amount.get("currency", "IDR"),
+            "status": status,
+            "paid_at": additional_info.get("paymentDate"),
+        })
+
+    return {"responseCode": "2005600", "responseMessage": "Successful"}
+
 @app.get("/bank-codes", tags=["Reference"])
 def get_bank_codes():
     """Daftar bank codes yang tersedia untuk Payment Host to Host"""
@@ -715,9 +1235,10 @@ def health_check():
     return {
         "status": "healthy",
         "service": "Espay Payment Integration",
-        "timestamp": datetime.now().isoformat(),
-        "merchant_code": ESPAY_PARTNER_ID,
-        "merchant_name": ESPAY_MERCHANT_NAME
+        "timestamp": clock.iso_timestamp(),
+        "merchant_code": tenants.default.merchant_id,
+        "merchant_name": tenants.default.name,
+        "tenants": len(tenants)
     }
 
 @app.get("/", tags=["General"])
@@ -728,15 +1249,24 @@ def read_root():
         "version": "2.0.0",
         "status": "running",
         "merchant_info": {
-            "merchant_code": ESPAY_PARTNER_ID,
-            "merchant_name": ESPAY_MERCHANT_NAME
+            "merchant_code": tenants.default.merchant_id,
+            "merchant_name": tenants.default.name
         },
         "endpoints": {
             "payment_host_to_host": "/payment-host-to-host",
             "simple_payment": "/simple-payment",
             "create_va": "/create-va", 
             "bank_codes": "/bank-codes",
+            "fee_quote": "/fees/quote",
+            "fee_quote_batch": "/fees/quote/batch",
+            "va_notification": "/espay/notification",
+            "webhook_stats": "/webhooks/stats",
+            "tenant_stats": "/tenants/stats",
+            "transaction_events": "/transactions/{transaction_id}/events?token={stream_token}&merchant_id={merchant_id}",
+            "expiry_stats": "/expiry/stats",
+            "admission_stats": "/admission/stats",
             "health": "/health",
+            "ready": "/ready",
             "test_connection": "/test-connection",
             "debug_signature": "/debug-signature",
             "docs": "/docs"
@@ -745,6 +1275,7 @@ def read_root():
             "Payment Host to Host (Redirect to Espay Checkout)",
             "Virtual Account Creation (Direct VA Number)",
             "Multiple Bank Support",
+            "Multi Merchant (X-Merchant-Id)",
             "Proper Error Handling"
         ]
     }
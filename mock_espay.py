@@ -0,0 +1,186 @@
+"""
+Mock Espay untuk replay dan load test lokal (tanpa menyentuh sandbox).
+
+Response dibuat deterministik dari order id / partnerReferenceNo supaya
+dua build yang di-replay dengan capture yang sama bisa dibandingkan.
+Latency upstream disimulasikan dengan ESPAY_MOCK_LATENCY_MS (+ jitter).
+
+    uvicorn mock_espay:app --port 9000
+    ESPAY_BASE_URL=http://127.0.0.1:9000 uvicorn main:app --port 8000
+"""
+import os
+import json
+import random
+import asyncio
+import hashlib
+import base64
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl
+
+from fastapi import FastAPI, Request
+
+MOCK_LATENCY_MS = float(os.getenv("ESPAY_MOCK_LATENCY_MS", "50"))
+MOCK_JITTER_MS = float(os.getenv("ESPAY_MOCK_JITTER_MS", "20"))
+MOCK_ERROR_RATE = float(os.getenv("ESPAY_MOCK_ERROR_RATE", "0"))
+# Ukuran qrImage palsu (byte sebelum base64), meniru response QRIS yang besar
+MOCK_QR_IMAGE_BYTES = int(os.getenv("ESPAY_MOCK_QR_IMAGE_BYTES", "8192"))
+# Persentase transaksi yang dilaporkan sudah dibayar oleh endpoint inquiry (deterministik per order id)
+MOCK_PAID_PERCENT = int(os.getenv("ESPAY_MOCK_PAID_PERCENT", "0"))
+
+app = FastAPI(title="Mock Espay", version="1.0")
+
+
+def _digits(seed: str, length: int) -> str:
+    return str(int(hashlib.sha256(seed.encode("utf-8")).hexdigest(), 16))[:length]
+
+
+async def _simulate_latency():
+    delay = MOCK_LATENCY_MS + random.uniform(-MOCK_JITTER_MS, MOCK_JITTER_MS)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+
+
+def _fail() -> bool:
+    return MOCK_ERROR_RATE > 0 and random.random() < MOCK_ERROR_RATE
+
+
+def _paid(order_id: str) -> bool:
+    return int(_digits(order_id or "-", 2)) % 100 < MOCK_PAID_PERCENT
+
+
+async def _json_body(request: Request) -> dict:
+    try:
+        return json.loads(await request.body() or b"{}")
+    except ValueError:
+        return {}
+
+
+async def _form_body(request: Request) -> dict:
+    return dict(parse_qsl((await request.body()).decode("utf-8", errors="replace"), keep_blank_values=True))
+
+
+@app.post("/apimerchant/v1.0/debit/payment-host-to-host")
+async def payment_host_to_host(request: Request):
+    body = await _json_body(request)
+    await _simulate_latency()
+    if _fail():
+        return {"responseCode": "5005400", "responseMessage": "General Error"}
+    reference = body.get("partnerReferenceNo", "")
+    return {
+        "responseCode": "2005400",
+        "responseMessage": "Successful",
+        "approvalCode": _digits(reference, 6),
+        "partnerReferenceNo": reference,
+        "webRedirectUrl": f"https://sandbox-kit.espay.id/index/order/?url=mock&ref={reference}",
+    }
+
+
+@app.post("/rest/merchantpg/sendinvoice")
+async def send_invoice(request: Request):
+    form = await _form_body(request)
+    await _simulate_latency()
+    if _fail():
+        return {"error_code": "0099", "error_message": "System error"}
+    order_id = form.get("order_id", "")
+    amount = form.get("amount", "0.00")
+    expired = datetime.now() + timedelta(minutes=int(form.get("va_expired") or 60))
+    return {
+        "rq_uuid": form.get("rq_uuid", ""),
+        "rs_datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "error_code": "0000",
+        "error_message": "",
+        "va_number": "8" + _digits(order_id, 15),
+        "expired": expired.strftime("%Y-%m-%d %H:%M:%S"),
+        "description": form.get("remark1", ""),
+        "total_amount": amount,
+        "amount": amount,
+        "fee": "0.00",
+        "bank_code": form.get("bank_code", ""),
+    }
+
+
+@app.post("/api/v1.0/qr/qr-mpm-generate")
+async def qr_mpm_generate(request: Request):
+    body = await _json_body(request)
+    await _simulate_latency()
+    if _fail():
+        return {"responseCode": "5004700", "responseMessage": "General Error"}
+    reference = body.get("partnerReferenceNo", "")
+    amount = (body.get("amount") or {}).get("value", "0.00")
+    image = base64.b64encode(hashlib.sha256(reference.encode()).digest() * (MOCK_QR_IMAGE_BYTES // 32)).decode()
+    return {
+        "responseCode": "2004700",
+        "responseMessage": "Successful",
+        "referenceNo": _digits(reference, 12),
+        "partnerReferenceNo": reference,
+        "qrContent": f"00020101021226MOCK{_digits(reference, 20)}5303360540{len(amount)}{amount}6304",
+        "qrUrl": f"https://sandbox-api.espay.id/qr/{reference}.png",
+        "qrImage": image,
+        "additionalInfo": {
+            "referenceNo": _digits(reference, 12),
+            "partnerReferenceNo": reference,
+            "merchantName": "MOCK MERCHANT",
+            "amount": amount,
+        },
+    }
+
+
+@app.post("/rest/digitalpay/pushtopay")
+async def push_to_pay(request: Request):
+    form = await _form_body(request)
+    await _simulate_latency()
+    if _fail():
+        return {"error_code": "0099", "error_message": "System error"}
+    order_id = form.get("order_id", "")
+    image = base64.b64encode(hashlib.sha256(order_id.encode()).digest() * (MOCK_QR_IMAGE_BYTES // 32)).decode()
+    return {
+        "rq_uuid": form.get("rq_uuid", ""),
+        "rs_datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "error_code": "0000",
+        "error_message": "",
+        "trx_id": "ESP" + _digits(order_id, 13),
+        "QRLink": f"https://sandbox-api.espay.id/qr/{order_id}",
+        "QRCode": image,
+    }
+
+
+@app.post("/rest/merchant/status")
+async def va_check_status(request: Request):
+    form = await _form_body(request)
+    await _simulate_latency()
+    order_id = form.get("order_id", "")
+    return {
+        "rq_uuid": form.get("rq_uuid", ""),
+        "rs_datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "error_code": "0000",
+        "error_message": "",
+        "comm_code": form.get("comm_code", ""),
+        "order_id": order_id,
+        "tx_status": "S" if _paid(order_id) else "IP",
+    }
+
+
+async def _snap_query(request: Request, service_code: str) -> dict:
+    body = await _json_body(request)
+    await _simulate_latency()
+    reference = body.get("originalPartnerReferenceNo", "")
+    paid = _paid(reference)
+    return {
+        "responseCode": f"200{service_code}00",
+        "responseMessage": "Successful",
+        "originalPartnerReferenceNo": reference,
+        "originalReferenceNo": _digits(reference, 12),
+        "serviceCode": service_code,
+        "latestTransactionStatus": "00" if paid else "03",
+        "transactionStatusDesc": "Success" if paid else "Pending",
+    }
+
+
+@app.post("/apimerchant/v1.0/debit/status")
+async def h2h_status(request: Request):
+    return await _snap_query(request, "55")
+
+
+@app.post("/api/v1.0/qr/qr-mpm-query")
+async def qr_mpm_query(request: Request):
+    return await _snap_query(request, "51")
@@ -0,0 +1,372 @@
+"""
+Antrian durable untuk pembuatan pembayaran secara asynchronous.
+
+Request yang dikirim dengan header X-Async-Mode disimpan ke SQLite (mode WAL)
+dan langsung dijawab 202 + tracking id. Worker pool menguras antrian dengan
+rate terkontrol; kegagalan sementara (timeout / 5xx / 429 dari Espay) di-retry
+dengan exponential backoff dan seluruh worker ikut menahan diri selama
+backoff, sehingga antrian baru terkuras setelah Espay pulih. Status bisa
+di-poll lewat GET /jobs/{id} atau dikirim ke X-Callback-Url saat final.
+
+Konfigurasi:
+  ESPAY_OUTBOX_DB            path file SQLite (default outbox.db)
+  ESPAY_OUTBOX_WORKERS       jumlah worker (default 4)
+  ESPAY_OUTBOX_RATE          maksimal request/detik ke Espay dari antrian (default 5)
+  ESPAY_OUTBOX_MAX_ATTEMPTS  batas percobaan sebelum job gagal (default 20)
+  ESPAY_CALLBACK_HOSTS       host yang boleh jadi tujuan X-Callback-Url, dipisah
+                             koma; "*.contoh.id" = semua subdomain. Kosong =
+                             callback dinonaktifkan. URL lain ditolak 400 saat
+                             enqueue (hasil job berisi URL pembayaran / nomor VA,
+                             jadi server tidak boleh POST ke alamat sembarang)
+"""
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import HTTPException
+
+from http_pool import get_client
+import clock
+
+OUTBOX_DB = os.getenv("ESPAY_OUTBOX_DB", "outbox.db")
+OUTBOX_WORKERS = int(os.getenv("ESPAY_OUTBOX_WORKERS", "4"))
+OUTBOX_RATE = float(os.getenv("ESPAY_OUTBOX_RATE", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("ESPAY_OUTBOX_MAX_ATTEMPTS", "20"))
+CALLBACK_HOSTS = frozenset(
+    h.strip().lower() for h in os.getenv("ESPAY_CALLBACK_HOSTS", "").split(",") if h.strip()
+)
+OUTBOX_POLL_INTERVAL = 0.5
+# job processing yang tidak bergerak selama ini dianggap milik proses yang mati
+STALE_AFTER = 120.0
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+
+ASYNC_MODE_HEADER = "X-Async-Mode"
+CALLBACK_URL_HEADER = "X-Callback-Url"
+
+QUEUED = "queued"
+PROCESSING = "processing"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# status HTTP dari handler yang dianggap gangguan sementara
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+def callback_allowed(url: str, hosts: frozenset = CALLBACK_HOSTS) -> bool:
+    """URL http(s) tanpa userinfo dengan host yang ada di allowlist"""
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        parts.port  # port tidak valid -> ValueError
+    except ValueError:
+        return False
+    if parts.scheme not in ("https", "http") or not host or "@" in parts.netloc:
+        return False
+    if host in hosts:
+        return True
+    return any(h.startswith("*.") and host.endswith(h[1:]) for h in hosts)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    callback_url TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, next_attempt_at);
+"""
+
+
+def is_async_mode(value: Optional[str]) -> bool:
+    return bool(value) and value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class JobStore:
+    """Akses SQLite (sync, dipanggil lewat asyncio.to_thread)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(_SCHEMA)
+
+    def insert(self, kind: str, payload: dict, callback_url: Optional[str]) -> str:
+        job_id = clock.new_id()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, next_attempt_at, callback_url, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), QUEUED, now, callback_url, now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim(self, limit: int) -> List[dict]:
+        """Ambil job siap jalan dan tandai processing dalam satu transaksi"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? AND next_attempt_at <= ? "
+                    "ORDER BY next_attempt_at LIMIT ?",
+                    (QUEUED, now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    [(PROCESSING, now, row["id"]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [dict(row, attempts=row["attempts"] + 1) for row in rows]
+
+    def finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def reschedule(self, job_id: str, delay: float, error: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                (QUEUED, error, now + delay, now, job_id),
+            )
+
+    def requeue_stale(self, older_than: float = STALE_AFTER) -> int:
+        """Job processing milik proses yang mati dikembalikan ke antrian"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (QUEUED, now, PROCESSING, now - older_than),
+            )
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RateLimiter:
+    """Token bucket sederhana untuk membatasi request/detik dari worker"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _backoff(attempts: int) -> float:
+    return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempts - 1)))
+
+
+class OutboundQueue:
+    """Antrian durable + worker pool untuk pembuatan pembayaran asynchronous"""
+
+    def __init__(
+        self,
+        path: str = OUTBOX_DB,
+        workers: int = OUTBOX_WORKERS,
+        rate: float = OUTBOX_RATE,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+    ):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._limiter = RateLimiter(rate)
+        self._handlers: Dict[str, JobHandler] = {}
+        self._store: Optional[JobStore] = None
+        self._tasks: List[asyncio.Task] = []
+        self._paused_until = 0.0
+
+    def register(self, kind: str, handler: JobHandler):
+        self._handlers[kind] = handler
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            self._store = JobStore(self.path)
+        return self._store
+
+    async def enqueue(self, kind: str, payload: dict, callback_url: Optional[str] = None) -> str:
+        if kind not in self._handlers:
+            raise ValueError(f"Job kind tidak dikenal: {kind}")
+        if callback_url and not callback_allowed(callback_url):
+            raise HTTPException(status_code=400, detail="X-Callback-Url tidak diizinkan (host di luar ESPAY_CALLBACK_HOSTS)")
+        return await asyncio.to_thread(self.store.insert, kind, payload, callback_url)
+
+    async def status(self, job_id: str) -> Optional[dict]:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None:
+            return None
+        return {
+            "id": job["id"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "attempts": job["attempts"],
+            "result": json.loads(job["result"]) if job["result"] else None,
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+        }
+
+    async def _process(self, job: dict):
+        handler = self._handlers.get(job["kind"])
+        if handler is None:
+            await asyncio.to_thread(self.store.finish, job["id"], FAILED, None, f"Job kind tidak dikenal: {job['kind']}")
+            return
+
+        await self._limiter.acquire()
+        try:
+            result = await handler(json.loads(job["payload"]))
+        except HTTPException as e:
+            retryable = e.status_code in RETRYABLE_STATUS
+            await self._failed(job, f"{e.status_code}: {e.detail}", retryable)
+            return
+        except Exception as e:
+            await self._failed(job, str(e), True)
+            return
+
+        await asyncio.to_thread(self.store.finish, job["id"], SUCCEEDED, result)
+        await self._notify(job, SUCCEEDED, result, None)
+
+    async def _failed(self, job: dict, error: str, retryable: bool):
+        if retryable and job["attempts"] < self.max_attempts:
+            delay = _backoff(job["attempts"])
+            # Espay kemungkinan sedang down: seluruh worker ikut menahan diri
+            self._paused_until = max(self._paused_until, time.monotonic() + min(delay, BACKOFF_BASE * 4))
+            await asyncio.to_thread(self.store.reschedule, job["id"], delay, error)
+            print(f"⚠️ Job {job['id']} gagal (attempt {job['attempts']}), retry dalam {delay:.0f}s: {error}")
+            return
+        await asyncio.to_thread(self.store.finish, job["id"], FAILED, None, error)
+        await self._notify(job, FAILED, None, error)
+
+    async def _notify(self, job: dict, status: str, result: Any, error: Optional[str]):
+        if not job.get("callback_url"):
+            return
+        if not callback_allowed(job["callback_url"]):
+            # job lama dari sebelum allowlist diperketat
+            print(f"⚠️ Callback job {job['id']} dilewati: host tidak diizinkan")
+            return
+        body = {"id": job["id"], "kind": job["kind"], "status": status, "result": result, "error": error}
+        for attempt in range(3):
+            try:
+                response = await get_client("callbacks", timeout=10.0).post(job["callback_url"], json=body)
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(2 ** attempt)
+        print(f"⚠️ Callback job {job['id']} ke {job['callback_url']} gagal")
+
+    async def _worker(self, queue: "asyncio.Queue[dict]"):
+        while True:
+            job = await queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                print(f"❌ Outbox worker error: {str(e)}")
+            finally:
+                queue.task_done()
+
+    async def _dispatcher(self, queue: "asyncio.Queue[dict]"):
+        next_stale_check = 0.0
+        while True:
+            if time.monotonic() >= next_stale_check:
+                next_stale_check = time.monotonic() + STALE_AFTER / 2
+                requeued = await asyncio.to_thread(self.store.requeue_stale)
+                if requeued:
+                    print(f"🔁 {requeued} job outbox dikembalikan ke antrian")
+            wait = self._paused_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            free = self.workers - queue.qsize()
+            jobs = []
+            if free > 0:
+                try:
+                    jobs = await asyncio.to_thread(self.store.claim, free)
+                except sqlite3.Error as e:
+                    print(f"❌ Outbox claim error: {str(e)}")
+            for job in jobs:
+                queue.put_nowait(job)
+            if not jobs:
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+            else:
+                await queue.join()
+
+    async def start(self):
+        if self._tasks:
+            return
+        queue: asyncio.Queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._dispatcher(queue)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+
+def install_outbox(app) -> OutboundQueue:
+    """Buat OutboundQueue, daftarkan lifecycle dan endpoint GET /jobs/{id}"""
+    outbox = OutboundQueue()
+    app.on_event("startup")(outbox.start)
+    app.on_event("shutdown")(outbox.stop)
+
+    @app.get("/jobs/{job_id}", tags=["Async Jobs"])
+    async def get_job_status(job_id: str):
+        """Status job pembuatan pembayaran asynchronous"""
+        job = await outbox.status(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job tidak ditemukan")
+        return {"status": "success", "data": job}
+
+    return outbox
@@ -0,0 +1,85 @@
+"""
+Benchmark CPU per request /simple-payment end-to-end lewat ASGI (routing,
+validasi, build body, signature, serialisasi response), tanpa network:
+client pool "espay" diganti httpx.MockTransport dengan response tetap.
+
+    python payment_bench.py --requests 3000
+    python payment_bench.py --requests 3000 --profile lean
+
+Output print handler diarahkan ke /dev/null supaya yang terukur adalah kerja
+handler, bukan terminal.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+from typing import List, Optional
+
+import httpx
+
+ESPAY_RESPONSE = {
+    "responseCode": "2005400",
+    "responseMessage": "Successful",
+    "approvalCode": "123456",
+    "webRedirectUrl": "https://sandbox-kit.espay.id/index/order/?url=bench",
+}
+
+REQUEST_BODY = {
+    "amount": "150000",
+    "customer_name": "Budi Santoso",
+    "customer_email": "budi@example.com",
+    "customer_phone": "081234567890",
+    "bank_code": "014",
+    "thank_you_url": "https://yoursite.com/thank-you",
+    "payment_type": "redirect",
+}
+
+
+async def _run(requests: int, warmup: int, profile: str) -> dict:
+    import http_pool
+    import main
+
+    payload = json.dumps(ESPAY_RESPONSE).encode()
+    http_pool._clients["espay"] = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(
+            200, content=payload, headers={"content-type": "application/json"},
+        )),
+    )
+    body = json.dumps(REQUEST_BODY).encode()
+    headers = {"content-type": "application/json", "X-Response-Profile": profile}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        async def call():
+            response = await client.post("/simple-payment", content=body, headers=headers)
+            if response.status_code != 200:
+                raise RuntimeError(f"{response.status_code}: {response.text}")
+
+        for _ in range(warmup):
+            await call()
+        cpu_started, wall_started = time.process_time(), time.perf_counter()
+        for _ in range(requests):
+            await call()
+        cpu = time.process_time() - cpu_started
+        wall = time.perf_counter() - wall_started
+    return {"cpu_us": cpu / requests * 1e6, "wall_us": wall / requests * 1e6}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark CPU per request /simple-payment")
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--warmup", type=int, default=300)
+    parser.add_argument("--profile", default="standard", choices=["lean", "standard", "debug"])
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("ESPAY_WARM_POOLS", "0")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = asyncio.run(_run(args.requests, args.warmup, args.profile))
+    print(f"/simple-payment ({args.profile}) x{args.requests}: "
+          f"CPU {result['cpu_us']:.0f} us/req, wall {result['wall_us']:.0f} us/req")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,47 @@
+import os
+from enum import Enum
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+RESPONSE_PROFILE_HEADER = "X-Response-Profile"
+
+
+class ResponseProfile(str, Enum):
+    LEAN = "lean"          # hanya field bertipe, tanpa payload mentah Espay
+    STANDARD = "standard"  # envelope biasa + response Espay
+    DEBUG = "debug"        # standard + echo request/headers untuk troubleshooting
+
+
+def _default_profile() -> ResponseProfile:
+    value = os.getenv("ESPAY_RESPONSE_PROFILE", ResponseProfile.STANDARD.value).lower()
+    try:
+        return ResponseProfile(value)
+    except ValueError:
+        return ResponseProfile.STANDARD
+
+
+DEFAULT_RESPONSE_PROFILE = _default_profile()
+
+
+def resolve_profile(value: Optional[str]) -> ResponseProfile:
+    """Pilih profile per request (header), fallback ke profile deployment"""
+    if not value:
+        return DEFAULT_RESPONSE_PROFILE
+    try:
+        return ResponseProfile(value.strip().lower())
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{RESPONSE_PROFILE_HEADER} tidak valid, gunakan: lean, standard, debug"
+        )
+
+
+def lean_response(model: BaseModel) -> Response:
+    """Serialisasi langsung lewat pydantic-core, tanpa validasi ulang response_model"""
+    return Response(
+        content=model.model_dump_json(exclude_none=True),
+        media_type="application/json"
+    )
@@ -0,0 +1,78 @@
+"""
+Readiness probe: GET /ready baru 200 setelah semua warm-up selesai.
+
+Warm-up berjalan sebagai task background saat startup sehingga proses sudah
+menerima koneksi (liveness /health) sementara key di-parse dan pool dibuka.
+Check `required` yang gagal membuat service tetap tidak ready (mis. PEM
+rusak); check opsional (mis. pre-connect ke Espay) hanya dicatat.
+"""
+import time
+import asyncio
+import inspect
+from typing import Callable, Dict, Optional
+
+from fastapi.responses import JSONResponse
+
+_PROCESS_STARTED = time.perf_counter()
+
+
+class Readiness:
+    def __init__(self):
+        self.ready = False
+        self.done = False
+        self.ready_after_ms: Optional[float] = None
+        self._checks: Dict[str, tuple] = {}
+        self.results: Dict[str, str] = {}
+
+    def add(self, name: str, check: Callable, required: bool = True):
+        """`check` boleh sync (dijalankan di thread) atau async; exception = gagal"""
+        self._checks[name] = (check, required)
+        self.results[name] = "pending"
+
+    async def _run(self, name: str, check: Callable, required: bool) -> bool:
+        try:
+            if inspect.iscoroutinefunction(check):
+                result = await check()
+            else:
+                result = await asyncio.to_thread(check)
+        except Exception as e:
+            self.results[name] = f"error: {str(e)}"
+            print(f"❌ Warm-up {name} gagal: {str(e)}")
+            return not required
+        if result is False:
+            self.results[name] = "degraded"
+            return not required
+        self.results[name] = "ok"
+        return True
+
+    async def warm(self):
+        outcomes = await asyncio.gather(*(
+            self._run(name, check, required) for name, (check, required) in self._checks.items()
+        ))
+        self.done = True
+        if all(outcomes):
+            self.ready = True
+            self.ready_after_ms = (time.perf_counter() - _PROCESS_STARTED) * 1000
+            print(f"✅ Ready {self.ready_after_ms:.0f}ms sejak import")
+
+
+def install_readiness(app) -> Readiness:
+    readiness = Readiness()
+    tasks = []
+
+    async def start_warmup():
+        tasks.append(asyncio.create_task(readiness.warm()))
+
+    app.on_event("startup")(start_warmup)
+
+    @app.get("/ready", tags=["Health"])
+    def ready():
+        """Readiness probe untuk load balancer / autoscaler"""
+        body = {
+            "status": "ready" if readiness.ready else ("failed" if readiness.done else "warming"),
+            "checks": readiness.results,
+            "ready_after_ms": readiness.ready_after_ms,
+        }
+        return JSONResponse(status_code=200 if readiness.ready else 503, content=body)
+
+    return readiness
@@ -0,0 +1,306 @@
+"""
+Rekonsiliasi file settlement Espay terhadap transaksi lokal.
+
+Transaksi lokal (VA / H2H / QRIS / pushtopay) diambil dari audit trail
+(lihat audit.py) dan dimasukkan ke hash index: setiap order_id,
+partnerReferenceNo dan referenceNo menunjuk ke slot di array amount/fee yang
+compact. File settlement dibaca baris per baris (memory konstan terhadap
+ukuran file) dan setiap mismatch langsung ditulis ke CSV output.
+
+CLI:
+    python reconcile.py run --settlement settlement.csv --audit-dir audit --out mismatches.csv
+    python reconcile.py bench --rows 5000000
+"""
+import os
+import csv
+import sys
+import time
+import random
+import argparse
+import tempfile
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+import audit
+from amounts import Money
+
+# Nama kolom default pada file settlement (bisa di-override lewat CLI)
+DEFAULT_ID_COLUMNS = ("order_id", "partnerReferenceNo", "referenceNo")
+DEFAULT_AMOUNT_COLUMN = "amount"
+DEFAULT_FEE_COLUMN = "fee"
+
+MISSING_LOCAL = "missing_local"            # ada di settlement, tidak ada transaksi lokal
+MISSING_SETTLEMENT = "missing_settlement"  # transaksi lokal tidak muncul di settlement
+AMOUNT_MISMATCH = "amount_mismatch"
+FEE_MISMATCH = "fee_mismatch"
+INVALID_ROW = "invalid_row"
+
+UNKNOWN = -1  # fee tidak diketahui (mis. QRIS tidak mengembalikan fee)
+
+
+def parse_minor(value: Optional[str]) -> int:
+    """Parse amount settlement ('10,000.00' / '10000.5' / '10000') menjadi minor units"""
+    if value is None:
+        raise ValueError("amount kosong")
+    value = value.strip()
+    if value.startswith("-"):
+        return -Money.parse(value[1:].replace(",", ""))
+    return Money.parse(value.replace(",", ""))
+
+
+def format_minor(minor: int) -> str:
+    if minor == UNKNOWN:
+        return ""
+    return str(Money(minor))
+
+
+def _is_success(record: dict) -> bool:
+    if record.get("error") or record.get("status_code") != 200:
+        return False
+    response = record.get("response")
+    if not isinstance(response, dict):
+        return False
+    if "error_code" in response:
+        return response.get("error_code") == "0000"
+    return str(response.get("responseCode", "")).startswith("200")
+
+
+class LocalIndex:
+    """Hash index id -> slot dengan amount/fee disimpan di array('q')"""
+
+    def __init__(self):
+        self.slots: Dict[str, int] = {}
+        self.order_ids: List[str] = []
+        self.amounts = array("q")
+        self.fees = array("q")
+        self.matched = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.order_ids)
+
+    def add(self, order_id: str, keys: Iterable[str], amount: int, fee: int = UNKNOWN):
+        slot = self.slots.get(order_id)
+        if slot is None:
+            slot = len(self.order_ids)
+            self.order_ids.append(order_id)
+            self.amounts.append(amount)
+            self.fees.append(fee)
+            self.matched.append(0)
+        else:
+            # retry/duplikat: record sukses terakhir yang dipakai
+            self.amounts[slot] = amount
+            self.fees[slot] = fee
+        self.slots[order_id] = slot
+        for key in keys:
+            if key:
+                self.slots[key] = slot
+
+    def lookup(self, keys: Iterable[str]) -> Optional[int]:
+        for key in keys:
+            if key:
+                slot = self.slots.get(key)
+                if slot is not None:
+                    return slot
+        return None
+
+    @classmethod
+    def from_audit(cls, directory: str, kinds: Optional[Iterable[str]] = None) -> "LocalIndex":
+        index = cls()
+        kinds = set(kinds) if kinds else None
+        for record in audit.scan(directory):
+            if kinds is not None and record.get("kind") not in kinds:
+                continue
+            if not record.get("order_id") or not _is_success(record):
+                continue
+            try:
+                amount = parse_minor(record.get("amount"))
+            except ValueError:
+                continue
+            try:
+                fee = parse_minor(record["fee"]) if record.get("fee") else UNKNOWN
+            except ValueError:
+                fee = UNKNOWN
+            index.add(record["order_id"], record.get("keys", ()), amount, fee)
+        return index
+
+
+def iter_settlement(
+    f: TextIO,
+    id_columns: Iterable[str] = DEFAULT_ID_COLUMNS,
+    amount_column: str = DEFAULT_AMOUNT_COLUMN,
+    fee_column: Optional[str] = DEFAULT_FEE_COLUMN,
+) -> Iterator[Tuple[int, List[str], Optional[str], Optional[str]]]:
+    """Stream baris settlement -> (nomor baris, ids, amount, fee)"""
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    position = {name.strip(): i for i, name in enumerate(header)}
+    id_positions = [position[c] for c in id_columns if c in position]
+    if not id_positions:
+        raise ValueError(f"Kolom id tidak ditemukan di header settlement: {list(id_columns)}")
+    if amount_column not in position:
+        raise ValueError(f"Kolom amount '{amount_column}' tidak ditemukan di header settlement")
+    amount_pos = position[amount_column]
+    fee_pos = position.get(fee_column) if fee_column else None
+
+    for line_no, row in enumerate(reader, start=2):
+        if not row:
+            continue
+        try:
+            ids = [row[i].strip() for i in id_positions]
+            amount = row[amount_pos]
+            fee = row[fee_pos] if fee_pos is not None else None
+        except IndexError:
+            yield line_no, [], None, None
+            continue
+        yield line_no, ids, amount, fee
+
+
+def reconcile(index: LocalIndex, rows: Iterable, out: TextIO) -> Dict[str, int]:
+    """Cocokkan settlement dengan index lokal, tulis mismatch ke `out` (CSV)"""
+    writer = csv.writer(out)
+    writer.writerow(["type", "line", "key", "local_amount", "settlement_amount", "local_fee", "settlement_fee"])
+    summary = {
+        "rows": 0, "matched": 0, MISSING_LOCAL: 0, MISSING_SETTLEMENT: 0,
+        AMOUNT_MISMATCH: 0, FEE_MISMATCH: 0, INVALID_ROW: 0,
+    }
+    amounts, fees, matched = index.amounts, index.fees, index.matched
+
+    for line_no, ids, amount, fee in rows:
+        summary["rows"] += 1
+        key = next((i for i in ids if i), "")
+        try:
+            settle_amount = parse_minor(amount)
+            settle_fee = parse_minor(fee) if fee not in (None, "") else UNKNOWN
+        except ValueError:
+            summary[INVALID_ROW] += 1
+            writer.writerow([INVALID_ROW, line_no, key, "", amount or "", "", fee or ""])
+            continue
+
+        slot = index.lookup(ids)
+        if slot is None:
+            summary[MISSING_LOCAL] += 1
+            writer.writerow([MISSING_LOCAL, line_no, key, "", format_minor(settle_amount), "", format_minor(settle_fee)])
+            continue
+
+        matched[slot] = 1
+        summary["matched"] += 1
+        local_amount, local_fee = amounts[slot], fees[slot]
+        if local_amount != settle_amount:
+            summary[AMOUNT_MISMATCH] += 1
+            writer.writerow([
+                AMOUNT_MISMATCH, line_no, index.order_ids[slot],
+                format_minor(local_amount), format_minor(settle_amount),
+                format_minor(local_fee), format_minor(settle_fee),
+            ])
+        elif local_fee != UNKNOWN and settle_fee != UNKNOWN and local_fee != settle_fee:
+            summary[FEE_MISMATCH] += 1
+            writer.writerow([
+                FEE_MISMATCH, line_no, index.order_ids[slot],
+                format_minor(local_amount), format_minor(settle_amount),
+                format_minor(local_fee), format_minor(settle_fee),
+            ])
+
+    for slot, seen in enumerate(matched):
+        if not seen:
+            summary[MISSING_SETTLEMENT] += 1
+            writer.writerow([
+                MISSING_SETTLEMENT, "", index.order_ids[slot],
+                format_minor(amounts[slot]), "", format_minor(fees[slot]), "",
+            ])
+    return summary
+
+
+# ========================
+# Benchmark
+# ========================
+def generate_settlement(path: str, rows: int, seed: int = 7) -> LocalIndex:
+    """
+    Tulis file settlement sintetis `rows` baris dan kembalikan index lokal
+    pasangannya (~1% amount beda, ~1% fee beda, ~0.5% tidak ada di lokal).
+    """
+    rng = random.Random(seed)
+    index = LocalIndex()
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["order_id", "referenceNo", "amount", "fee"])
+        for i in range(rows):
+            order_id = f"INV-{i:012d}"
+            amount = rng.randrange(1_000_00, 50_000_000_00, 100)
+            fee = amount * 25 // 1000
+            roll = rng.random()
+            if roll >= 0.005:
+                index.add(order_id, (), amount, fee)
+            if 0.005 <= roll < 0.015:
+                amount += 100
+            elif 0.015 <= roll < 0.025:
+                fee += 1
+            writer.writerow([order_id, f"REF{i}", format_minor(amount), format_minor(fee)])
+    return index
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench(rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        settlement = os.path.join(tmp, "settlement.csv")
+        started = time.perf_counter()
+        index = generate_settlement(settlement, rows)
+        generated = time.perf_counter() - started
+        size_mb = os.path.getsize(settlement) / 1024 / 1024
+        rss_before = _peak_rss_mb()
+
+        started = time.perf_counter()
+        with open(settlement, newline="") as f, open(os.path.join(tmp, "out.csv"), "w", newline="") as out:
+            summary = reconcile(index, iter_settlement(f), out)
+        elapsed = time.perf_counter() - started
+
+    print(f"rows            : {rows:,} ({size_mb:.1f} MB, generated in {generated:.1f}s)")
+    print(f"local index     : {len(index):,} transactions")
+    print(f"reconcile       : {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)")
+    print(f"peak RSS        : {_peak_rss_mb():.0f} MB (after index build: {rss_before:.0f} MB)")
+    print(f"summary         : {summary}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Rekonsiliasi settlement Espay")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = sub.add_parser("run", help="Rekonsiliasi file settlement terhadap audit trail")
+    run_cmd.add_argument("--settlement", required=True)
+    run_cmd.add_argument("--audit-dir", default=audit.AUDIT_DIR)
+    run_cmd.add_argument("--out", default="-", help="CSV mismatch (default stdout)")
+    run_cmd.add_argument("--kinds", help="Filter jenis transaksi, mis. va,h2h,qris")
+    run_cmd.add_argument("--id-columns", default=",".join(DEFAULT_ID_COLUMNS))
+    run_cmd.add_argument("--amount-column", default=DEFAULT_AMOUNT_COLUMN)
+    run_cmd.add_argument("--fee-column", default=DEFAULT_FEE_COLUMN)
+
+    bench_cmd = sub.add_parser("bench", help="Benchmark dengan file settlement sintetis")
+    bench_cmd.add_argument("--rows", type=int, default=5_000_000)
+
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        bench(args.rows)
+        return
+
+    index = LocalIndex.from_audit(args.audit_dir, args.kinds.split(",") if args.kinds else None)
+    out = sys.stdout if args.out == "-" else open(args.out, "w", newline="")
+    try:
+        with open(args.settlement, newline="") as f:
+            rows = iter_settlement(f, args.id_columns.split(","), args.amount_column, args.fee_column or None)
+            summary = reconcile(index, rows, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(summary, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Replay traffic hasil capture (capture.py) ke instance lokal.
+
+Timing asli bisa dipertahankan (--speed 1), dipercepat (--speed 10 = 10x
+lebih cepat) atau dikirim secepat mungkin (--speed 0, dibatasi --concurrency).
+Laporan berisi distribusi latency (p50/p90/p99) per endpoint. Dengan
+--compare setiap request juga dikirim ke build kedua dan response keduanya
+dibandingkan (status + body JSON), field volatile (timestamp, id acak,
+signature) diabaikan. Signature di capture sudah di-redact, jadi jalankan
+build yang di-replay dengan ESPAY_VERIFY_SIGNATURES=0 untuk endpoint notifikasi.
+
+Contoh (dua build dengan mock Espay):
+    uvicorn mock_espay:app --port 9000
+    ESPAY_BASE_URL=http://127.0.0.1:9000 uvicorn main:app --port 8000          # build lama
+    ESPAY_BASE_URL=http://127.0.0.1:9000 uvicorn main:app --port 8001          # build baru
+    python replay.py run capture.jsonl --app main --target http://127.0.0.1:8000 \\
+        --compare http://127.0.0.1:8001 --speed 5 --report replay-report.json
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from audit import REDACTED
+
+# Field yang nilainya berbeda di setiap eksekusi (case-insensitive). Perbarui
+# set ini setiap kali response mendapat field acak / id buatan server baru.
+VOLATILE_KEYS = frozenset({
+    "timestamp", "rs_datetime", "rq_datetime", "reconcile_datetime", "x-timestamp",
+    "tracking_id", "status_url", "trace_id", "rq_uuid", "x-external-id",
+    "signature", "x-signature", "validupto", "valid_up_to", "expired",
+    # id buatan server (clock.reference_id / new_id) dan nilai Espay yang diturunkan darinya
+    "order_id", "partnerreferenceno", "partner_reference_no", "reconcile_id", "job_id",
+    "va_number", "approvalcode", "approval_code", "webredirecturl", "redirect_url",
+    "referenceno", "reference_no",
+    # HMAC order id (status_stream.stream_token)
+    "stream_token", "x-stream-token",
+})
+
+
+def load_capture(path: str, app: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if app and entry.get("app") != app:
+                continue
+            entries.append(entry)
+    entries.sort(key=lambda e: e["ts"])
+    return entries[:limit] if limit else entries
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "p50": round(_percentile(ordered, 0.50), 2),
+        "p90": round(_percentile(ordered, 0.90), 2),
+        "p99": round(_percentile(ordered, 0.99), 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+def _normalize(value: Any, ignore: frozenset) -> Any:
+    if isinstance(value, dict):
+        return {k: _normalize(v, ignore) for k, v in value.items() if str(k).lower() not in ignore}
+    if isinstance(value, list):
+        return [_normalize(v, ignore) for v in value]
+    return value
+
+
+def diff(a: Any, b: Any, path: str = "$") -> Iterator[Tuple[str, Any, Any]]:
+    """Perbedaan dua dokumen JSON yang sudah dinormalisasi: (path, nilai_a, nilai_b)"""
+    if isinstance(a, dict) and isinstance(b, dict):
+        for key in sorted(set(a) | set(b), key=str):
+            yield from diff(a.get(key, "<missing>"), b.get(key, "<missing>"), f"{path}.{key}")
+    elif isinstance(a, list) and isinstance(b, list) and len(a) == len(b):
+        for i, (x, y) in enumerate(zip(a, b)):
+            yield from diff(x, y, f"{path}[{i}]")
+    elif a != b:
+        yield path, a, b
+
+
+def _comparable(response: Optional[httpx.Response], ignore: frozenset) -> Any:
+    if response is None:
+        return {"status": None}
+    try:
+        body = _normalize(response.json(), ignore)
+    except ValueError:
+        body = response.text
+    return {"status": response.status_code, "body": body}
+
+
+class Replayer:
+    def __init__(self, target: str, compare: Optional[str], speed: float, concurrency: int,
+                 timeout: float, ignore: frozenset, max_diffs: int):
+        self.targets = [target] + ([compare] if compare else [])
+        self.speed = speed
+        self.ignore = ignore
+        self.max_diffs = max_diffs
+        self.slots = asyncio.Semaphore(concurrency)
+        self.clients = [
+            httpx.AsyncClient(base_url=t, timeout=timeout,
+                              limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency))
+            for t in self.targets
+        ]
+        # latency[target][endpoint] -> ms
+        self.latency: List[Dict[str, List[float]]] = [{} for _ in self.targets]
+        self.status: List[Dict[str, int]] = [{} for _ in self.targets]
+        self.errors = [0 for _ in self.targets]
+        self.diffs: List[dict] = []
+        self.diff_count = 0
+        self.max_lag_ms = 0.0
+
+    async def _send(self, index: int, entry: dict) -> Optional[httpx.Response]:
+        headers = {k: v for k, v in entry.get("headers", {}).items() if v != REDACTED}
+        url = entry["path"] + (f"?{entry['query']}" if entry.get("query") else "")
+        endpoint = f"{entry['method']} {entry['path']}"
+        started = time.perf_counter()
+        try:
+            response = await self.clients[index].request(
+                entry["method"], url, headers=headers, content=entry.get("body", "").encode("utf-8"),
+            )
+        except httpx.HTTPError:
+            self.errors[index] += 1
+            return None
+        self.latency[index].setdefault(endpoint, []).append((time.perf_counter() - started) * 1000)
+        key = str(response.status_code)
+        self.status[index][key] = self.status[index].get(key, 0) + 1
+        return response
+
+    async def _replay_one(self, entry: dict, holding_slot: bool = False):
+        if not holding_slot:
+            await self.slots.acquire()
+        try:
+            responses = await asyncio.gather(*(self._send(i, entry) for i in range(len(self.targets))))
+        finally:
+            self.slots.release()
+        if len(responses) < 2:
+            return
+        a, b = (_comparable(r, self.ignore) for r in responses)
+        changes = list(diff(a, b))
+        if changes:
+            self.diff_count += 1
+            if len(self.diffs) < self.max_diffs:
+                self.diffs.append({
+                    "endpoint": f"{entry['method']} {entry['path']}",
+                    "ts": entry["ts"],
+                    "changes": [{"path": p, "a": x, "b": y} for p, x, y in changes[:20]],
+                })
+
+    async def run(self, entries: List[dict]) -> dict:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first_ts = entries[0]["ts"] if entries else 0.0
+        tasks = []
+        for entry in entries:
+            if self.speed > 0:
+                due = started + (entry["ts"] - first_ts) / self.speed
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.max_lag_ms = max(self.max_lag_ms, -delay * 1000)
+                tasks.append(asyncio.create_task(self._replay_one(entry)))
+            else:
+                # mode secepat mungkin: slot diambil di sini agar task tidak menumpuk di memory
+                await self.slots.acquire()
+                tasks.append(asyncio.create_task(self._replay_one(entry, holding_slot=True)))
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - started
+        for client in self.clients:
+            await client.aclose()
+        return self.report(len(entries), elapsed)
+
+    def report(self, count: int, elapsed: float) -> dict:
+        targets = []
+        for i, target in enumerate(self.targets):
+            all_latency = [ms for values in self.latency[i].values() for ms in values]
+            targets.append({
+                "target": target,
+                "errors": self.errors[i],
+                "status": self.status[i],
+                "overall": summarize(all_latency) if all_latency else None,
+                "endpoints": {ep: summarize(v) for ep, v in sorted(self.latency[i].items())},
+            })
+        report = {
+            "requests": count,
+            "elapsed_s": round(elapsed, 3),
+            "rate_rps": round(count / elapsed, 1) if elapsed else None,
+            "max_schedule_lag_ms": round(self.max_lag_ms, 1),
+            "targets": targets,
+        }
+        if len(self.targets) > 1:
+            report["diff_count"] = self.diff_count
+            report["diffs"] = self.diffs
+        return report
+
+
+def print_report(report: dict):
+    print(f"Requests: {report['requests']} dalam {report['elapsed_s']}s ({report['rate_rps']} req/s), "
+          f"lag jadwal maks {report['max_schedule_lag_ms']}ms")
+    for t in report["targets"]:
+        print(f"\n== {t['target']}  errors={t['errors']}  status={t['status']}")
+        if t["overall"]:
+            o = t["overall"]
+            print(f"   {'TOTAL':<40} n={o['count']:<7} p50={o['p50']:>8}ms p90={o['p90']:>8}ms p99={o['p99']:>8}ms")
+        for endpoint, s in t["endpoints"].items():
+            print(f"   {endpoint:<40} n={s['count']:<7} p50={s['p50']:>8}ms p90={s['p90']:>8}ms p99={s['p99']:>8}ms")
+    if "diff_count" in report:
+        print(f"\nResponse berbeda: {report['diff_count']}")
+        for d in report["diffs"]:
+            print(f" - {d['endpoint']} @ {d['ts']}")
+            for change in d["changes"]:
+                print(f"     {change['path']}: {change['a']!r} != {change['b']!r}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay traffic capture Espay")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_cmd = sub.add_parser("run", help="Replay capture ke target (dan build pembanding)")
+    run_cmd.add_argument("capture")
+    run_cmd.add_argument("--target", required=True, help="Base URL build yang diuji")
+    run_cmd.add_argument("--compare", help="Base URL build kedua untuk diff response")
+    run_cmd.add_argument("--app", help="Hanya replay record dari app ini (main/espay/pushtopay)")
+    run_cmd.add_argument("--speed", type=float, default=1.0, help="1 = timing asli, 10 = 10x, 0 = secepatnya")
+    run_cmd.add_argument("--concurrency", type=int, default=64)
+    run_cmd.add_argument("--timeout", type=float, default=60.0)
+    run_cmd.add_argument("--limit", type=int)
+    run_cmd.add_argument("--ignore", action="append", default=[], help="Field tambahan yang diabaikan saat diff")
+    run_cmd.add_argument("--max-diffs", type=int, default=20)
+    run_cmd.add_argument("--report", help="Simpan laporan lengkap sebagai JSON")
+    args = parser.parse_args(argv)
+
+    entries = load_capture(args.capture, args.app, args.limit)
+    if not entries:
+        print("Capture kosong")
+        return
+    replayer = Replayer(
+        args.target, args.compare, args.speed, args.concurrency, args.timeout,
+        VOLATILE_KEYS | {k.lower() for k in args.ignore}, args.max_diffs,
+    )
+    report = asyncio.run(replayer.run(entries))
+    print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
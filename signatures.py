@@ -0,0 +1,278 @@
+"""
+Verifikasi signature request yang datang dari Espay (notifikasi).
+
+Skema:
+  - VA / legacy:   sha256("##comm_code##order_id##amount##key##")
+  - Pushtopay:     sha256(UPPER("##rq_uuid##comm_code##product_code##order_id##amount##PUSHTOPAY##key##"))
+  - Payment report (notifikasi VA legacy):
+                   sha256(UPPER("##key##rq_datetime##order_id##PAYMENTREPORT##"))
+  - SNAP:          RSA-SHA256 (PKCS#1 v1.5) atas
+                   "METHOD:path:sha256_hex(minified body):X-TIMESTAMP",
+                   diverifikasi dengan public key Espay (ESPAY_PUBLIC_KEY_PEM)
+                   yang di-load sekali per proses.
+
+Semua perbandingan hash memakai hmac.compare_digest. ReplayCache menolak
+X-EXTERNAL-ID / rq_uuid yang sudah pernah dipakai dalam jendela TTL. Payment
+report hanya menandatangani rq_datetime dan order_id, jadi rq_datetime wajib
+segar (rq_datetime_fresh, jendela sama dengan X-TIMESTAMP SNAP).
+
+Benchmark:
+    python signatures.py bench
+"""
+import os
+import sys
+import json
+import hmac
+import time
+import base64
+import hashlib
+import argparse
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Union
+
+import clock
+
+VERIFY_SIGNATURES = os.getenv("ESPAY_VERIFY_SIGNATURES", "1") == "1"
+ESPAY_PUBLIC_KEY_PEM = os.getenv("ESPAY_PUBLIC_KEY_PEM", "").encode()
+# Batas selisih X-TIMESTAMP SNAP dengan jam server; TTL replay cache harus >= ini
+MAX_TIMESTAMP_SKEW = int(os.getenv("ESPAY_SIGNATURE_MAX_SKEW", "300"))
+REPLAY_TTL = int(os.getenv("ESPAY_REPLAY_TTL", "900"))
+REPLAY_CACHE_SIZE = int(os.getenv("ESPAY_REPLAY_CACHE_SIZE", "200000"))
+
+
+def _sha256_hex(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_signature(*parts, uppercase: bool = False) -> str:
+    """sha256 hex dari "##a##b##...##" (opsional di-uppercase sebelum hash)"""
+    plain = "##" + "##".join(str(p) for p in parts) + "##"
+    return _sha256_hex(plain.upper() if uppercase else plain)
+
+
+def digest_equals(expected: str, received: Optional[str]) -> bool:
+    """Perbandingan hex digest constant-time, case-insensitive"""
+    if not received:
+        return False
+    try:
+        return hmac.compare_digest(expected.encode("ascii"), received.strip().lower().encode("ascii"))
+    except UnicodeEncodeError:
+        return False
+
+
+def verify_va(comm_code: str, order_id: str, amount: str, key: str, signature: Optional[str]) -> bool:
+    return digest_equals(hash_signature(comm_code, order_id, amount, key), signature)
+
+
+def verify_pushtopay(rq_uuid: str, comm_code: str, product_code: str, order_id: str,
+                     amount: Union[int, str], key: str, signature: Optional[str]) -> bool:
+    expected = hash_signature(rq_uuid, comm_code, product_code, order_id, amount, "PUSHTOPAY", key, uppercase=True)
+    return digest_equals(expected, signature)
+
+
+def verify_payment_report(rq_datetime: str, order_id: str, key: str, signature: Optional[str]) -> bool:
+    expected = hash_signature(key, rq_datetime, order_id, "PAYMENTREPORT", uppercase=True)
+    return digest_equals(expected, signature)
+
+
+# ========================
+# SNAP (asimetris)
+# ========================
+def minify_body(body: Union[bytes, str]) -> str:
+    """Body JSON diminify ulang (urutan key tetap) sebelum di-hash, sesuai spesifikasi SNAP"""
+    if not body:
+        return ""
+    return json.dumps(json.loads(body), separators=(",", ":"), ensure_ascii=False)
+
+
+def snap_string_to_sign(method: str, path: str, body: Union[bytes, str], timestamp: str) -> str:
+    body_hash = _sha256_hex(minify_body(body))
+    return f"{method.upper()}:{path}:{body_hash}:{timestamp}"
+
+
+def timestamp_fresh(timestamp: str, max_skew: int = MAX_TIMESTAMP_SKEW) -> bool:
+    try:
+        sent = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return False
+    if sent.tzinfo is None:
+        return False
+    return abs(time.time() - sent.timestamp()) <= max_skew
+
+
+def rq_datetime_fresh(rq_datetime: str, max_skew: int = MAX_TIMESTAMP_SKEW) -> bool:
+    """rq_datetime legacy ('YYYY-MM-DD HH:MM:SS', waktu Jakarta) dalam jendela skew"""
+    try:
+        sent = datetime.strptime(rq_datetime, clock.SQL_FORMAT).replace(tzinfo=clock.JKT)
+    except (TypeError, ValueError):
+        return False
+    return abs(time.time() - sent.timestamp()) <= max_skew
+
+
+class SnapVerifier:
+    """Verifikasi X-SIGNATURE SNAP; public key di-parse sekali lalu disimpan"""
+
+    def __init__(self, public_key_pem: bytes = ESPAY_PUBLIC_KEY_PEM):
+        self._pem = public_key_pem
+        self._key = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self._pem)
+
+    def public_key(self):
+        if self._key is None:
+            # import di sini agar modul ini tidak memaksa load cryptography saat startup
+            from cryptography.hazmat.primitives import serialization
+            self._key = serialization.load_pem_public_key(self._pem)
+        return self._key
+
+    def verify(self, method: str, path: str, body: Union[bytes, str], timestamp: str,
+               signature: Optional[str]) -> bool:
+        if not signature or not timestamp:
+            return False
+        try:
+            raw_signature = base64.b64decode(signature, validate=True)
+            message = snap_string_to_sign(method, path, body, timestamp).encode("utf-8")
+        except ValueError:
+            return False
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+        try:
+            self.public_key().verify(raw_signature, message, padding.PKCS1v15(), hashes.SHA256())
+        except InvalidSignature:
+            return False
+        return True
+
+
+# ========================
+# Replay cache
+# ========================
+class ReplayCache:
+    """
+    ID request yang sudah terlihat beserta waktu kedaluwarsanya. TTL sama untuk
+    semua entry, sehingga urutan insert = urutan expiry dan eviction cukup
+    memotong dari depan OrderedDict.
+    """
+
+    def __init__(self, ttl: float = REPLAY_TTL, max_size: int = REPLAY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+
+    def _evict_expired(self, now: float):
+        entries = self._entries
+        while entries:
+            oldest = next(iter(entries))
+            if entries[oldest] > now:
+                break
+            del entries[oldest]
+
+    def seen(self, key: str, now: Optional[float] = None) -> bool:
+        """True jika `key` sudah pernah dicatat dalam TTL; jika belum, catat sekarang"""
+        now = time.monotonic() if now is None else now
+        self._evict_expired(now)
+        if key in self._entries:
+            return True
+        if len(self._entries) >= self.max_size:
+            self._entries.popitem(last=False)
+        self._entries[key] = now + self.ttl
+        return False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def snap_request_error(verifier: SnapVerifier, replay: ReplayCache, method: str, path: str,
+                       body: bytes, headers, service_code: str):
+    """
+    Validasi request SNAP masuk (timestamp, signature, X-EXTERNAL-ID unik).
+    Return JSONResponse penolakan sesuai kode SNAP, atau None jika valid.
+    """
+    from fastapi import HTTPException
+    from fastapi.responses import JSONResponse
+
+    if not VERIFY_SIGNATURES:
+        return None
+    if not verifier.configured:
+        raise HTTPException(status_code=500, detail="ESPAY_PUBLIC_KEY_PEM tidak di-set")
+
+    timestamp = headers.get("x-timestamp", "")
+    if not timestamp_fresh(timestamp) or not verifier.verify(
+        method, path, body, timestamp, headers.get("x-signature"),
+    ):
+        return JSONResponse(status_code=401, content={
+            "responseCode": f"401{service_code}00",
+            "responseMessage": "Unauthorized. Invalid Signature",
+        })
+    # hanya dicatat setelah signature valid, supaya request palsu tidak mengisi cache
+    external_id = headers.get("x-external-id", "")
+    if external_id and replay.seen(f"{headers.get('x-partner-id', '')}:{external_id}"):
+        return JSONResponse(status_code=409, content={
+            "responseCode": f"409{service_code}00",
+            "responseMessage": "Conflict",
+        })
+    return None
+
+
+# ========================
+# Benchmark
+# ========================
+def _rate(fn, count: int) -> float:
+    started = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return count / (time.perf_counter() - started)
+
+
+def bench(count: int):
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+    key = "wp48y4qm9ur61495"
+    va_sig = hash_signature("SGWCOMM", "INV-1", "150000.00", key)
+    push_sig = hash_signature("RQ1", "SGWCOMM", "QRIS", "INV-1", 150000, "PUSHTOPAY", key, uppercase=True)
+    report_sig = hash_signature(key, "2025-09-05 10:00:00", "INV-1", "PAYMENTREPORT", uppercase=True)
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    body = json.dumps({
+        "originalPartnerReferenceNo": "INV-1", "latestTransactionStatus": "00",
+        "amount": {"value": "150000.00", "currency": "IDR"},
+    }).encode()
+    timestamp = "2025-09-05T10:00:00+07:00"
+    message = snap_string_to_sign("POST", "/v1.0/debit/notify", body, timestamp).encode()
+    snap_sig = base64.b64encode(private_key.sign(message, padding.PKCS1v15(), hashes.SHA256())).decode()
+    verifier = SnapVerifier(pem)
+    assert verifier.verify("POST", "/v1.0/debit/notify", body, timestamp, snap_sig)
+
+    snap_count = max(count // 20, 100)
+    cache = ReplayCache(ttl=60, max_size=count)
+    results = [
+        ("verify_va", _rate(lambda i: verify_va("SGWCOMM", "INV-1", "150000.00", key, va_sig), count)),
+        ("verify_pushtopay", _rate(lambda i: verify_pushtopay("RQ1", "SGWCOMM", "QRIS", "INV-1", 150000, key, push_sig), count)),
+        ("verify_payment_report", _rate(lambda i: verify_payment_report("2025-09-05 10:00:00", "INV-1", key, report_sig), count)),
+        ("SNAP RSA-2048 verify", _rate(lambda i: verifier.verify("POST", "/v1.0/debit/notify", body, timestamp, snap_sig), snap_count)),
+        ("ReplayCache.seen (baru)", _rate(lambda i: cache.seen(str(i)), count)),
+        ("ReplayCache.seen (duplikat)", _rate(lambda i: cache.seen(str(i)), count)),
+    ]
+    for name, rate in results:
+        print(f"{name:<30} {rate:>12,.0f} /s")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Verifikasi signature Espay")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench_cmd = sub.add_parser("bench", help="Throughput verifikasi per detik")
+    bench_cmd.add_argument("--count", type=int, default=200_000)
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        bench(args.count)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
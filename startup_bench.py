@@ -0,0 +1,131 @@
+"""
+Benchmark cold start: waktu import, waktu sampai port menerima koneksi, dan
+waktu sampai request pertama yang sukses (default GET /ready = key dan pool
+sudah di-warm).
+
+    python startup_bench.py --app espay:app --runs 5
+    python startup_bench.py --app main:app --path /health --budget-ms 1500
+
+--budget-ms membuat exit code 1 jika median time-to-first-success melebihi
+budget, sehingga bisa dipasang di CI.
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+from typing import List, Optional, Tuple
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def import_profile(module: str, top: int) -> Tuple[float, List[Tuple[int, str]]]:
+    """Total waktu import modul dan import top-level termahal (dari -X importtime)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    children: List[Tuple[int, str]] = []
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if depth == 0:
+            # baris top-level menutup daftar child sebelumnya
+            if name.strip() == module:
+                total = int(cumulative) / 1000
+                break
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative), name.strip()))
+    heavy = sorted(children, reverse=True)[:top]
+    return total, heavy
+
+
+def measure_once(app: str, path: str, timeout: float) -> Tuple[Optional[float], Optional[float]]:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    listening = None
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        listening = listening or (time.perf_counter() - started) * 1000
+                        return listening, (time.perf_counter() - started) * 1000
+            except urllib.error.HTTPError:
+                # server sudah menjawab (mis. 503 warming) tapi belum sukses
+                listening = listening or (time.perf_counter() - started) * 1000
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            time.sleep(0.005)
+        return listening, None
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def _stats(values: List[float]) -> str:
+    return f"median={statistics.median(values):.0f}ms min={min(values):.0f}ms max={max(values):.0f}ms"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark startup / time-to-first-successful-request")
+    parser.add_argument("--app", default="espay:app")
+    parser.add_argument("--path", default="/ready")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--top", type=int, default=8, help="Jumlah import termahal yang ditampilkan")
+    parser.add_argument("--budget-ms", type=float)
+    args = parser.parse_args(argv)
+
+    module = args.app.split(":")[0]
+    total, heavy = import_profile(module, args.top)
+    print(f"Import {module}: {total:.0f}ms")
+    for cumulative, name in heavy:
+        print(f"   {cumulative / 1000:>7.1f}ms  {name}")
+
+    listening, first_success = [], []
+    for _ in range(args.runs):
+        listen_ms, success_ms = measure_once(args.app, args.path, args.timeout)
+        if listen_ms is not None:
+            listening.append(listen_ms)
+        if success_ms is None:
+            print(f"❌ {args.path} tidak sukses dalam {args.timeout}s")
+            return 1
+        first_success.append(success_ms)
+
+    print(f"\n{args.app} x{args.runs}")
+    print(f"   listening              {_stats(listening)}")
+    print(f"   first 200 {args.path:<12} {_stats(first_success)}")
+
+    if args.budget_ms is not None and statistics.median(first_success) > args.budget_ms:
+        print(f"❌ Melebihi budget {args.budget_ms:.0f}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,272 @@
+"""
+Server-sent events status transaksi: GET /transactions/{transaction_id}/events.
+
+Halaman checkout membuka satu koneksi SSE per transaksi alih-alih polling.
+Handler memanggil `broker.publish(order_id, "paid", ...)` saat notifikasi atau
+hasil inquiry masuk; event di-encode sekali lalu di-fan-out ke semua
+subscriber transaksi itu.
+
+  - buffer per koneksi dibatasi (ESPAY_STREAM_BUFFER); klien lambat kehilangan
+    event terlama, bukan membuat memori tumbuh (yang penting status terakhir)
+  - status terakhir per transaksi disimpan (LRU, ESPAY_STREAM_HISTORY) dan
+    langsung dikirim ke subscriber baru, jadi tidak ada race antara
+    pembuatan transaksi dan halaman yang baru subscribe
+  - heartbeat komentar SSE tiap ESPAY_STREAM_HEARTBEAT detik menjaga koneksi
+    melewati proxy; koneksi tanpa event selama ESPAY_STREAM_IDLE_TIMEOUT
+    ditutup dengan event "timeout" (EventSource akan reconnect bila perlu)
+  - status final (paid, failed, canceled, expired, refunded) menutup stream
+  - transaksi dikunci per merchant ("<merchant_id>:<order_id>"): order id
+    (partnerReferenceNo) dipilih klien, jadi merchant lain dengan order id
+    yang sama punya stream, status dan token yang terpisah
+  - subscribe wajib membawa ?token=<stream_token(merchant_id, order_id)>:
+    HMAC yang dikembalikan saat transaksi dibuat, jadi order id yang ditebak
+    tidak cukup untuk mengintip transaksi orang lain; ?merchant_id= (default
+    merchant utama) memilih namespace. Secret dari ESPAY_STREAM_SECRET, wajib
+    sama di semua worker: tanpa itu app menolak start jika WEB_CONCURRENCY > 1,
+    dan untuk satu worker secret acak per proses dipakai dengan peringatan.
+    Payload event hanya berisi status, amount dan waktu - bukan nomor VA
+    atau URL pembayaran.
+
+Pub/sub ini per proses: dengan beberapa worker, notifikasi Espay dan koneksi
+SSE harus mendarat di worker yang sama (sticky routing per order id) atau
+halaman akan menerima status lewat reconnect + status terakhir.
+"""
+import os
+import hmac
+import json
+import base64
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from fastapi import HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+import clock
+
+STREAM_BUFFER = int(os.getenv("ESPAY_STREAM_BUFFER", "16"))
+STREAM_HISTORY = int(os.getenv("ESPAY_STREAM_HISTORY", "100000"))
+STREAM_HEARTBEAT = float(os.getenv("ESPAY_STREAM_HEARTBEAT", "15"))
+STREAM_IDLE_TIMEOUT = float(os.getenv("ESPAY_STREAM_IDLE_TIMEOUT", "300"))
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("ESPAY_STREAM_MAX_SUBSCRIBERS", "10000"))
+STREAM_MAX_PER_TRANSACTION = int(os.getenv("ESPAY_STREAM_MAX_PER_TRANSACTION", "32"))
+STREAM_SECRET_CONFIGURED = bool(os.getenv("ESPAY_STREAM_SECRET"))
+STREAM_SECRET = os.getenv("ESPAY_STREAM_SECRET", "").encode() or os.urandom(32)
+# response yang body-nya diteruskan apa adanya (/qris/generate) membawa token di header ini
+STREAM_TOKEN_HEADER = "X-Stream-Token"
+
+PENDING = "pending"
+PAID = "paid"
+FAILED = "failed"
+CANCELED = "canceled"
+EXPIRED = "expired"
+REFUNDED = "refunded"
+FINAL_STATUSES = frozenset({PAID, FAILED, CANCELED, EXPIRED, REFUNDED})
+
+# latestTransactionStatus SNAP -> status stream
+_SNAP_STATUSES = {"00": PAID, "04": REFUNDED, "05": CANCELED, "06": FAILED}
+
+RETRY_PREAMBLE = b"retry: 3000\n\n"
+HEARTBEAT = b": ping\n\n"
+
+
+def stream_key(merchant_id: Optional[str], transaction_id: str) -> str:
+    """Key broker / input HMAC: order id di-namespace per merchant"""
+    return f"{merchant_id or ''}:{transaction_id}"
+
+
+def stream_token(merchant_id: Optional[str], transaction_id: str) -> str:
+    """Token subscribe SSE untuk satu transaksi merchant (HMAC-SHA256, 128 bit, base64url)"""
+    key = stream_key(merchant_id, transaction_id)
+    digest = hmac.new(STREAM_SECRET, key.encode("utf-8"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:16]).rstrip(b"=").decode("ascii")
+
+
+def verify_stream_token(merchant_id: Optional[str], transaction_id: str, token: Optional[str]) -> bool:
+    return bool(token) and hmac.compare_digest(stream_token(merchant_id, transaction_id), token)
+
+
+def snap_status(code: Optional[str]) -> str:
+    """Status stream untuk latestTransactionStatus SNAP (01/02/03/07 = masih pending)"""
+    return _SNAP_STATUSES.get(code or "", PENDING)
+
+
+class Subscription:
+    __slots__ = ("queue", "dropped")
+
+    def __init__(self, size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self.dropped = 0
+
+    def offer(self, event: Tuple[int, bytes, bool]):
+        if self.queue.full():
+            # klien lambat: buang event terlama, event terbaru selalu masuk
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class StatusBroker:
+    def __init__(
+        self,
+        buffer_size: int = STREAM_BUFFER,
+        history_size: int = STREAM_HISTORY,
+        max_subscribers: int = STREAM_MAX_SUBSCRIBERS,
+        max_per_transaction: int = STREAM_MAX_PER_TRANSACTION,
+    ):
+        self.buffer_size = buffer_size
+        self.history_size = history_size
+        self.max_subscribers = max_subscribers
+        self.max_per_transaction = max_per_transaction
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        # event terakhir per transaksi: (seq, bytes SSE, final)
+        self._last: "OrderedDict[str, Tuple[int, bytes, bool]]" = OrderedDict()
+        self._seq = 0
+        self._open = 0
+        self.counters = {"published": 0, "delivered": 0, "dropped": 0, "rejected": 0, "timeouts": 0}
+
+    def publish(self, merchant_id: Optional[str], transaction_id: str, status: str, **fields) -> int:
+        """Simpan status terakhir dan kirim ke subscriber; return jumlah subscriber"""
+        if not transaction_id:
+            return 0
+        key = stream_key(merchant_id, transaction_id)
+        self._seq += 1
+        data = {"transaction_id": transaction_id, "status": status, "at": clock.iso_timestamp()}
+        data.update((k, v) for k, v in fields.items() if v is not None)
+        chunk = (
+            f"id: {self._seq}\nevent: status\n"
+            f"data: {json.dumps(data, separators=(',', ':'), ensure_ascii=False)}\n\n"
+        ).encode("utf-8")
+        event = (self._seq, chunk, status in FINAL_STATUSES)
+
+        last = self._last
+        last[key] = event
+        last.move_to_end(key)
+        if len(last) > self.history_size:
+            last.popitem(last=False)
+
+        self.counters["published"] += 1
+        subscribers = self._subscribers.get(key)
+        if not subscribers:
+            return 0
+        for subscription in subscribers:
+            dropped = subscription.dropped
+            subscription.offer(event)
+            self.counters["dropped"] += subscription.dropped - dropped
+        self.counters["delivered"] += len(subscribers)
+        return len(subscribers)
+
+    def is_final(self, merchant_id: Optional[str], transaction_id: str) -> bool:
+        """True jika status terakhir yang tercatat (proses ini) sudah final"""
+        last = self._last.get(stream_key(merchant_id, transaction_id))
+        return last is not None and last[2]
+
+    def admit(self, key: str):
+        """HTTP 503 jika batas koneksi global / per transaksi sudah tercapai"""
+        subscribers = self._subscribers.get(key)
+        if self._open >= self.max_subscribers or (
+            subscribers is not None and len(subscribers) >= self.max_per_transaction
+        ):
+            self.counters["rejected"] += 1
+            raise HTTPException(status_code=503, detail="Terlalu banyak koneksi stream, gunakan polling")
+
+    def subscribe(self, key: str) -> Subscription:
+        subscribers = self._subscribers.get(key)
+        if subscribers is None:
+            subscribers = self._subscribers[key] = set()
+        subscription = Subscription(self.buffer_size)
+        subscribers.add(subscription)
+        self._open += 1
+        return subscription
+
+    def unsubscribe(self, key: str, subscription: Subscription):
+        subscribers = self._subscribers.get(key)
+        if subscribers is None or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        self._open -= 1
+        if not subscribers:
+            del self._subscribers[key]
+
+    async def events(self, key: str, heartbeat: float = STREAM_HEARTBEAT,
+                     idle_timeout: float = STREAM_IDLE_TIMEOUT) -> AsyncIterator[bytes]:
+        """Byte SSE untuk satu koneksi; subscription dilepas saat stream selesai/putus"""
+        loop = asyncio.get_running_loop()
+        # subscribe di dalam generator: jika response tidak pernah mulai, tidak ada yang bocor
+        subscription = self.subscribe(key)
+        try:
+            yield RETRY_PREAMBLE
+            sent_seq = 0
+            last = self._last.get(key)
+            if last is not None:
+                sent_seq, chunk, final = last
+                yield chunk
+                if final:
+                    return
+            idle_deadline = loop.time() + idle_timeout
+            while True:
+                remaining = idle_deadline - loop.time()
+                if remaining <= 0:
+                    self.counters["timeouts"] += 1
+                    yield b"event: timeout\ndata: {}\n\n"
+                    return
+                try:
+                    seq, chunk, final = await asyncio.wait_for(
+                        subscription.queue.get(), min(heartbeat, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+                    continue
+                if seq <= sent_seq:
+                    # sudah terkirim sebagai status terakhir saat subscribe
+                    continue
+                sent_seq = seq
+                yield chunk
+                if final:
+                    return
+                idle_deadline = loop.time() + idle_timeout
+        finally:
+            self.unsubscribe(key, subscription)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "open_streams": self._open,
+            "transactions_watched": len(self._subscribers),
+            "statuses_cached": len(self._last),
+        }
+
+
+def install_status_stream(app, default_merchant_id: Optional[str] = None) -> StatusBroker:
+    """Daftarkan GET /transactions/{transaction_id}/events dan GET /streams/stats"""
+    if not STREAM_SECRET_CONFIGURED:
+        workers = int(os.getenv("WEB_CONCURRENCY", "1") or 1)
+        if workers > 1:
+            raise RuntimeError(
+                f"ESPAY_STREAM_SECRET wajib di-set untuk {workers} worker (token stream harus valid di semua worker)"
+            )
+        print("⚠️ ESPAY_STREAM_SECRET tidak di-set: token stream hanya berlaku di proses ini")
+    broker = StatusBroker()
+
+    @app.get("/transactions/{transaction_id}/events", tags=["Status"])
+    async def transaction_events(transaction_id: str, token: Optional[str] = Query(None),
+                                 merchant_id: Optional[str] = Query(None)):
+        """Stream status transaksi (text/event-stream) sampai status final; `token` dari response pembuatan"""
+        merchant_id = merchant_id or default_merchant_id
+        if not verify_stream_token(merchant_id, transaction_id, token):
+            raise HTTPException(status_code=403, detail="Token stream tidak valid")
+        key = stream_key(merchant_id, transaction_id)
+        broker.admit(key)
+        return StreamingResponse(
+            broker.events(key),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/streams/stats", tags=["Status"])
+    def stream_stats():
+        """Jumlah koneksi SSE terbuka, event terkirim dan event yang dibuang"""
+        return {"status": "success", "data": broker.stats()}
+
+    return broker
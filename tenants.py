@@ -0,0 +1,221 @@
+"""
+Registry merchant (multi-tenant): satu proses melayani banyak merchant.
+
+Header X-Merchant-Id memilih credential, signing key dan rate limit merchant
+dari registry yang di-load sekali saat startup (ESPAY_TENANTS_FILE). Tanpa
+header, request memakai merchant default app (konfigurasi lama), jadi
+deployment satu merchant tetap berjalan tanpa perubahan.
+
+Setiap merchant memakai connection pool sendiri di http_pool
+("espay:<merchant_id>"; merchant default tetap "espay") sehingga merchant yang
+sibuk tidak menghabiskan koneksi merchant lain. Jumlah pool terbuka
+(ESPAY_POOL_MAX_CLIENTS) dan signer hasil parse (mis. private key RSA,
+ESPAY_TENANT_SIGNER_CACHE) dibatasi LRU: ratusan merchant terdaftar tidak
+berarti ratusan pool dan key selalu di memori.
+
+Format file (field yang tidak dipakai app boleh dihilangkan):
+    [
+      {"merchant_id": "SGWTOKOA", "name": "Toko A", "partner_id": "SGWTOKOA",
+       "api_key": "...", "signature_key": "...", "username": "...", "password": "...",
+       "private_key_file": "/run/secrets/toko-a.pem", "rate_limit": 20, "burst": 40}
+    ]
+
+rate_limit = request/detik per merchant untuk endpoint pembuatan transaksi
+(0 = tanpa batas, default ESPAY_TENANT_RATE_LIMIT); kelebihan dijawab 429
+dengan Retry-After.
+"""
+import os
+import json
+import math
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Union
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+import http_pool
+
+MERCHANT_ID_HEADER = "X-Merchant-Id"
+TENANTS_FILE = os.getenv("ESPAY_TENANTS_FILE", "")
+TENANT_RATE_LIMIT = float(os.getenv("ESPAY_TENANT_RATE_LIMIT", "0"))
+SIGNER_CACHE_SIZE = int(os.getenv("ESPAY_TENANT_SIGNER_CACHE", "128"))
+
+
+class Tenant:
+    __slots__ = (
+        "merchant_id", "name", "partner_id", "api_key", "signature_key", "username",
+        "password", "private_key_pem", "rate_limit", "burst", "pool_name",
+    )
+
+    def __init__(
+        self,
+        merchant_id: str,
+        name: str = "",
+        partner_id: Optional[str] = None,
+        api_key: str = "",
+        signature_key: str = "",
+        username: str = "",
+        password: str = "",
+        private_key_pem: Union[bytes, str] = b"",
+        private_key_file: str = "",
+        rate_limit: float = TENANT_RATE_LIMIT,
+        burst: Optional[float] = None,
+        pool_name: Optional[str] = None,
+    ):
+        if not merchant_id:
+            raise ValueError("merchant_id wajib diisi")
+        if private_key_file and not private_key_pem:
+            with open(private_key_file, "rb") as f:
+                private_key_pem = f.read()
+        self.merchant_id = merchant_id
+        self.name = name or merchant_id
+        self.partner_id = partner_id or merchant_id
+        self.api_key = api_key
+        self.signature_key = signature_key
+        self.username = username
+        self.password = password
+        self.private_key_pem = private_key_pem.encode() if isinstance(private_key_pem, str) else private_key_pem
+        self.rate_limit = float(rate_limit or 0)
+        self.burst = float(burst) if burst is not None else max(self.rate_limit, 1.0)
+        self.pool_name = pool_name or f"espay:{merchant_id}"
+
+
+class TokenBucket:
+    """Token bucket non-blocking: request yang tidak kebagian token langsung ditolak"""
+
+    __slots__ = ("rate", "capacity", "_tokens", "_updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def take(self, now: Optional[float] = None) -> float:
+        """0 jika token tersedia (dan dipakai), selain itu detik sampai token berikutnya"""
+        now = time.monotonic() if now is None else now
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class LRUCache:
+    """Cache berukuran tetap; entry paling lama tidak dipakai dibuang lebih dulu"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+
+    def get_or_create(self, key, factory: Callable[[], object]):
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+            return entries[key]
+        # factory yang gagal (mis. PEM rusak) tidak meninggalkan entry
+        value = factory()
+        entries[key] = value
+        if len(entries) > self.max_size:
+            entries.popitem(last=False)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TenantRegistry:
+    def __init__(self, default: Tenant, tenants: Iterable[Tenant] = (), signer_cache_size: int = SIGNER_CACHE_SIZE):
+        self.default = default
+        self._tenants: Dict[str, Tenant] = {default.merchant_id: default}
+        for tenant in tenants:
+            if tenant.merchant_id == default.merchant_id:
+                # merchant default di file menimpa konfigurasi env, pool tetap "espay"
+                tenant.pool_name = default.pool_name
+                self.default = tenant
+            self._tenants[tenant.merchant_id] = tenant
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.signers = LRUCache(signer_cache_size)
+        self.throttled: Counter = Counter()
+
+    @classmethod
+    def load(cls, default: Tenant, path: str = TENANTS_FILE) -> "TenantRegistry":
+        if not path:
+            return cls(default)
+        with open(path) as f:
+            raw = json.load(f)
+        tenants = []
+        for entry in raw:
+            try:
+                tenants.append(Tenant(**entry))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Tenant tidak valid di {path}: {entry.get('merchant_id')!r}: {e}")
+        registry = cls(default, tenants)
+        print(f"🏪 {len(registry)} merchant dimuat dari {path}")
+        return registry
+
+    def get(self, merchant_id: Optional[str]) -> Optional[Tenant]:
+        """Merchant untuk nilai header; None/kosong = merchant default, tidak terdaftar = None"""
+        if not merchant_id:
+            return self.default
+        return self._tenants.get(merchant_id.strip())
+
+    def resolve(self, merchant_id: Optional[str]) -> Tenant:
+        tenant = self.get(merchant_id)
+        if tenant is None:
+            raise HTTPException(status_code=403, detail=f"Merchant tidak terdaftar: {merchant_id}")
+        return tenant
+
+    def throttle(self, tenant: Tenant) -> float:
+        """0 jika request boleh lanjut, selain itu detik yang disarankan untuk Retry-After"""
+        if tenant.rate_limit <= 0:
+            return 0.0
+        bucket = self._buckets.get(tenant.merchant_id)
+        if bucket is None:
+            bucket = self._buckets[tenant.merchant_id] = TokenBucket(tenant.rate_limit, tenant.burst)
+        wait = bucket.take()
+        if wait:
+            self.throttled[tenant.merchant_id] += 1
+        return wait
+
+    def signer(self, tenant: Tenant, factory: Callable[[Tenant], object]):
+        """Objek signer merchant (mis. private key hasil parse) dari cache LRU"""
+        return self.signers.get_or_create(tenant.merchant_id, lambda: factory(tenant))
+
+    def stats(self) -> dict:
+        return {
+            "tenants": len(self._tenants),
+            "default": self.default.merchant_id,
+            "open_pools": len(http_pool.open_pools()),
+            "cached_signers": len(self.signers),
+            "throttled": dict(self.throttled),
+        }
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+
+def install_tenants(app, registry: TenantRegistry, limited_paths: Iterable[str] = ()):
+    """Rate limit per merchant untuk `limited_paths` dan GET /tenants/stats"""
+    limited = frozenset(limited_paths)
+
+    @app.middleware("http")
+    async def throttle_tenants(request, call_next):
+        if request.url.path in limited:
+            # merchant tidak terdaftar dibiarkan lewat, handler yang menolak (403)
+            tenant = registry.get(request.headers.get(MERCHANT_ID_HEADER))
+            wait = registry.throttle(tenant) if tenant is not None else 0.0
+            if wait:
+                return JSONResponse(
+                    status_code=429,
+                    content={"detail": f"Rate limit merchant {tenant.merchant_id} terlampaui"},
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+        return await call_next(request)
+
+    @app.get("/tenants/stats", tags=["Health"])
+    def tenant_stats():
+        """Jumlah merchant, pool terbuka, signer di cache dan request yang di-throttle"""
+        return {"status": "success", "data": registry.stats()}
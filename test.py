@@ -1,16 +1,25 @@
 # main.py
 import os
-import uuid
 import hashlib
 import base64
-from datetime import datetime
-import zoneinfo
+from functools import partial
 from typing import Optional, Literal, Dict, Any
 
 import httpx
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from pydantic import BaseModel, Field
 
+from profiles import RESPONSE_PROFILE_HEADER, ResponseProfile, resolve_profile, lean_response
+from audit import install_audit
+from tracing import install_tracing, span
+from http_pool import install_pools, pooled_client, warm
+from readiness import install_readiness
+from capture import install_capture
+from admission import install_admission
+from tenants import MERCHANT_ID_HEADER, Tenant, TenantRegistry, install_tenants
+from espay_responses import PushToPayResponse
+import clock
+
 # ========================
 # Konfigurasi (default: production creds kamu)
 # ========================
@@ -18,8 +27,18 @@ ESPAY_USERNAME = os.getenv("ESPAY_USERNAME", "TIEBYMIN")             # Login/Mer
 ESPAY_PASSWORD = os.getenv("ESPAY_PASSWORD", "HSQANGFD")             # Password
 ESPAY_COMM_CODE = os.getenv("ESPAY_COMM_CODE", "SGWTIEBYMIN")        # Merchant/Comm code
 ESPAY_SECRET_KEY = os.getenv("ESPAY_SECRET_KEY", "tqqj5107obb6ydga") # Signature key
-ESPAY_URL = "https://api.espay.id/rest/digitalpay/pushtopay"         # PRODUCTION
-JKT_TZ = zoneinfo.ZoneInfo("Asia/Jakarta")
+ESPAY_BASE_URL = os.getenv("ESPAY_BASE_URL", "https://api.espay.id")  # PRODUCTION
+ESPAY_URL = f"{ESPAY_BASE_URL}/rest/digitalpay/pushtopay"
+ESPAY_TIMEOUT = httpx.Timeout(30.0, read=60.0, write=30.0)
+
+# Merchant lain dari ESPAY_TENANTS_FILE (header X-Merchant-Id), default dari env di atas
+tenants = TenantRegistry.load(Tenant(
+    ESPAY_COMM_CODE,
+    username=ESPAY_USERNAME,
+    password=ESPAY_PASSWORD,
+    signature_key=ESPAY_SECRET_KEY,
+    pool_name="espay",
+))
 
 # ========================
 # Schemas
@@ -44,11 +63,16 @@ class QRDebugResponse(BaseModel):
     espay_raw: Optional[Dict[str, Any]] = None  # payload asli dari Espay untuk debugging
 
 
+class QRResponse(BaseModel):
+    qr_code: Optional[str] = None
+    qr_link: Optional[str] = None
+
+
 # ========================
 # Utils
 # ========================
 def now_str_jkt() -> str:
-    return datetime.now(JKT_TZ).strftime("%Y-%m-%d %H:%M:%S")
+    return clock.sql_datetime()
 
 
 def basic_auth_header(username: str, password: str) -> str:
@@ -70,32 +94,49 @@ def make_signature(rq_uuid: str, comm_code: str, product_code: str, order_id: st
 # FastAPI App
 # ========================
 app = FastAPI(title="Espay QR (Production) with Debug", version="1.0")
+audit = install_audit(app, "pushtopay")
+install_tracing(app, "pushtopay")
+install_pools(app)
+install_capture(app, "pushtopay")
+install_tenants(app, tenants, ["/qr"])
+# Paling luar: request yang ditolak saat overload tidak menyentuh middleware lain
+admission = install_admission(app, critical=["/qr"], debug=["/debug/profile"])
+readiness = install_readiness(app)
+readiness.add("pool:espay", partial(warm, "espay", ESPAY_BASE_URL, ESPAY_TIMEOUT), required=False)
 
 @app.get("/")
 def health():
     return {"status": "ok", "mode": "production", "endpoint": ESPAY_URL}
 
 @app.post("/qr", response_model=QRDebugResponse)
-async def get_qr(req: QRRequest):
+async def get_qr(
+    req: QRRequest,
+    response_profile: Optional[str] = Header(None, alias=RESPONSE_PROFILE_HEADER),
+    merchant_id: Optional[str] = Header(None, alias=MERCHANT_ID_HEADER),
+):
+    profile = resolve_profile(response_profile)
+    tenant = tenants.resolve(merchant_id)
+
     # Pastikan konfigurasi terisi
-    if not (ESPAY_USERNAME and ESPAY_PASSWORD and ESPAY_COMM_CODE and ESPAY_SECRET_KEY):
-        raise HTTPException(status_code=500, detail="Konfigurasi ESPAY_* belum lengkap")
+    if not (tenant.username and tenant.password and tenant.signature_key):
+        raise HTTPException(status_code=500, detail=f"Konfigurasi merchant {tenant.merchant_id} belum lengkap")
 
-    rq_uuid = uuid.uuid4().hex.upper()
+    rq_uuid = clock.new_id().upper()
     payload = {
         "rq_uuid": rq_uuid,
         "rq_datetime": now_str_jkt(),
-        "comm_code": ESPAY_COMM_CODE,
+        "comm_code": tenant.merchant_id,
         "product_code": req.product_code,
         "order_id": req.order_id,
         "amount": str(req.amount),
-        "key": ESPAY_SECRET_KEY,  # contoh dokumen menyertakan 'key' di body
+        "key": tenant.signature_key,  # contoh dokumen menyertakan 'key' di body
         "description": req.description,
         "customer_id": req.customer_id,
-        "signature": make_signature(
-            rq_uuid, ESPAY_COMM_CODE, req.product_code, req.order_id, req.amount, ESPAY_SECRET_KEY
-        ),
     }
+    with span("sign"):
+        payload["signature"] = make_signature(
+            rq_uuid, tenant.merchant_id, req.product_code, req.order_id, req.amount, tenant.signature_key
+        )
 
     # Optional fields
     if req.promo_code:
@@ -109,30 +150,38 @@ async def get_qr(req: QRRequest):
     headers = {
         "Accept": "*/*",
         "Content-Type": "application/x-www-form-urlencoded",
-        "Authorization": basic_auth_header(ESPAY_USERNAME, ESPAY_PASSWORD),
+        "Authorization": basic_auth_header(tenant.username, tenant.password),
     }
 
-    timeout = httpx.Timeout(connect=30.0, read=60.0, write=30.0)
-    async with httpx.AsyncClient(timeout=timeout) as client:
+    async with pooled_client(tenant.pool_name, timeout=ESPAY_TIMEOUT) as client:
         try:
-            resp = await client.post(ESPAY_URL, data=payload, headers=headers)
+            with span("espay_call", url=ESPAY_URL):
+                resp = await client.post(ESPAY_URL, data=payload, headers=headers)
         except httpx.RequestError as e:
+            audit.record("pushtopay", req.order_id, payload, amount=str(req.amount), error=str(e))
             raise HTTPException(status_code=502, detail=f"Gagal menghubungi Espay: {e}") from e
 
+    audit.record("pushtopay", req.order_id, payload, resp.status_code, resp.content, amount=str(req.amount))
+
     if resp.status_code == 401:
         raise HTTPException(status_code=401, detail="Unauthorized dari Espay (Basic Auth salah)")
     if resp.status_code >= 500:
         raise HTTPException(status_code=502, detail=f"Espay error {resp.status_code}: {resp.text}")
 
-    try:
-        data = resp.json()
-    except Exception:
-        # fallback jika bukan JSON
-        raise HTTPException(status_code=502, detail=f"Unexpected Espay response: {resp.text}")
+    with span("parse_response"):
+        try:
+            result = PushToPayResponse.parse(resp.content)
+        except ValueError:
+            # fallback jika bukan JSON
+            raise HTTPException(status_code=502, detail=f"Unexpected Espay response: {resp.text}")
+
+    # QR kalau ada (biasanya QRIS); QRCode baru di-decode di sini
+    qr_code = result.qr_code
+    qr_link = result.qr_link
 
-    # Ambil QR kalau ada (biasanya QRIS)
-    qr_code = data.get("QRCode")
-    qr_link = data.get("QRLink")
+    # Profile lean: cukup QR saja, tanpa payload asli Espay
+    if profile is ResponseProfile.LEAN:
+        return lean_response(QRResponse(qr_code=qr_code, qr_link=qr_link))
 
     # Kembalikan QR + payload asli untuk debug (kalau channel non-QR, QR kemungkinan None)
-    return QRDebugResponse(qr_code=qr_code, qr_link=qr_link, espay_raw=data)
+    return QRDebugResponse(qr_code=qr_code, qr_link=qr_link, espay_raw=result.to_dict())
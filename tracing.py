@@ -0,0 +1,266 @@
+"""
+Trace span per request, slow-request log dan sampling profiler.
+
+Setiap request HTTP mendapat satu trace (lewat middleware). Handler membungkus
+setiap tahap dengan `with span("sign"):` dsb. Dua span sintetis ditambahkan
+otomatis:
+  - "validate": dari request masuk sampai span pertama handler dibuka
+    (baca body + validasi Pydantic oleh FastAPI)
+  - "serialize": dari span terakhir selesai sampai response keluar middleware
+
+Konfigurasi:
+  ESPAY_TRACE_EXPORT       "file:traces.ndjson" atau "otlp:http://collector:4318/v1/traces" (kosong = off)
+  ESPAY_TRACE_SAMPLE_RATE  porsi trace yang diekspor (default 1.0)
+  ESPAY_SLOW_REQUEST_MS    request di atas ambang ini dicatat breakdown-nya (default 1000)
+  ESPAY_PROFILER_ENABLED   "1" untuk mengaktifkan GET /debug/profile
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import PlainTextResponse
+
+TRACE_EXPORT = os.getenv("ESPAY_TRACE_EXPORT", "")
+TRACE_SAMPLE_RATE = float(os.getenv("ESPAY_TRACE_SAMPLE_RATE", "1.0"))
+SLOW_REQUEST_MS = float(os.getenv("ESPAY_SLOW_REQUEST_MS", "1000"))
+PROFILER_ENABLED = os.getenv("ESPAY_PROFILER_ENABLED", "0") == "1"
+PROFILER_MAX_SECONDS = 60
+EXPORT_QUEUE_SIZE = 10000
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("espay_trace", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class Span:
+    __slots__ = ("name", "span_id", "start_ns", "end_ns", "attributes")
+
+    def __init__(self, name: str, start_ns: int, attributes: Optional[dict] = None):
+        self.name = name
+        self.span_id = _new_id(8)
+        self.start_ns = start_ns
+        self.end_ns = start_ns
+        self.attributes = attributes or {}
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class Trace:
+    """Satu request: root span + span per tahap (flat, parent = root)"""
+
+    __slots__ = ("trace_id", "root", "spans", "handler_started", "_wall_offset_ns")
+
+    def __init__(self, name: str, attributes: Optional[dict] = None):
+        self.trace_id = _new_id(16)
+        self.root = Span(name, time.perf_counter_ns(), attributes)
+        self.spans: List[Span] = []
+        self.handler_started = False
+        # konversi perf_counter -> unix nano untuk export
+        self._wall_offset_ns = time.time_ns() - self.root.start_ns
+
+    def finish(self, status_code: int):
+        now = time.perf_counter_ns()
+        if self.spans:
+            serialize = Span("serialize", max(s.end_ns for s in self.spans))
+            serialize.end_ns = now
+            self.spans.append(serialize)
+        self.root.end_ns = now
+        self.root.attributes["http.status_code"] = status_code
+
+    def breakdown(self) -> Dict[str, float]:
+        stages: Dict[str, float] = {}
+        for s in self.spans:
+            stages[s.name] = stages.get(s.name, 0.0) + s.duration_ms
+        return stages
+
+    def to_otlp(self, service: str) -> List[dict]:
+        def encode(s: Span, parent: Optional[str]) -> dict:
+            return {
+                "traceId": self.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": parent,
+                "name": s.name,
+                "service": service,
+                "startTimeUnixNano": s.start_ns + self._wall_offset_ns,
+                "endTimeUnixNano": s.end_ns + self._wall_offset_ns,
+                "attributes": s.attributes,
+            }
+        return [encode(self.root, None)] + [encode(s, self.root.span_id) for s in self.spans]
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Ukur satu tahap handler; no-op murah jika tidak ada trace aktif"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    start = time.perf_counter_ns()
+    if not trace.handler_started:
+        trace.handler_started = True
+        validate = Span("validate", trace.root.start_ns)
+        validate.end_ns = start
+        trace.spans.append(validate)
+    current = Span(name, start, attributes)
+    try:
+        yield current
+    finally:
+        current.end_ns = time.perf_counter_ns()
+        trace.spans.append(current)
+
+
+# ========================
+# Exporter
+# ========================
+class TraceExporter:
+    """Antrian span -> file NDJSON atau endpoint OTLP/HTTP (JSON), di-flush per batch"""
+
+    def __init__(self, target: str, service: str):
+        self.service = service
+        self.kind, _, self.location = target.partition(":")
+        if self.kind not in ("file", "otlp") or not self.location:
+            raise ValueError(f"ESPAY_TRACE_EXPORT tidak valid: {target!r}")
+        self.dropped = 0
+        self._queue: List[Trace] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def submit(self, trace: Trace):
+        if len(self._queue) >= EXPORT_QUEUE_SIZE:
+            self.dropped += 1
+            return
+        self._queue.append(trace)
+
+    def _write_file(self, spans: List[dict]):
+        with open(self.location, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(s, separators=(",", ":")) + "\n" for s in spans))
+
+    async def _post_otlp(self, spans: List[dict]):
+        import httpx
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            await client.post(self.location, json={"resourceSpans": [{"service": self.service, "spans": spans}]})
+
+    async def flush(self):
+        if not self._queue:
+            return
+        traces, self._queue = self._queue, []
+        spans = [s for t in traces for s in t.to_otlp(self.service)]
+        try:
+            if self.kind == "file":
+                await asyncio.to_thread(self._write_file, spans)
+            else:
+                await self._post_otlp(spans)
+        except Exception as e:
+            print(f"❌ Trace export error: {str(e)}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(1.0)
+            await self.flush()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+# ========================
+# Sampling profiler
+# ========================
+class SamplingProfiler:
+    """Sample stack semua thread secara periodik, hasil dalam format folded (flame graph)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def capture(self, seconds: float, interval: float) -> Counter:
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Profiler sedang berjalan")
+        try:
+            stacks: Counter = Counter()
+            own = threading.get_ident()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own:
+                        continue
+                    names = []
+                    while frame is not None:
+                        code = frame.f_code
+                        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stacks[";".join(reversed(names))] += 1
+                time.sleep(interval)
+            return stacks
+        finally:
+            self._lock.release()
+
+
+profiler = SamplingProfiler()
+
+
+def _log_slow(method: str, path: str, trace: Trace):
+    total = (trace.root.end_ns - trace.root.start_ns) / 1e6
+    stages = " ".join(f"{name}={ms:.1f}ms" for name, ms in trace.breakdown().items())
+    print(f"🐢 Slow request {method} {path} {total:.1f}ms [{trace.trace_id}] {stages}")
+
+
+def install_tracing(app, service: str):
+    """Pasang middleware trace, exporter (jika dikonfigurasi) dan endpoint profiler"""
+    exporter = TraceExporter(TRACE_EXPORT, service) if TRACE_EXPORT else None
+    if exporter is not None:
+        app.on_event("startup")(exporter.start)
+        app.on_event("shutdown")(exporter.stop)
+
+    @app.middleware("http")
+    async def trace_requests(request, call_next):
+        trace = Trace(f"{request.method} {request.url.path}", {"http.method": request.method})
+        token = _current_trace.set(trace)
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            _current_trace.reset(token)
+            trace.finish(status_code)
+            if trace.root.duration_ms >= SLOW_REQUEST_MS:
+                _log_slow(request.method, request.url.path, trace)
+            if exporter is not None and random.random() < TRACE_SAMPLE_RATE:
+                exporter.submit(trace)
+
+    @app.get("/debug/profile", tags=["Testing"], include_in_schema=PROFILER_ENABLED)
+    async def capture_profile(seconds: float = 10.0, interval_ms: float = 5.0):
+        """
+        Sampling profiler worker ini selama N detik. Output format folded stack,
+        bisa langsung dibuka di speedscope atau flamegraph.pl.
+        """
+        if not PROFILER_ENABLED:
+            raise HTTPException(status_code=404, detail="Not Found")
+        seconds = min(max(seconds, 0.1), PROFILER_MAX_SECONDS)
+        interval = max(interval_ms, 1.0) / 1000
+        try:
+            stacks = await asyncio.to_thread(profiler.capture, seconds, interval)
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        folded = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+        return PlainTextResponse(folded + "\n")
+
+    return exporter
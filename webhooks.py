@@ -0,0 +1,221 @@
+"""
+Fan-out event pembayaran (VA paid, QRIS paid, H2H completed, *.expired) ke service internal.
+
+`publish()` tidak pernah menunggu I/O: event hanya dimasukkan ke antrian
+bounded milik setiap subscriber, sehingga subscriber yang lambat tidak
+memblokir callback dari Espay. Per subscriber:
+  - batcher mengumpulkan event sampai batch_size atau batch_interval
+  - maksimal max_concurrency batch dikirim bersamaan (pooled client); selama
+    semua slot terpakai batcher berhenti mengambil event (backpressure ke
+    antrian, bukan ke callback)
+  - antrian penuh -> event di-drop dan dihitung di stats
+  - gagal (network / 5xx / 429) di-retry dengan exponential backoff + jitter
+
+Config ESPAY_WEBHOOK_CONFIG menunjuk ke file JSON:
+    [{"name": "orders", "url": "http://orders.internal/espay-events",
+      "events": ["va.paid", "qris.paid"], "batch_size": 50, "batch_interval": 0.5,
+      "max_concurrency": 4, "queue_size": 10000, "max_attempts": 8,
+      "headers": {"Authorization": "Bearer ..."}}]
+"""
+import os
+import json
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from http_pool import get_client
+import clock
+
+WEBHOOK_CONFIG_PATH = os.getenv("ESPAY_WEBHOOK_CONFIG", "")
+WEBHOOK_TIMEOUT = float(os.getenv("ESPAY_WEBHOOK_TIMEOUT", "10"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 60.0
+LATENCY_WINDOW = 1000
+
+VA_PAID = "va.paid"
+QRIS_PAID = "qris.paid"
+H2H_COMPLETED = "h2h.completed"
+# dikirim scheduler expiry jika inquiry akhir tidak menemukan pembayaran
+VA_EXPIRED = "va.expired"
+QRIS_EXPIRED = "qris.expired"
+H2H_EXPIRED = "h2h.expired"
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class Subscriber:
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        events: Optional[List[str]] = None,
+        batch_size: int = 50,
+        batch_interval: float = 0.5,
+        max_concurrency: int = 4,
+        queue_size: int = 10000,
+        max_attempts: int = 8,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        self.name = name
+        self.url = url
+        self.events = set(events or ["*"])
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_attempts = max_attempts
+        self.headers = headers or {}
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.stats = {"enqueued": 0, "delivered": 0, "dropped": 0, "failed": 0, "retries": 0}
+        # latency end-to-end (event terjadi -> diterima subscriber) dan per HTTP request
+        self.delivery_latency: deque = deque(maxlen=LATENCY_WINDOW)
+        self.request_latency: deque = deque(maxlen=LATENCY_WINDOW)
+
+    def wants(self, event_type: str) -> bool:
+        return "*" in self.events or event_type in self.events
+
+    def offer(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+            self.stats["enqueued"] += 1
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+
+    def snapshot(self) -> dict:
+        delivery = list(self.delivery_latency)
+        request = list(self.request_latency)
+        return {
+            "url": self.url,
+            "queued": self.queue.qsize(),
+            **self.stats,
+            "delivery_latency_ms": {
+                "p50": _percentile(delivery, 0.50),
+                "p95": _percentile(delivery, 0.95),
+                "p99": _percentile(delivery, 0.99),
+            },
+            "request_latency_ms": {
+                "p50": _percentile(request, 0.50),
+                "p99": _percentile(request, 0.99),
+            },
+        }
+
+
+class WebhookDispatcher:
+    def __init__(self, subscribers: Optional[List[Subscriber]] = None):
+        self.subscribers = subscribers or []
+        self._tasks: List[asyncio.Task] = []
+        self._deliveries: set = set()
+
+    @classmethod
+    def load(cls, path: str = WEBHOOK_CONFIG_PATH) -> "WebhookDispatcher":
+        if not path:
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            return cls([Subscriber(**raw) for raw in json.load(f)])
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> Optional[str]:
+        """Antrikan event ke semua subscriber yang cocok (non-blocking)"""
+        if not self.subscribers:
+            return None
+        event = {
+            "id": clock.new_id(),
+            "type": event_type,
+            "occurred_at": time.time(),
+            "data": data,
+        }
+        for subscriber in self.subscribers:
+            if subscriber.wants(event_type):
+                subscriber.offer(event)
+        return event["id"]
+
+    async def _next_batch(self, subscriber: Subscriber) -> List[dict]:
+        batch = [await subscriber.queue.get()]
+        deadline = time.monotonic() + subscriber.batch_interval
+        while len(batch) < subscriber.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(subscriber.queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batcher(self, subscriber: Subscriber):
+        while True:
+            # tunggu slot kosong dulu: selama subscriber lambat, event menumpuk di antrian
+            await subscriber.slots.acquire()
+            try:
+                batch = await self._next_batch(subscriber)
+            except BaseException:
+                subscriber.slots.release()
+                raise
+            task = asyncio.create_task(self._deliver(subscriber, batch))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, subscriber: Subscriber, batch: List[dict]):
+        client = get_client("webhooks", timeout=WEBHOOK_TIMEOUT)
+        body = {"events": batch}
+        try:
+            for attempt in range(1, subscriber.max_attempts + 1):
+                started = time.monotonic()
+                try:
+                    response = await client.post(subscriber.url, json=body, headers=subscriber.headers)
+                    status = response.status_code
+                except Exception as e:
+                    status, error = None, str(e)
+                else:
+                    error = f"HTTP {status}"
+                subscriber.request_latency.append((time.monotonic() - started) * 1000)
+
+                if status is not None and status < 300:
+                    now = time.time()
+                    subscriber.stats["delivered"] += len(batch)
+                    subscriber.delivery_latency.extend((now - e["occurred_at"]) * 1000 for e in batch)
+                    return
+                if status is not None and 400 <= status < 500 and status != 429:
+                    break  # ditolak permanen oleh subscriber
+                if attempt < subscriber.max_attempts:
+                    subscriber.stats["retries"] += 1
+                    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+            subscriber.stats["failed"] += len(batch)
+            print(f"⚠️ Webhook {subscriber.name} gagal mengirim {len(batch)} event: {error}")
+        finally:
+            subscriber.slots.release()
+
+    def stats(self) -> Dict[str, dict]:
+        return {s.name: s.snapshot() for s in self.subscribers}
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._batcher(s)) for s in self.subscribers]
+
+    async def stop(self):
+        for task in self._tasks + list(self._deliveries):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._deliveries, return_exceptions=True)
+        self._tasks = []
+
+
+def install_webhooks(app) -> WebhookDispatcher:
+    """Buat dispatcher dari config, daftarkan lifecycle dan GET /webhooks/stats"""
+    dispatcher = WebhookDispatcher.load()
+    app.on_event("startup")(dispatcher.start)
+    app.on_event("shutdown")(dispatcher.stop)
+
+    @app.get("/webhooks/stats", tags=["Webhooks"])
+    def webhook_stats():
+        """Statistik antrian, retry dan latency pengiriman per subscriber"""
+        return {"status": "success", "data": dispatcher.stats()}
+
+    return dispatcher